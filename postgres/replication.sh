@@ -0,0 +1,4 @@
+#!/bin/bash
+# Let the replica stream WAL from the primary (wal_level=replica is the default on 15)
+set -e
+echo "host replication $POSTGRES_USER all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,4 @@
+"""
+Offline load-testing tools: a fake Telegram Bot API, an update stream generator
+and a replay runner. See `manage.py replay_bench`.
+"""
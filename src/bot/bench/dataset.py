@@ -0,0 +1,377 @@
+"""
+Synthetic production-shaped data: users with subscription history, cards, orders,
+transactions, course subscriptions and channel memberships.
+
+Rows are generated in chunks of users and written with COPY (or bulk_create), one
+transaction per chunk. Seeded users occupy a telegram_id range starting at
+`start_id`, at or above SYNTHETIC_ID_FLOOR, so they can be removed again without
+touching real users.
+"""
+import csv
+import io
+import json
+import random
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.utils.constants import CONSTANTS
+from order.models import Course, Order, PrivateChannel, RenewalWorkItem, Transaction, UserCourseSubscription, \
+    UserJoinChannel
+from users.models import User, UserCard
+
+# Telegram user IDs have at most 52 significant bits, so no real account is at or above this
+SYNTHETIC_ID_FLOOR = 2 ** 52
+SEED_USER_ID_START = SYNTHETIC_ID_FLOOR
+
+# Children first, so deleting a seeded range never trips a foreign key
+SEEDED_TABLES = (
+    (UserCourseSubscription, 'user_id'),
+    (UserJoinChannel, 'user_id'),
+    (RenewalWorkItem, 'user_id'),
+    (Transaction, 'user_id'),
+    (Order, 'user_id'),
+    (UserCard, 'user_id'),
+    (User, 'telegram_id'),
+)
+
+
+def parse_weights(value: str) -> dict[str, float]:
+    """'uz=0.8,ru=0.2' -> {'uz': 0.8, 'ru': 0.2}"""
+    weights = {}
+    for part in value.split(','):
+        key, _, weight = part.partition('=')
+        weights[key.strip()] = float(weight or 1)
+    return weights
+
+
+@dataclass
+class Distribution:
+    """Day offsets from today: 'uniform:LOW:HIGH' or 'normal:MEAN:STDDEV'"""
+    kind: str
+    a: float
+    b: float
+
+    @classmethod
+    def parse(cls, value: str) -> 'Distribution':
+        kind, a, b = value.split(':')
+        if kind not in ('uniform', 'normal'):
+            raise ValueError(f"Unknown distribution {kind!r}, use uniform:LOW:HIGH or normal:MEAN:STDDEV")
+        return cls(kind, float(a), float(b))
+
+    def lowest(self) -> int:
+        return round(self.a if self.kind == 'uniform' else self.a - 4 * self.b)
+
+    def sample(self, rng: random.Random) -> int:
+        if self.kind == 'uniform':
+            return round(rng.uniform(self.a, self.b))
+        return round(rng.gauss(self.a, self.b))
+
+
+@dataclass
+class DatasetOptions:
+    users: int = 1_000_000
+    start_id: int = SEED_USER_ID_START
+    chunk_size: int = 20_000
+    payer_ratio: float = 0.5
+    auto_subscribe_ratio: float = 0.4
+    foreigner_ratio: float = 0.02
+    card_ratio: float = 0.1
+    failed_order_ratio: float = 0.05
+    max_orders: int = 6
+    due_today_ratio: float = 0.0
+    expiry: Distribution = field(default_factory=lambda: Distribution('uniform', -60, 30))
+    languages: dict = field(default_factory=lambda: {CONSTANTS.LANGUAGES.UZ: 0.8, CONSTANTS.LANGUAGES.RU: 0.2})
+    method: str = 'copy'
+    seed: int = None
+
+
+@dataclass
+class Chunk:
+    users: list = field(default_factory=list)
+    cards: list = field(default_factory=list)
+    orders: list = field(default_factory=list)
+    transactions: list = field(default_factory=list)
+    subscriptions: list = field(default_factory=list)
+    joins: list = field(default_factory=list)
+
+    def counts(self) -> dict:
+        return {name: len(rows) for name, rows in self.__dict__.items()}
+
+
+def _column_map(model) -> dict:
+    return {f.attname: f.column for f in model._meta.concrete_fields}
+
+
+def copy_rows(model, rows: list[dict]) -> None:
+    """COPY dict rows (keyed by attname) into the model's table"""
+    if not rows:
+        return
+    columns = _column_map(model)
+    keys = list(rows[0])
+    json_keys = {key for key, value in rows[0].items() if isinstance(value, dict)}
+    buffer = io.StringIO()
+    # Quote everything but None, so empty strings stay empty strings and None becomes NULL.
+    # str() of dates, datetimes and booleans is valid Postgres input as is.
+    writer = csv.writer(buffer, quoting=csv.QUOTE_NOTNULL)
+    if json_keys:
+        writer.writerows([json.dumps(row[key]) if key in json_keys else row[key] for key in keys] for row in rows)
+    else:
+        writer.writerows([row[key] for key in keys] for row in rows)
+    buffer.seek(0)
+
+    column_list = ', '.join(f'"{columns[key]}"' for key in keys)
+    copy_sql = f'COPY "{model._meta.db_table}" ({column_list}) FROM STDIN WITH (FORMAT csv)'
+    with connection.cursor() as cursor:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(copy_sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def reserve_ids(model, count: int) -> list[int]:
+    """Take `count` values from the primary key sequence, so children can reference rows before they exist"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class DatasetGenerator:
+    def __init__(self, options: DatasetOptions):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        # Same calendar as the renewal worklist
+        self.today = timezone.localdate()
+        self.now = datetime.now(dt_timezone.utc)
+        self.courses = list(Course.objects.order_by('id'))
+        if not self.courses:
+            self.courses = [Course.objects.create(amount=100_000, name="Seed course", period=30)]
+        self.channels = {}
+        for channel in PrivateChannel.objects.all():
+            self.channels.setdefault(channel.course_id, []).append(channel.id)
+        self.languages, self.language_weights = zip(*options.languages.items())
+
+    def _aware(self, day: date) -> datetime:
+        moment = time(self.rng.randrange(24), self.rng.randrange(60), self.rng.randrange(60))
+        return datetime.combine(day, moment, tzinfo=dt_timezone.utc)
+
+    def _user_row(self, telegram_id: int, created_at: datetime) -> dict:
+        return {
+            'telegram_id': telegram_id,
+            'password': '!',
+            'last_login': None,
+            'is_superuser': False,
+            'username': f"seed{telegram_id}",
+            'first_name': f"Seed {telegram_id % 1_000_000}",
+            'last_name': None,
+            'phone': f"+99890{self.rng.randrange(10 ** 7):07d}",
+            'is_staff': False,
+            'is_active': True,
+            'is_subscribed': False,
+            'subscription_start_date': None,
+            'subscription_end_date': None,
+            'language': self.rng.choices(self.languages, self.language_weights)[0],
+            'agreed_to_terms': False,
+            'is_auto_subscribe': False,
+            'is_foreigner': self.rng.random() < self.options.foreigner_ratio,
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+
+    def _card_row(self, telegram_id: int, created_at: datetime, confirmed: bool) -> dict:
+        return {
+            'name': "",
+            'user_id': telegram_id,
+            'marked_pan': f"860012******{self.rng.randrange(10000):04d}",
+            'expire_date': f"{self.rng.randrange(1, 13):02d}{self.rng.randrange(26, 31)}",
+            'service': UserCard.ServiceType.CLICK,
+            'is_main': confirmed,
+            'is_confirmed': confirmed,
+            'card_token': f"SEED-{telegram_id}-{self.rng.getrandbits(32):08x}",
+            'processing': None,
+            'created_at': created_at,
+            'updated_at': created_at,
+        }
+
+    def _add_history(self, chunk: Chunk, user: dict, order_ids: list) -> None:
+        """Give a payer consecutive successful orders ending on their subscription end date"""
+        options = self.options
+        telegram_id = user['telegram_id']
+        course = self.rng.choice(self.courses)
+        period = course.period or 30
+
+        if self.rng.random() < options.due_today_ratio:
+            end_date = self.today
+        else:
+            end_date = self.today + timedelta(days=options.expiry.sample(self.rng))
+        orders = self.rng.randint(1, options.max_orders)
+        start_date = end_date - timedelta(days=period * orders)
+        is_subscribed = end_date >= self.today
+        is_auto = self.rng.random() < options.auto_subscribe_ratio
+
+        user.update(
+            is_subscribed=is_subscribed,
+            subscription_start_date=start_date,
+            subscription_end_date=end_date,
+            is_auto_subscribe=is_auto,
+            agreed_to_terms=is_auto or self.rng.random() < 0.5,
+            created_at=self._aware(start_date - timedelta(days=self.rng.randrange(30))),
+        )
+        user['updated_at'] = user['created_at']
+
+        if is_auto:
+            chunk.cards.append(self._card_row(telegram_id, user['created_at'], confirmed=True))
+
+        for index in range(orders):
+            period_start = start_date + timedelta(days=period * index)
+            paid_at = self._aware(period_start)
+            order_id = order_ids.pop()
+            chunk.orders.append({
+                'id': order_id,
+                'user_id': telegram_id,
+                'course_id': course.id,
+                'amount': course.amount,
+                'status': CONSTANTS.PaymentStatus.SUCCESS,
+                'payment_id': self.rng.getrandbits(40),
+                'created_at': paid_at,
+                'updated_at': paid_at,
+            })
+            chunk.transactions.append({
+                '_id': None,
+                'transaction_id': str(self.rng.getrandbits(40)),
+                'order_id': order_id,
+                'user_id': telegram_id,
+                'amount': course.amount,
+                'state': Transaction.SUCCESSFULLY,
+                'fiscal_data': {},
+                'payment_method': CONSTANTS.PaymentMethod.CLICK,
+                'cancel_reason': None,
+                'perform_time': paid_at,
+                'cancel_time': None,
+                'created_at': paid_at,
+                'updated_at': paid_at,
+            })
+            is_last = index == orders - 1
+            chunk.subscriptions.append({
+                'user_id': telegram_id,
+                'order_id': order_id,
+                'course_id': course.id,
+                'start_date': period_start,
+                'end_date': period_start + timedelta(days=period),
+                'status': (
+                    CONSTANTS.MembershipStatus.ACTIVE if is_last and is_subscribed
+                    else CONSTANTS.MembershipStatus.EXPIRED
+                ),
+                'created_at': paid_at,
+                'updated_at': paid_at,
+            })
+
+        if self.rng.random() < options.failed_order_ratio:
+            failed_at = self._aware(end_date if end_date <= self.today else self.today)
+            chunk.orders.append({
+                'id': order_ids.pop(),
+                'user_id': telegram_id,
+                'course_id': course.id,
+                'amount': course.amount,
+                'status': CONSTANTS.PaymentStatus.FAILED,
+                'payment_id': self.rng.getrandbits(40),
+                'created_at': failed_at,
+                'updated_at': failed_at,
+            })
+
+        for channel_id in self.channels.get(course.id, ()):
+            chunk.joins.append({
+                'user_id': telegram_id,
+                'channel_id': channel_id,
+                'is_joined': is_subscribed,
+                'created_at': user['created_at'],
+                'updated_at': user['created_at'],
+            })
+
+    def build_chunk(self, first_id: int, count: int) -> Chunk:
+        options = self.options
+        chunk = Chunk()
+        payers = [self.rng.random() < options.payer_ratio for _ in range(count)]
+        # Upper bound: every order of every payer plus one failed order each
+        order_ids = reserve_ids(Order, sum(payers) * (options.max_orders + 1))
+        order_ids.reverse()
+
+        for offset, is_payer in enumerate(payers):
+            telegram_id = first_id + offset
+            created_at = self.now - timedelta(days=self.rng.randrange(400), seconds=self.rng.randrange(86400))
+            user = self._user_row(telegram_id, created_at)
+            chunk.users.append(user)
+            if is_payer:
+                self._add_history(chunk, user, order_ids)
+            elif self.rng.random() < options.card_ratio:
+                chunk.cards.append(self._card_row(telegram_id, created_at, confirmed=self.rng.random() < 0.5))
+        return chunk
+
+    def write_chunk(self, chunk: Chunk) -> None:
+        batches = (
+            (User, chunk.users),
+            (UserCard, chunk.cards),
+            (Order, chunk.orders),
+            (Transaction, chunk.transactions),
+            (UserCourseSubscription, chunk.subscriptions),
+            (UserJoinChannel, chunk.joins),
+        )
+        with transaction.atomic():
+            for model, rows in batches:
+                if self.options.method == 'copy':
+                    copy_rows(model, rows)
+                else:
+                    model.objects.bulk_create([model(**row) for row in rows], batch_size=5000)
+
+    def ensure_partitions(self) -> None:
+        """Create monthly Transaction partitions for the whole generated history"""
+        from order import partitions
+
+        if not partitions.is_partitioned():
+            return
+        longest_history = max(course.period or 30 for course in self.courses) * self.options.max_orders
+        oldest = self.today + timedelta(days=min(self.options.expiry.lowest(), 0) - longest_history)
+        month = oldest.replace(day=1)
+        while month <= self.today:
+            partitions.create_partition(month)
+            month = partitions.add_months(month, 1)
+
+    def run(self, progress=None) -> dict:
+        self.ensure_partitions()
+        totals = {}
+        for first_id in range(self.options.start_id, self.options.start_id + self.options.users, self.options.chunk_size):
+            count = min(self.options.chunk_size, self.options.start_id + self.options.users - first_id)
+            chunk = self.build_chunk(first_id, count)
+            self.write_chunk(chunk)
+            for name, value in chunk.counts().items():
+                totals[name] = totals.get(name, 0) + value
+            if progress:
+                progress(totals)
+        return totals
+
+
+def clear_seeded(start_id: int, count: int) -> dict:
+    """Delete seeded rows with raw DELETEs; the ORM cascade would load every row first"""
+    if start_id < SYNTHETIC_ID_FLOOR:
+        raise ValueError(f"Seeded IDs start at {SYNTHETIC_ID_FLOOR} or above, refusing to delete from {start_id}")
+    if not count or count < 0:
+        raise ValueError("Give the number of seeded users to delete")
+    end_id = start_id + count
+    deleted = {}
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, column in SEEDED_TABLES:
+            cursor.execute(
+                f'DELETE FROM "{model._meta.db_table}" WHERE "{column}" >= %s AND "{column}" < %s',
+                [start_id, end_id],
+            )
+            deleted[model.__name__] = cursor.rowcount
+    return deleted
@@ -0,0 +1,168 @@
+"""
+Local stand-in for the Telegram Bot API.
+
+Answers every `/bot<token>/<method>` call with a plausible result after a configurable
+delay and can answer a share of the calls with 429 Too Many Requests. Updates added
+with `push_updates()` are served by getUpdates, for the polling worker.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+
+MESSAGE_METHODS = {
+    'sendMessage', 'editMessageText', 'editMessageReplyMarkup', 'sendVideo', 'sendPhoto',
+    'sendDocument', 'forwardMessage',
+}
+
+
+class FakeBotAPI:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, rate_429=0.0, retry_after=1, seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.throttled = Counter()
+        self._message_id = 0
+        self._runner = None
+        self._updates: list[dict] = []
+        self._new_updates = asyncio.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> 'FakeBotAPI':
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        app.router.add_route('*', '/file/bot{token}/{path:.*}', self.handle_file)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Fake Bot API listening on {self.url}")
+        return self
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def push_updates(self, updates: list[dict]) -> None:
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def get_updates(self, params: dict) -> list[dict]:
+        """Long poll like Telegram: updates below `offset` are confirmed and dropped"""
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        self._updates = [update for update in self._updates if update['update_id'] >= offset]
+        if not self._updates and params.get('timeout'):
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), int(params['timeout']))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    def stats(self) -> dict:
+        return {'calls': dict(self.calls), 'throttled': dict(self.throttled)}
+
+    async def _delay(self) -> None:
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    async def _params(request: web.Request) -> dict:
+        if request.content_type == 'application/json':
+            return await request.json()
+        if request.method == 'POST':
+            return dict(await request.post())
+        return dict(request.query)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        params = await self._params(request)
+        await self._delay()
+        self.calls[method] += 1
+
+        if self.rate_429 and self.random.random() < self.rate_429:
+            self.throttled[method] += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }, status=429)
+
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self.get_updates(params)})
+        return web.json_response({'ok': True, 'result': self.result(method, params)})
+
+    async def handle_file(self, request: web.Request) -> web.Response:
+        await self._delay()
+        self.calls['file'] += 1
+        return web.Response(body=b'\0' * 1024)
+
+    def _message(self, params: dict) -> dict:
+        self._message_id += 1
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': int(params.get('message_id') or self._message_id),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'},
+            'from': BOT_USER,
+        }
+        if 'text' in params:
+            message['text'] = params['text']
+        if 'reply_markup' in params:
+            markup = params['reply_markup']
+            message['reply_markup'] = json.loads(markup) if isinstance(markup, str) else markup
+        return message
+
+    def result(self, method: str, params: dict):
+        if method in MESSAGE_METHODS:
+            return self._message(params)
+        if method == 'copyMessage':
+            self._message_id += 1
+            return {'message_id': self._message_id}
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'getChatMember':
+            user_id = int(params.get('user_id') or 0)
+            return {'status': 'member', 'user': {'id': user_id, 'is_bot': False, 'first_name': 'User'}}
+        if method == 'createChatInviteLink':
+            return {
+                'invite_link': f"https://t.me/+bench{self.random.getrandbits(48):012x}",
+                'creator': BOT_USER,
+                'creates_join_request': False,
+                'is_primary': False,
+                'is_revoked': False,
+                'member_limit': int(params.get('member_limit') or 1),
+            }
+        if method == 'getWebhookInfo':
+            return {'url': '', 'has_custom_certificate': False, 'pending_update_count': 0}
+        if method == 'getChat':
+            chat_id = int(params.get('chat_id') or 0)
+            return {'id': chat_id, 'type': 'private' if chat_id > 0 else 'supergroup'}
+        # answerCallbackQuery, deleteMessage, banChatMember, unbanChatMember, setMyCommands, ...
+        return True
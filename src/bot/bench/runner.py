@@ -0,0 +1,138 @@
+"""
+Replays update sessions through the dispatcher (or the webhook view) at a target rate
+and reports throughput, latency percentiles and SQL queries per update.
+"""
+import asyncio
+import json
+import logging
+import math
+import statistics
+import time
+from dataclasses import dataclass, field
+
+from aiogram.client.telegram import TelegramAPIServer
+from django.conf import settings
+from django.test import AsyncRequestFactory
+
+from core.metrics import QueryStats, observe_queries
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class ReplayResult:
+    updates: int = 0
+    errors: int = 0
+    elapsed: float = 0.0
+    latencies: list[float] = field(default_factory=list)
+    queries: list[int] = field(default_factory=list)
+
+    def summary(self) -> dict:
+        latencies_ms = [value * 1000 for value in self.latencies]
+        return {
+            'updates': self.updates,
+            'errors': self.errors,
+            'elapsed_s': round(self.elapsed, 3),
+            'throughput_ups': round(self.updates / self.elapsed, 2) if self.elapsed else 0,
+            'latency_ms': {
+                'p50': round(percentile(latencies_ms, 50), 2),
+                'p90': round(percentile(latencies_ms, 90), 2),
+                'p99': round(percentile(latencies_ms, 99), 2),
+                'max': round(max(latencies_ms, default=0), 2),
+            },
+            'db_queries_per_update': {
+                'mean': round(statistics.fmean(self.queries), 2) if self.queries else 0,
+                'p95': percentile(self.queries, 95),
+                'max': max(self.queries, default=0),
+            },
+        }
+
+
+class Pacer:
+    """Hands out evenly spaced start times for a target rate; rate 0 means as fast as possible"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate else 0
+        self._next = None
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self._next is None or self._next < now:
+            self._next = now
+        delay = self._next - now
+        self._next += self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class ReplayRunner:
+    """
+    `target` is 'dispatcher' (feed_raw_update) or 'webhook' (the Django view, including
+    the secret check and JSON decoding). Sessions run concurrently, up to `concurrency`
+    at a time; the updates of one session are always sent in order.
+    """
+
+    def __init__(self, rate: float = 0, concurrency: int = 100, target: str = 'dispatcher'):
+        self.pacer = Pacer(rate)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.target = target
+        self.result = ReplayResult()
+        self._request_factory = AsyncRequestFactory()
+
+    async def _send(self, update: dict) -> None:
+        if self.target == 'webhook':
+            from bot.views import process_update
+
+            request = self._request_factory.post(
+                '/v1/bot/webhook/',
+                data=json.dumps(update),
+                content_type='application/json',
+                headers={'X-Telegram-Bot-Api-Secret-Token': settings.BOT_WEBHOOK_SECRET},
+            )
+            response = await process_update(request)
+            if response.status_code != 200:
+                raise RuntimeError(f"Webhook answered {response.status_code}")
+        else:
+            from bot.misc import feed_raw_update
+
+            await feed_raw_update(update)
+
+    async def _run_session(self, session: list[dict]) -> None:
+        async with self.semaphore:
+            for update in session:
+                await self.pacer.wait()
+                start = time.perf_counter()
+                with observe_queries(QueryStats()) as stats:
+                    try:
+                        await self._send(update)
+                    except Exception as e:
+                        self.result.errors += 1
+                        logger.warning(f"Update {update.get('update_id')} failed: {e}")
+                self.result.latencies.append(time.perf_counter() - start)
+                self.result.queries.append(stats.count)
+                self.result.updates += 1
+
+    async def run(self, sessions: list[list[dict]]) -> ReplayResult:
+        start = time.perf_counter()
+        await asyncio.gather(*(self._run_session(session) for session in sessions))
+        self.result.elapsed = time.perf_counter() - start
+        return self.result
+
+
+def point_bot_at(base_url: str):
+    """Send the shared bot's API calls to another server (the fake Bot API), returns the previous server"""
+    from bot.client import get_bot
+
+    bot = get_bot()
+    previous = bot.session.api
+    bot.session.api = TelegramAPIServer.from_base(base_url)
+    return previous
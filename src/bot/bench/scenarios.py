@@ -0,0 +1,433 @@
+"""
+Named scenarios for `manage.py bench`.
+
+Each scenario is an async function taking a problem size and returning a dict of
+measurements. `primary` names the measurement compared against a baseline.
+Scenarios that need rows seed them in their own telegram_id range and remove them
+afterwards; the command runs them against a throwaway test database.
+"""
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import CallbackQuery, Message
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import override_settings
+
+from bot.bench.dataset import SYNTHETIC_ID_FLOOR, DatasetGenerator, DatasetOptions, clear_seeded
+from bot.bench.fake_bot_api import FakeBotAPI
+from bot.bench.runner import percentile, point_bot_at
+from bot.bench.updates import UpdateFactory
+
+# Apart from the seed_dataset default range, which may be loaded into the same database
+BENCH_SEED_START = SYNTHETIC_ID_FLOOR + 2 ** 48
+BENCH_BOT_ID = 1000000001
+
+
+@dataclass
+class Scenario:
+    name: str
+    func: Callable[[int], Awaitable[dict]]
+    primary: str
+    size: int
+    higher_is_better: bool = True
+    # Touches rows beyond the seeded range: never run against the configured database
+    test_db_only: bool = False
+
+
+SCENARIOS: dict[str, Scenario] = {}
+
+
+def scenario(name, primary='ops_per_s', size=1000, higher_is_better=True, test_db_only=False):
+    def decorator(func):
+        SCENARIOS[name] = Scenario(name, func, primary, size, higher_is_better, test_db_only)
+        return func
+    return decorator
+
+
+def summarize(latencies: list[float], elapsed: float) -> dict:
+    micros = [value * 1_000_000 for value in latencies]
+    return {
+        'operations': len(latencies),
+        'elapsed_s': round(elapsed, 4),
+        'ops_per_s': round(len(latencies) / elapsed, 2) if elapsed else 0,
+        'p50_us': round(percentile(micros, 50), 1),
+        'p99_us': round(percentile(micros, 99), 1),
+    }
+
+
+async def timed(operations) -> dict:
+    """Await every zero-argument coroutine function in `operations`, timing each"""
+    latencies = []
+    start = time.perf_counter()
+    for operation in operations:
+        began = time.perf_counter()
+        await operation()
+        latencies.append(time.perf_counter() - began)
+    return summarize(latencies, time.perf_counter() - start)
+
+
+@sync_to_async
+def seed_users(count: int, **overrides) -> None:
+    options = DatasetOptions(
+        users=count, start_id=BENCH_SEED_START, chunk_size=max(count, 1), foreigner_ratio=0,
+        failed_order_ratio=0, seed=1, **overrides,
+    )
+    DatasetGenerator(options).run()
+
+
+@sync_to_async
+def clear_users(count: int) -> None:
+    clear_seeded(BENCH_SEED_START, count)
+
+
+@scenario('fsm_storage', size=2000)
+async def fsm_storage(size):
+    """set_state/get_state/set_data/get_data round trip through DjangoRedisStorage"""
+    from bot.data.states import UserCardStates
+    from bot.utils.storage import DjangoRedisStorage
+
+    storage = DjangoRedisStorage()
+    keys = [StorageKey(bot_id=BENCH_BOT_ID, chat_id=BENCH_SEED_START + i, user_id=BENCH_SEED_START + i)
+            for i in range(100)]
+
+    def round_trip(key):
+        async def run():
+            await storage.set_state(key, UserCardStates.card_number)
+            await storage.get_state(key)
+            await storage.set_data(key, {'card_number': '8600123412341234'})
+            await storage.get_data(key)
+        return run
+
+    try:
+        return await timed(round_trip(keys[i % len(keys)]) for i in range(size))
+    finally:
+        for key in keys:
+            await storage.set_state(key, None)
+            await storage.set_data(key, {})
+
+
+@scenario('routing', size=5000)
+async def routing(size):
+    """Handler resolution for callback queries and commands, filters only, no handler bodies"""
+    from bot.client import get_bot
+    from bot.routers import router
+
+    bot = get_bot()
+
+    factory = UpdateFactory()
+    user_id = BENCH_SEED_START
+    callback_data = [
+        'main_menu', 'my_cards', 'check_membership_info', 'subscription_info', 'mini_menu', 'accept_offer',
+        'active_courses', 'check_payment_type_1', 'click_payment_1', 'subscribe_course_1', 'make_payment_1_2',
+        'cancel_membership', 'confirm_cancel_membership', 'not_a_button',
+    ]
+    events = [('callback_query', CallbackQuery.model_validate(factory.callback(user_id, data)['callback_query']))
+              for data in callback_data]
+    events += [('message', Message.model_validate(factory.message(user_id, text)['message']))
+               for text in ('/start', '/check', '/cancel')]
+    routers = list(router.chain_tail)
+
+    def resolve(event_type, event):
+        async def run():
+            for current in routers:
+                for handler in current.observers[event_type].handlers:
+                    matched, _ = await handler.check(event, bot=bot, raw_state=None, event_update=None)
+                    if matched:
+                        return handler
+        return run
+
+    return await timed(resolve(*events[i % len(events)]) for i in range(size))
+
+
+@scenario('keyboards', size=5000)
+async def keyboards(size):
+    """Menu keyboards plus the course list keyboard, serialized as the session sends them"""
+    from bot.functions import get_main_menu_keyboard
+    from bot.keyboards import back_menu_button, get_main_menu, get_mini_menu_keyboard
+    from order.models import Course
+
+    courses = [Course(id=i, amount=100_000 * i, name=f"Kurs {i}", period=30) for i in range(1, 6)]
+
+    async def build():
+        markups = [get_main_menu(), get_mini_menu_keyboard(), get_main_menu_keyboard()]
+        builder = InlineKeyboardBuilder()
+        for course in courses:
+            builder.button(text=f"🔐 {course.name}", callback_data=f"check_payment_type_{course.id}")
+        builder.row(back_menu_button())
+        markups.append(builder.as_markup())
+        for markup in markups:
+            json.dumps(markup.model_dump(exclude_none=True))
+
+    return await timed(build for _ in range(size))
+
+
+# The worklist and its shards cover every subscription due today, real users included
+@scenario('renewal', primary='users_per_s', size=200, test_db_only=True)
+async def renewal(size):
+    """Nightly charge + kick stages over `size` due auto-subscribers against fake Click and Bot API"""
+    from core.tasks import _process_renewal_shard
+    from order.click_up.fake_server import FakeClickAPI
+    from order.models import Course, PrivateChannel, RenewalWorkItem
+    from order.services import RenewalWorklistService
+
+    await seed_users(size, payer_ratio=1, auto_subscribe_ratio=1, due_today_ratio=1, max_orders=1)
+    course = await Course.objects.order_by('id').afirst()
+    if not await PrivateChannel.objects.filter(course=course).aexists():
+        await PrivateChannel.objects.acreate(course=course, private_channel_id='-1001000000001')
+
+    try:
+        async with FakeClickAPI(latency=0.05, jitter=0.02, error_rate=0.1, seed=1) as click, \
+                FakeBotAPI(latency=0.02, jitter=0.005, seed=1) as telegram:
+            previous = point_bot_at(telegram.url)
+            try:
+                with override_settings(CLICK_BASE_URL=click.url):
+                    due = await sync_to_async(RenewalWorklistService.build)()
+                    start = time.perf_counter()
+                    counts = await _process_renewal_shard(
+                        [RenewalWorkItem.Stage.CHARGE, RenewalWorkItem.Stage.KICK], 0, 1
+                    )
+                    elapsed = time.perf_counter() - start
+            finally:
+                from bot.client import get_bot
+                get_bot().session.api = previous
+        return {
+            'users': due,
+            'elapsed_s': round(elapsed, 3),
+            'users_per_s': round(due / elapsed, 2) if elapsed else 0,
+            'outcomes': counts,
+            'click': click.stats(),
+            'bot_api': telegram.stats(),
+        }
+    finally:
+        await RenewalWorkItem.objects.filter(
+            user_id__gte=BENCH_SEED_START, user_id__lt=BENCH_SEED_START + size
+        ).adelete()
+        await clear_users(size)
+
+
+@scenario('broadcast', primary='messages_per_s', size=300)
+async def broadcast(size):
+    """Video broadcast task to `size` users against the fake Bot API"""
+    from bot.tasks import send_video_to_users_async
+
+    await seed_users(size, payer_ratio=0)
+    try:
+        async with FakeBotAPI(latency=0.02, jitter=0.005, seed=1) as telegram:
+            with override_settings(BOT_API_BASE_URL=telegram.url):
+                start = time.perf_counter()
+                result = await send_video_to_users_async('BENCH_VIDEO', "Bench", settings.BOT_TOKEN, BENCH_BOT_ID)
+                elapsed = time.perf_counter() - start
+        return {
+            'messages': result['success'],
+            'failed': result['failed'],
+            'elapsed_s': round(elapsed, 3),
+            'messages_per_s': round(result['success'] / elapsed, 2) if elapsed else 0,
+            'bot_api': telegram.stats(),
+        }
+    finally:
+        await clear_users(size)
+
+
+@scenario('click_webhook', size=200)
+async def click_webhook(size):
+    """Signed Shop API prepare + complete for `size` pending orders through ClickWebhook"""
+    from core.utils.constants import CONSTANTS
+    from order.click_up.fake_server import FakeClickAPI, webhook_callback
+    from order.models import Course, Order
+
+    await seed_users(size, payer_ratio=0)
+    course = await Course.objects.order_by('id').afirst()
+    orders = await Order.objects.abulk_create(
+        Order(user_id=BENCH_SEED_START + i, course=course, amount=course.amount) for i in range(size)
+    )
+    click = FakeClickAPI(callback=webhook_callback(), seed=1)
+
+    def handshake(order):
+        async def run():
+            await click.deliver(str(order.id), order.amount)
+        return run
+
+    try:
+        result = await timed(handshake(order) for order in orders)
+        result['paid'] = await Order.objects.filter(
+            user_id__gte=BENCH_SEED_START, user_id__lt=BENCH_SEED_START + size,
+            status=CONSTANTS.PaymentStatus.SUCCESS,
+        ).acount()
+        result['callbacks'] = click.stats()['callbacks']
+        return result
+    finally:
+        await clear_users(size)
+
+
+@scenario('registration', primary='users_per_s', size=2000)
+async def registration(size):
+    """Burst of `size` new users: one aget_or_create each vs. the write-behind buffer plus its flush"""
+    from users.models import User
+    from users.registration import RegistrationBuffer
+
+    class BenchBuffer(RegistrationBuffer):
+        # Never touch the real buffer, its users belong to the real database
+        pending_key = 'bench:registrations:pending'
+        lock_key = 'bench:registrations:flush-lock'
+
+    def fields(i):
+        return {'first_name': f'Bench {i}', 'last_name': None, 'phone': f'99890{i % 10_000_000:07d}'}
+
+    async def direct(i):
+        await User.objects.aget_or_create(telegram_id=BENCH_SEED_START + i, defaults=fields(i))
+
+    async def buffered(i):
+        await BenchBuffer.add(BENCH_SEED_START + size + i, **fields(i))
+
+    try:
+        start = time.perf_counter()
+        for i in range(size):
+            await direct(i)
+        direct_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(size):
+            await buffered(i)
+        flush_start = time.perf_counter()
+        await BenchBuffer.flush()
+        buffered_elapsed = time.perf_counter() - start
+        flush_elapsed = time.perf_counter() - flush_start
+
+        inserted = await User.objects.filter(
+            telegram_id__gte=BENCH_SEED_START + size, telegram_id__lt=BENCH_SEED_START + 2 * size
+        ).acount()
+        return {
+            'users': size,
+            'inserted': inserted,
+            'direct_users_per_s': round(size / direct_elapsed, 2),
+            'users_per_s': round(size / buffered_elapsed, 2),
+            'speedup': round(direct_elapsed / buffered_elapsed, 2),
+            'flush_s': round(flush_elapsed, 4),
+        }
+    finally:
+        await clear_users(2 * size)
+
+
+# Cold start of each process role in a fresh interpreter: what its entry point imports
+# before serving. The web lifespan builds the dispatcher; Celery's worker and beat both
+# load the task modules (loader.init_worker), the worker also runs its worker_init hooks.
+IMPORT_ROLES = {
+    'web': "import config.asgi, config.lifespan\n"
+           "from django.urls import get_resolver\n"
+           "get_resolver().url_patterns\n"
+           "from bot.misc import get_dispatcher\n"
+           "get_dispatcher()",
+    'worker': "from config.celery import app\n"
+              "from celery.signals import worker_init\n"
+              "import django\n"
+              "django.setup()\n"
+              "app.loader.import_default_modules()\n"
+              "worker_init.send(sender=None)",
+    'beat': "from config.celery import app\n"
+            "import django\n"
+            "django.setup()\n"
+            "app.loader.import_default_modules()",
+}
+# Peak RSS from VmHWM: Linux carries ru_maxrss over execve, so it would report the bench process
+IMPORT_PROBE = """
+import json, resource, sys
+try:
+    with open('/proc/self/status') as status:
+        peak_kb = next(int(line.split()[1]) for line in status if line.startswith('VmHWM:'))
+except OSError:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'modules': len(sys.modules),
+    'rss_mb': round(peak_kb / 1024, 1),
+    'aiogram': 'aiogram' in sys.modules,
+    'routers': 'bot.routers' in sys.modules,
+}))
+"""
+
+
+def cold_import(role: str) -> dict:
+    """One fresh `python -X importtime` run of a role's entry point"""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'}
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', IMPORT_ROLES[role] + IMPORT_PROBE],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    # "import time: self [us] | cumulative | imported package"; top-level imports are not indented
+    top_level = []
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, package = line[len('import time:'):].split('|')
+        if not package.startswith('  '):
+            top_level.append((int(cumulative), package.strip()))
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    result['elapsed_s'] = elapsed
+    result['slowest'] = {package: round(us / 1000, 1) for us, package in sorted(top_level, reverse=True)[:5]}
+    return result
+
+
+@scenario('importtime', primary='web_s', size=5, higher_is_better=False)
+async def importtime(size):
+    """Cold start wall time, imported modules and peak RSS of the web, Celery worker and beat entry points"""
+    result = {}
+    for role in IMPORT_ROLES:
+        runs = [await asyncio.to_thread(cold_import, role) for _ in range(size)]
+        runs.sort(key=lambda run: run['elapsed_s'])
+        median = runs[len(runs) // 2]
+        result.update({
+            f'{role}_s': round(median['elapsed_s'], 3),
+            f'{role}_rss_mb': median['rss_mb'],
+            f'{role}_modules': median['modules'],
+            f'{role}_imports_aiogram': median['aiogram'],
+            f'{role}_imports_routers': median['routers'],
+            f'{role}_slowest_ms': median['slowest'],
+        })
+    return result
+
+
+async def run_scenario(name: str, size: int = None, repeat: int = 1) -> dict:
+    """Run a scenario `repeat` times and keep the run with the best primary measurement"""
+    current = SCENARIOS[name]
+    best = None
+    for _ in range(max(repeat, 1)):
+        result = await current.func(size or current.size)
+        value = result[current.primary]
+        if best is None or (value > best[current.primary]) == current.higher_is_better:
+            best = result
+    best['primary'] = current.primary
+    best['size'] = size or current.size
+    return best
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[dict]:
+    """Primary measurement change per scenario present in both, with a regression flag"""
+    rows = []
+    for name, result in results.items():
+        if name not in baseline or name not in SCENARIOS:
+            continue
+        current = SCENARIOS[name]
+        old, new = baseline[name][current.primary], result[current.primary]
+        change = (new - old) / old * 100 if old else math.inf
+        worse = -change if current.higher_is_better else change
+        rows.append({
+            'scenario': name,
+            'metric': current.primary,
+            'baseline': old,
+            'current': new,
+            'change_pct': round(change, 1),
+            'regression': worse > threshold,
+        })
+    return rows
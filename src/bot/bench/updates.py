@@ -0,0 +1,174 @@
+"""
+Synthetic update streams.
+
+A stream is a list of sessions; each session is the ordered list of raw updates one
+user sends during a flow (registration, /check, payment). Sessions of different
+users may be interleaved, updates of one session may not.
+"""
+import json
+import random
+import time
+from pathlib import Path
+
+from bot.bench.dataset import SYNTHETIC_ID_FLOOR
+
+# Above the seeded and bench scenario ranges, out of reach of real Telegram users
+BENCH_USER_ID_START = SYNTHETIC_ID_FLOOR + 2 ** 49
+
+
+class UpdateFactory:
+    def __init__(self, start_update_id=1):
+        self.update_id = start_update_id
+        self.message_id = 0
+
+    def _next_ids(self):
+        self.update_id += 1
+        self.message_id += 1
+        return self.update_id, self.message_id
+
+    @staticmethod
+    def _user(user_id):
+        return {'id': user_id, 'is_bot': False, 'first_name': f"Bench{user_id % 100000}", 'language_code': 'uz'}
+
+    def message(self, user_id: int, text: str) -> dict:
+        update_id, message_id = self._next_ids()
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': update_id, 'message': message}
+
+    def callback(self, user_id: int, data: str) -> dict:
+        update_id, message_id = self._next_ids()
+        return {
+            'update_id': update_id,
+            'callback_query': {
+                'id': str(update_id),
+                'chat_instance': str(user_id),
+                'from': self._user(user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id,
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': {'id': 1000000001, 'is_bot': True, 'first_name': 'Bench'},
+                    'text': "Menyu:",
+                },
+            },
+        }
+
+
+def registration_session(factory, user_id, rng, course_ids):
+    return [
+        factory.message(user_id, '/start'),
+        factory.message(user_id, f"Bench {user_id % 100000}"),
+        factory.message(user_id, f"99890{rng.randrange(10**7):07d}"),
+    ]
+
+
+def check_session(factory, user_id, rng, course_ids):
+    session = [factory.message(user_id, '/start'), factory.message(user_id, '/check')]
+    session += [factory.callback(user_id, rng.choice(['check_membership_info', 'my_cards', 'subscription_info']))]
+    session.append(factory.callback(user_id, 'main_menu'))
+    return session
+
+
+def payment_session(factory, user_id, rng, course_ids):
+    course_id = rng.choice(course_ids)
+    return [
+        factory.message(user_id, '/start'),
+        factory.callback(user_id, 'mini_menu'),
+        factory.callback(user_id, 'accept_offer'),
+        factory.callback(user_id, f"check_payment_type_{course_id}"),
+        factory.callback(user_id, f"click_payment_{course_id}"),
+    ]
+
+
+SCENARIOS = {
+    'registration': registration_session,
+    'check': check_session,
+    'payment': payment_session,
+}
+DEFAULT_MIX = {'registration': 0.2, 'check': 0.5, 'payment': 0.3}
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """'registration=2,check=5,payment=3' -> weights"""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name!r}, choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def generate_sessions(
+    sessions: int,
+    course_ids: list[int],
+    mix: dict[str, float] = None,
+    existing_user_ids: list[int] = None,
+    seed: int = None,
+) -> list[list[dict]]:
+    """
+    Build `sessions` flows. Registration always uses a fresh user id above BENCH_USER_ID_START;
+    the other flows reuse `existing_user_ids` when given so they hit real rows.
+    """
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    factory = UpdateFactory()
+    names, weights = zip(*mix.items())
+    new_user_id = BENCH_USER_ID_START
+
+    result = []
+    for _ in range(sessions):
+        scenario = rng.choices(names, weights)[0]
+        if scenario == 'registration' or not existing_user_ids:
+            new_user_id += 1
+            user_id = new_user_id
+        else:
+            user_id = rng.choice(existing_user_ids)
+        result.append(SCENARIOS[scenario](factory, user_id, rng, course_ids or [1]))
+    return result
+
+
+def dump_sessions(sessions: list[list[dict]], path: Path) -> None:
+    """One JSON line per session, so recorded streams can be replayed later"""
+    with open(path, 'w') as file:
+        for session in sessions:
+            file.write(json.dumps(session) + '\n')
+
+
+def update_user_id(update: dict) -> int | None:
+    for key, event in update.items():
+        if isinstance(event, dict) and 'from' in event:
+            return event['from']['id']
+    return None
+
+
+def load_sessions(path: Path) -> list[list[dict]]:
+    """
+    Read a file written by dump_sessions, or recorded raw updates (one update per line),
+    which are grouped per user keeping their original order.
+    """
+    sessions = []
+    by_user = {}
+    with open(path) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, list):
+                sessions.append(item)
+                continue
+            user_id = update_user_id(item)
+            if user_id not in by_user:
+                by_user[user_id] = []
+                sessions.append(by_user[user_id])
+            by_user[user_id].append(item)
+    return sessions
@@ -0,0 +1,37 @@
+"""
+The process-wide `Bot`, created on first use.
+
+Celery tasks, the outbox and the handlers send through it. Importing this module
+builds nothing and imports neither aiogram nor the dispatcher and routers: Celery
+beat loads the task modules that use it without ever sending a message.
+"""
+from typing import TYPE_CHECKING
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+_bot: 'Bot | None' = None
+
+
+def get_bot() -> 'Bot':
+    global _bot
+    if _bot is None:
+        from aiogram import Bot
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.enums import ParseMode
+
+        from .utils.session import make_session
+
+        _bot = Bot(
+            token=settings.BOT_TOKEN,
+            session=make_session(),
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+    return _bot
+
+
+def preload() -> None:
+    """Import the Bot API client stack now, e.g. in a Celery parent process before it forks"""
+    from .utils import session  # noqa: F401
@@ -1,39 +1,36 @@
-import hashlib
-import time
-
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from django.conf import settings
-from django.core.cache import cache
 
+from core.keyspace import UserAttributes
 from core.utils.constants import CONSTANTS
 
 
 def get_user_language(user_id: int) -> str:
     """Get user language from cache, return default if not found"""
-    return cache.get(f"user_lang:{user_id}", CONSTANTS.LANGUAGES.UZ)
+    return UserAttributes.get(user_id, 'lang') or CONSTANTS.LANGUAGES.UZ
 
 
 def set_user_language(user_id: int, language: str):
     """Set user language in cache"""
-    cache.set(f"user_lang:{user_id}", language, timeout=None)
+    UserAttributes.set(user_id, 'lang', language)
 
 
 def delete_user_language(user_id: int):
     """Delete user language from cache"""
-    cache.delete(f"user_lang:{user_id}")
+    UserAttributes.delete(user_id, 'lang')
 
 
-def mask_middle(s):
-    return s[:6] + '*' * 6 + s[-4:]
+async def aget_user_language(user_id: int, default=CONSTANTS.LANGUAGES.UZ):
+    """Async `get_user_language`"""
+    return await UserAttributes.aget(user_id, 'lang') or default
 
 
-def generate_auth_header() -> str:
-    timestamp = str(int(time.time()))
-    raw_string = timestamp + settings.CLICK_SECRET_KEY
-    digest = hashlib.sha1(raw_string.encode()).hexdigest()
+async def aset_user_language(user_id: int, language: str):
+    """Async `set_user_language`"""
+    await UserAttributes.aset(user_id, 'lang', language)
 
-    auth_header = f"{settings.CLICK_MERCHANT_USER_ID}:{digest}:{timestamp}"
-    return auth_header
+
+def mask_middle(s):
+    return s[:6] + '*' * 6 + s[-4:]
 
 
 def get_main_menu_button():
@@ -11,8 +11,9 @@ from django.conf import settings
 from bot.data.states import UserStates
 from bot.functions import get_main_menu_keyboard
 from bot.keyboards import back_menu_button
+from core.asyncdb import get_user
 from order.models import PrivateChannel
-from users.models import User
+from users.snapshot import SnapshotCache, SubscriptionSnapshot
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +37,7 @@ async def get_or_create_user_with_state(message: types.Message, state: FSMContex
     await state.clear()
 
     telegram_id = message.from_user.id
-    user = await User.objects.filter(telegram_id=telegram_id).afirst()
+    user = await get_user(telegram_id)
 
     if not user:
         await state.set_state(UserStates.name)
@@ -46,14 +47,44 @@ async def get_or_create_user_with_state(message: types.Message, state: FSMContex
     return user
 
 
-async def get_subscription_status(user, telegram_id, bot):
+async def build_subscription_snapshot(user, bot) -> SubscriptionSnapshot:
+    """Compute the snapshot: membership in the private channel, and an invite link when not a member"""
+    snapshot = SubscriptionSnapshot.from_user(user)
+    today = datetime.today().date()
+    if not user.is_subscribed or not user.subscription_end_date or user.subscription_end_date <= today:
+        return snapshot
+
+    channel = await PrivateChannel.objects.afirst()
+    if not channel:
+        return snapshot
+
+    member = await bot.get_chat_member(chat_id=channel.private_channel_id, user_id=user.telegram_id)
+    snapshot.is_member = member.status in ["creator", "administrator", "member", "restricted"]
+
+    # User needs invite link
+    if not snapshot.is_member:
+        expire_date = int(time.time() + 3600)
+        invite_link = await bot.create_chat_invite_link(
+            chat_id=channel.private_channel_id,
+            name=f"User_{user.telegram_id}",
+            member_limit=1,
+            creates_join_request=False,
+            expire_date=expire_date
+        )
+        snapshot.invite_link = invite_link.invite_link
+        snapshot.invite_expires_at = expire_date
+
+    return snapshot
+
+
+def render_subscription_status(snapshot: SubscriptionSnapshot):
     """
-    Check user subscription status and return text + keyboard.
+    Status text + keyboard of a snapshot.
     Returns: (text, keyboard, needs_invite_link)
     """
     today = datetime.today().date()
 
-    if not user.subscription_end_date:
+    if not snapshot.subscription_end_date:
         text = "Siz obuna sotib olmagansiz, sotib olish uchun pastdagi tugmani bosing:"
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Obuna sotib olish", callback_data="mini_menu")],
@@ -61,9 +92,9 @@ async def get_subscription_status(user, telegram_id, bot):
         ])
         return text, keyboard, False
 
-    period = (user.subscription_end_date - today).days
+    period = (snapshot.subscription_end_date - today).days
 
-    if not user.is_subscribed or period <= 0:
+    if not snapshot.is_subscribed or period <= 0:
         text = "Sizning obunangiz tugagan! Yangi obuna sotib olish uchun pastdagi tugmani bosing:"
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="Obuna sotib olish", callback_data="mini_menu")],
@@ -73,41 +104,41 @@ async def get_subscription_status(user, telegram_id, bot):
 
     base_text = (
         f"Sizning a'zoligingiz tugashiga {period} kun qoldi.\n"
-        f"Obuna tugash sanasi: {user.subscription_end_date.strftime('%Y-%m-%d')}\n\n"
+        f"Obuna tugash sanasi: {snapshot.subscription_end_date.strftime('%Y-%m-%d')}\n\n"
     )
 
-    if user.is_auto_subscribe:
+    if snapshot.is_auto_subscribe:
         text = base_text + "Obuna tugash sanasida kartangizdan avtomat yechib olinadi!"
     else:
         text = base_text + ("siz bir martalik obunani sotib olgansiz. Obunani uzaytirish uchun qayta to‘lov amalga oshiring. "
                             "Aks holda, obuna muddati tugagach, yopiq kanaldan chiqarilasiz.")
 
-    channel = await PrivateChannel.objects.afirst()
-    if not channel:
-        return text, get_main_menu_keyboard(), False
-
-    try:
-        member = await bot.get_chat_member(chat_id=channel.private_channel_id, user_id=telegram_id)
-
-        # User already in channel
-        if member.status in ["creator", "administrator", "member", "restricted"]:
-            return text, get_main_menu_keyboard(), False
-
-        # User needs invite link
-        invite_link = await bot.create_chat_invite_link(
-            chat_id=channel.private_channel_id,
-            name=f"User_{telegram_id}",
-            member_limit=1,
-            creates_join_request=False,
-            expire_date=int(time.time() + 3600)
-        )
-
+    if snapshot.invite_link and not snapshot.is_member:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Yopiq Kanalga ulanish", url=invite_link.invite_link)],
+            [InlineKeyboardButton(text="Yopiq Kanalga ulanish", url=snapshot.invite_link)],
             [back_menu_button()]
         ])
         return text, keyboard, True
 
-    except Exception as e:
-        logger.error(f"Error checking membership: {e}")
-        return text, get_main_menu_keyboard(), False
+    return text, get_main_menu_keyboard(), False
+
+
+async def get_subscription_status(telegram_id, bot, user=None):
+    """
+    Status screen from the cached snapshot, rebuilt on a miss.
+    Returns: (text, keyboard, needs_invite_link), or None for an unknown user
+    """
+    snapshot = await SnapshotCache.get(telegram_id)
+    if snapshot is None:
+        user = user or await get_user(telegram_id)
+        if user is None:
+            return None
+        try:
+            snapshot = await build_subscription_snapshot(user, bot)
+        except Exception as e:
+            # Answer without the membership part, and check again next time
+            logger.error(f"Error checking membership: {e}")
+            snapshot = SubscriptionSnapshot.from_user(user)
+        else:
+            await SnapshotCache.set(snapshot)
+    return render_subscription_status(snapshot)
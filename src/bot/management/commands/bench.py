@@ -0,0 +1,108 @@
+import asyncio
+import json
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+from asgiref.sync import sync_to_async
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_databases, teardown_databases
+
+from bot.bench.scenarios import SCENARIOS, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = "Run named benchmark scenarios, emit JSON and compare against a baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default all): {', '.join(SCENARIOS)}")
+        parser.add_argument('--size', type=int, default=None, help="Override every scenario's problem size")
+        parser.add_argument('--repeat', type=int, default=1, help="Runs per scenario, the best one is kept")
+        parser.add_argument('--output', type=Path, help="Write results JSON here")
+        parser.add_argument('--baseline', type=Path, help="Results JSON to compare against")
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help="Regression threshold in percent of the primary measurement")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the test database between runs")
+        parser.add_argument('--use-default-db', action='store_true',
+                            help="Run against the configured database instead of a throwaway test database")
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        if options['use_default_db']:
+            unsafe = [name for name in names if SCENARIOS[name].test_db_only]
+            if options['scenarios'] and unsafe:
+                raise CommandError(f"Only run against a test database: {', '.join(unsafe)}")
+            if unsafe:
+                self.stderr.write(f"Skipping {', '.join(unsafe)}: only run against a test database")
+                names = [name for name in names if name not in unsafe]
+
+        old_config = None
+        if not options['use_default_db']:
+            old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            results = asyncio.run(self.run_all(names, options))
+        finally:
+            if old_config is not None:
+                self.close_stray_connections()
+                teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        report = {'meta': self.meta(options), 'results': results}
+        if options['output']:
+            options['output'].write_text(json.dumps(report, indent=2, default=str))
+        self.stdout.write(json.dumps(report, indent=2, default=str))
+
+        if options['baseline']:
+            baseline = json.loads(options['baseline'].read_text())['results']
+            rows = compare(results, baseline, options['threshold'])
+            for row in rows:
+                line = (f"{row['scenario']:<16} {row['metric']:<16} {row['baseline']:>12} -> {row['current']:>12} "
+                        f"({row['change_pct']:+.1f}%)")
+                self.stdout.write(self.style.ERROR(line) if row['regression'] else self.style.SUCCESS(line))
+            regressions = [row['scenario'] for row in rows if row['regression']]
+            if regressions:
+                raise CommandError(f"Regressions over {options['threshold']}%: {', '.join(regressions)}")
+
+    async def run_all(self, names, options) -> dict:
+        from bot.client import get_bot
+
+        bot = get_bot()
+        results = {}
+        try:
+            for name in names:
+                self.stderr.write(f"Running {name}...")
+                results[name] = await run_scenario(name, options['size'], options['repeat'])
+        finally:
+            await bot.session.close()
+            await sync_to_async(connections.close_all)()
+        return results
+
+    @staticmethod
+    def close_stray_connections():
+        """Worker threads of the event loop may still hold test database connections"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND pid <> pg_backend_pid()"
+            )
+        connections.close_all()
+
+    @staticmethod
+    def meta(options) -> dict:
+        try:
+            revision = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            revision = None
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': revision,
+            'python': platform.python_version(),
+            'size': options['size'],
+            'repeat': options['repeat'],
+        }
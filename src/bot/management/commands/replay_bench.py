@@ -0,0 +1,126 @@
+import asyncio
+import json
+from pathlib import Path
+
+from django.core.management import BaseCommand, CommandError
+from django.test import override_settings
+from django.test.utils import setup_databases, teardown_databases
+
+from bot.bench.dataset import SEED_USER_ID_START, DatasetGenerator, DatasetOptions, clear_seeded
+from bot.bench.fake_bot_api import FakeBotAPI
+from bot.bench.runner import ReplayRunner, point_bot_at
+from bot.bench.updates import (
+    BENCH_USER_ID_START, DEFAULT_MIX, dump_sessions, generate_sessions, load_sessions, parse_mix, update_user_id,
+)
+from bot.management.commands.bench import Command as BenchCommand
+from order.models import Course, Order
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = "Replay generated or recorded updates against a fake Bot API and report latency and SQL per update"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help="Number of generated user sessions")
+        parser.add_argument('--mix', default=','.join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                            help="Scenario weights, e.g. registration=2,check=5,payment=3")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--input', type=Path, help="Replay sessions or raw updates from a JSONL file")
+        parser.add_argument('--record', type=Path, help="Save the generated sessions to a JSONL file")
+        parser.add_argument('--rate', type=float, default=0, help="Target updates per second, 0 = unthrottled")
+        parser.add_argument('--concurrency', type=int, default=50, help="Sessions in flight at once")
+        parser.add_argument('--target', choices=['dispatcher', 'webhook'], default='dispatcher')
+        parser.add_argument('--latency-ms', type=float, default=30, help="Fake Bot API response delay")
+        parser.add_argument('--jitter-ms', type=float, default=10)
+        parser.add_argument('--rate-429', type=float, default=0, help="Share of Bot API calls answered with 429")
+        parser.add_argument('--output', type=Path, help="Write the report as JSON")
+        parser.add_argument('--keep-users', action='store_true',
+                            help="Keep users created by registration flows and orders created by payment flows")
+        parser.add_argument('--keepdb', action='store_true', help="Reuse the test database between runs")
+        parser.add_argument('--use-default-db', action='store_true',
+                            help="Replay against the configured database and its users instead of a test database")
+        parser.add_argument('--seed-users', type=int, default=1000,
+                            help="Synthetic users seeded into the test database for check and payment flows")
+
+    def handle(self, *args, **options):
+        old_config = None
+        if not options['use_default_db']:
+            old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        try:
+            if old_config is not None and options['seed_users']:
+                clear_seeded(SEED_USER_ID_START, options['seed_users'])
+                DatasetGenerator(DatasetOptions(users=options['seed_users'], seed=options['seed'])).run()
+            report = self.run(options)
+        finally:
+            if old_config is not None:
+                BenchCommand.close_stray_connections()
+                teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        self.stdout.write(json.dumps(report['replay'], indent=2))
+        self.stdout.write(f"Bot API calls: {report['bot_api']}")
+        if report['handlers']:
+            from bot.middleware.query_budget import query_budget_report
+
+            self.stdout.write(query_budget_report.format())
+        if options['output']:
+            options['output'].write_text(json.dumps(report, indent=2))
+
+    def run(self, options) -> dict:
+        if options['input']:
+            sessions = load_sessions(options['input'])
+        else:
+            course_ids = list(Course.objects.values_list('id', flat=True))
+            if not course_ids:
+                raise CommandError("No courses in the database, payment flows need at least one")
+            existing = list(
+                User.objects.filter(telegram_id__lt=BENCH_USER_ID_START)
+                .order_by('?').values_list('telegram_id', flat=True)[:1000]
+            )
+            try:
+                mix = parse_mix(options['mix'])
+            except ValueError as e:
+                raise CommandError(e)
+            sessions = generate_sessions(options['sessions'], course_ids, mix, existing, options['seed'])
+            if options['record']:
+                dump_sessions(sessions, options['record'])
+
+        user_ids = {update_user_id(session[0]) for session in sessions if session}
+        last_order = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        try:
+            # Generated update_ids repeat between runs. Registrations go straight to the
+            # database: nothing flushes the buffer here, a later web process would.
+            with override_settings(UPDATE_DEDUP_ENABLED=False, REGISTRATION_BUFFER_ENABLED=False):
+                return asyncio.run(self.replay(sessions, options))
+        finally:
+            if not options['keep_users']:
+                Order.objects.filter(id__gt=last_order, user_id__in=user_ids).delete()
+                User.objects.filter(
+                    telegram_id__in=[user_id for user_id in user_ids if user_id and user_id >= BENCH_USER_ID_START]
+                ).delete()
+
+    async def replay(self, sessions, options) -> dict:
+        from bot.client import get_bot
+        from bot.middleware.query_budget import query_budget_report
+
+        bot = get_bot()
+        query_budget_report.reset()
+        fake_api = FakeBotAPI(
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            rate_429=options['rate_429'],
+            seed=options['seed'],
+        )
+        async with fake_api:
+            previous = point_bot_at(fake_api.url)
+            try:
+                runner = ReplayRunner(options['rate'], options['concurrency'], options['target'])
+                result = await runner.run(sessions)
+            finally:
+                bot.session.api = previous
+                await bot.session.close()
+
+        return {
+            'replay': result.summary(),
+            'bot_api': fake_api.stats(),
+            'handlers': query_budget_report.as_dict(),
+        }
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import time
+
+from django.core.management import BaseCommand
+
+from bot.utils.dead_letters import DeadLetterQueue
+
+
+class Command(BaseCommand):
+    help = "Feed dead-lettered Telegram updates through the dispatcher again at a controlled rate"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', type=float, default=5, help="Updates per second, 0 = unthrottled")
+        parser.add_argument('--limit', type=int, default=0, help="Replay at most this many updates, 0 = all")
+        parser.add_argument('--after', default='-', help="Start after this stream entry id")
+        parser.add_argument('--until', default='+', help="Stop at this stream entry id (inclusive)")
+        parser.add_argument('--keep', action='store_true', help="Keep replayed entries in the stream")
+        parser.add_argument('--dry-run', action='store_true', help="Only list the dead letters")
+
+    def handle(self, *args, **options):
+        replayed, failed, left = asyncio.run(self.replay(options))
+        if options['dry_run']:
+            self.stdout.write(f"{replayed} dead letters, {left} in the stream")
+            return
+        style = self.style.SUCCESS if not failed else self.style.WARNING
+        self.stdout.write(style(f"Replayed {replayed}, failed {failed}, {left} left in the stream"))
+
+    async def replay(self, options):
+        from bot.client import get_bot
+        from bot.misc import feed_raw_update
+
+        bot = get_bot()
+
+        interval = 1 / options['rate'] if options['rate'] > 0 else 0
+        limit = options['limit']
+        after = options['after']
+        replayed = failed = 0
+        next_at = time.monotonic()
+        try:
+            while not limit or replayed + failed < limit:
+                count = min(100, limit - replayed - failed) if limit else 100
+                entries = await DeadLetterQueue.read(count, after=after, until=options['until'])
+                if not entries:
+                    break
+
+                for entry_id, fields in entries:
+                    after = entry_id
+                    if options['dry_run']:
+                        self.stdout.write(f"{entry_id} update {fields['update_id']}: {fields['error']}")
+                        replayed += 1
+                        continue
+
+                    delay = next_at - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    next_at = max(next_at, time.monotonic()) + interval
+
+                    try:
+                        await feed_raw_update(json.loads(fields['update']), dead_letter_replay=True)
+                    except Exception as e:
+                        failed += 1
+                        self.stderr.write(f"{entry_id} update {fields['update_id']} failed again: {e}")
+                        continue
+                    replayed += 1
+                    if not options['keep']:
+                        await DeadLetterQueue.delete(entry_id)
+            return replayed, failed, await DeadLetterQueue.length()
+        finally:
+            await bot.session.close()
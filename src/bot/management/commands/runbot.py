@@ -1,6 +1,82 @@
+import asyncio
+import signal
+
+from django.conf import settings
 from django.core.management import BaseCommand
 
+from bot.polling import PollingRunner
+from core.asyncdb import pool_context
+from core.jobs import supervisor
+from core.metrics.endpoint import start_metrics_server
+from order.outbox import start_dispatcher
+from users.registration import registration_flusher
+
 
 class Command(BaseCommand):
+    help = "Run the bot with long polling (staging, hosts without public HTTPS)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=settings.POLLING_LIMIT,
+                            help="Updates per getUpdates call (1-100)")
+        parser.add_argument('--timeout', type=int, default=settings.POLLING_TIMEOUT,
+                            help="Long-poll timeout in seconds")
+        parser.add_argument('--concurrency', type=int, default=settings.POLLING_CONCURRENCY,
+                            help="Updates processed at once (same-chat updates stay in order)")
+        parser.add_argument('--max-pending', type=int, default=settings.POLLING_MAX_PENDING,
+                            help="Stop fetching while this many updates wait to be processed")
+        parser.add_argument('--shutdown-timeout', type=float, default=30,
+                            help="Seconds to finish fetched updates on SIGTERM/SIGINT")
+        parser.add_argument('--metrics-port', type=int, default=settings.POLLING_METRICS_PORT,
+                            help=f"Serve {settings.METRICS_PATH} on this port, 0 = off")
+        parser.add_argument('--metrics-host', default='0.0.0.0')
+        parser.add_argument('--reset-offset', action='store_true', help="Forget the saved update offset")
+        parser.add_argument('--drop-pending-updates', action='store_true',
+                            help="Drop updates Telegram queued while the bot was offline")
+
     def handle(self, *args, **options):
-        pass
+        asyncio.run(self.run(options))
+
+    async def run(self, options):
+        from bot.client import get_bot
+        from bot.misc import get_dispatcher, set_commands
+
+        bot = get_bot()
+        # Build the routers first: they register the job kinds that resuming needs
+        aiogram_dispatcher = get_dispatcher()
+        runner = PollingRunner(
+            aiogram_dispatcher, bot,
+            limit=options['limit'],
+            timeout=options['timeout'],
+            concurrency=options['concurrency'],
+            max_pending=options['max_pending'],
+            allowed_updates=aiogram_dispatcher.resolve_used_update_types(),
+        )
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, runner.stop)
+
+        metrics = None
+        if options['metrics_port']:
+            metrics = await start_metrics_server(options['metrics_host'], options['metrics_port'])
+
+        async with pool_context():
+            await supervisor.start()
+            # Post-payment invites are only delivered through the outbox
+            start_dispatcher()
+            try:
+                # getUpdates is refused while a webhook is set
+                await bot.delete_webhook(drop_pending_updates=options['drop_pending_updates'])
+                await set_commands(bot)
+                if options['reset_offset']:
+                    await runner.reset_offset()
+                if settings.REGISTRATION_BUFFER_ENABLED:
+                    registration_flusher.start()
+
+                await runner.run(options['shutdown_timeout'])
+            finally:
+                # Jobs still use the bot session
+                await supervisor.shutdown()
+                await registration_flusher.stop()
+                await bot.session.close()
+                if metrics:
+                    await metrics.cleanup()
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from bot.bench.dataset import SEED_USER_ID_START, SYNTHETIC_ID_FLOOR, DatasetGenerator, DatasetOptions, Distribution, clear_seeded, \
+    parse_weights
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, cards, orders, transactions, subscriptions and channel memberships"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--start-id', type=int, default=SEED_USER_ID_START,
+                            help=f"First telegram_id of the seeded range, at least {SYNTHETIC_ID_FLOOR}")
+        parser.add_argument('--chunk-size', type=int, default=20_000, help="Users written per transaction")
+        parser.add_argument('--payer-ratio', type=float, default=0.5, help="Share of users with a payment history")
+        parser.add_argument('--auto-subscribe-ratio', type=float, default=0.4,
+                            help="Share of payers with auto-renewal and a confirmed card")
+        parser.add_argument('--foreigner-ratio', type=float, default=0.02)
+        parser.add_argument('--card-ratio', type=float, default=0.1, help="Share of non-payers with a saved card")
+        parser.add_argument('--failed-order-ratio', type=float, default=0.05)
+        parser.add_argument('--max-orders', type=int, default=6, help="Most successful orders per payer")
+        parser.add_argument('--expiry', default='uniform:-60:30',
+                            help="Subscription end date in days from today: uniform:LOW:HIGH or normal:MEAN:STDDEV")
+        parser.add_argument('--due-today-ratio', type=float, default=0.0,
+                            help="Share of payers whose subscription ends today (nightly renewal load)")
+        parser.add_argument('--languages', default='uz=0.8,ru=0.2')
+        parser.add_argument('--method', choices=['copy', 'bulk'], default='copy')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--clear', action='store_true', help="Delete the seeded range first")
+        parser.add_argument('--clear-only', action='store_true', help="Delete the seeded range and exit")
+
+    def handle(self, *args, **options):
+        if options['start_id'] < SYNTHETIC_ID_FLOOR:
+            raise CommandError(f"--start-id must be at least {SYNTHETIC_ID_FLOOR}, below it are real Telegram users")
+        if options['clear'] or options['clear_only']:
+            try:
+                deleted = clear_seeded(options['start_id'], options['users'])
+            except ValueError as e:
+                raise CommandError(e)
+            self.stdout.write(f"Deleted: {deleted}")
+            if options['clear_only']:
+                return
+
+        try:
+            dataset_options = DatasetOptions(
+                users=options['users'],
+                start_id=options['start_id'],
+                chunk_size=options['chunk_size'],
+                payer_ratio=options['payer_ratio'],
+                auto_subscribe_ratio=options['auto_subscribe_ratio'],
+                foreigner_ratio=options['foreigner_ratio'],
+                card_ratio=options['card_ratio'],
+                failed_order_ratio=options['failed_order_ratio'],
+                max_orders=options['max_orders'],
+                due_today_ratio=options['due_today_ratio'],
+                expiry=Distribution.parse(options['expiry']),
+                languages=parse_weights(options['languages']),
+                method=options['method'],
+                seed=options['seed'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        started = time.perf_counter()
+
+        def progress(totals):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{totals['users']} users in {elapsed:.1f}s ({totals['users'] / elapsed:.0f}/s)")
+
+        totals = DatasetGenerator(dataset_options).run(progress)
+        self.stdout.write(self.style.SUCCESS(f"Done in {time.perf_counter() - started:.1f}s: {totals}"))
@@ -0,0 +1,95 @@
+from typing import Any, Awaitable, Callable, Dict
+import logging
+
+import redis
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from django.conf import settings
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_UPDATES = REGISTRY.counter(
+    'bot_duplicate_updates_total', "Updates dropped because their update_id was already processed",
+)
+
+# update_ids are sequential: one small set per bucket of ids, expiring UPDATE_DEDUP_TTL after its last id.
+# An update joins the set once its handlers have run; while they run, a short-lived claim keeps
+# concurrent copies (a webhook retry of a slow update) out.
+BUCKET_SIZE = 500
+CLAIM_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[1], ARGV[1]) == 1 then return 0 end
+if ARGV[3] == '1' then
+    redis.call('SET', KEYS[2], 1, 'EX', ARGV[2])
+    return 1
+end
+if redis.call('SET', KEYS[2], 1, 'NX', 'EX', ARGV[2]) then return 1 end
+return 0
+"""
+DONE_SCRIPT = """
+if redis.call('SADD', KEYS[1], ARGV[1]) == 1 then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+redis.call('DEL', KEYS[2])
+"""
+
+
+class UpdateDedupMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: drops updates whose update_id was already processed or is
+    being processed. Dead-letter replays (`dead_letter_replay` in the data) are always
+    processed; updates the polling worker resumes after a restart (`resumed_update`)
+    ignore the claim the previous process left behind, not the processed set.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        if not settings.UPDATE_DEDUP_ENABLED or data.get('dead_letter_replay'):
+            return await handler(event, data)
+
+        if not await self.claim(event.update_id, force=bool(data.get('resumed_update'))):
+            DUPLICATE_UPDATES.inc()
+            logger.info(f"Duplicate update {event.update_id} ignored")
+            return
+        try:
+            result = await handler(event, data)
+        except BaseException:
+            await self.release(event.update_id)
+            raise
+        await self.mark_done(event.update_id)
+        return result
+
+    @staticmethod
+    def _keys(update_id: int) -> list[str]:
+        return [f'updates:seen:{update_id // BUCKET_SIZE}', f'updates:inflight:{update_id}']
+
+    @classmethod
+    async def claim(cls, update_id: int, force: bool = False) -> bool:
+        try:
+            claim = get_redis().register_script(CLAIM_SCRIPT)
+            return bool(await claim(
+                keys=cls._keys(update_id), args=[update_id, settings.UPDATE_DEDUP_INFLIGHT_TTL, int(force)],
+            ))
+        except redis.RedisError as e:
+            # Processing twice beats not processing at all
+            logger.warning(f"Update dedup unavailable: {e}")
+            return True
+
+    @classmethod
+    async def mark_done(cls, update_id: int) -> None:
+        try:
+            done = get_redis().register_script(DONE_SCRIPT)
+            await done(keys=cls._keys(update_id), args=[update_id, settings.UPDATE_DEDUP_TTL])
+        except redis.RedisError as e:
+            logger.warning(f"Could not mark update {update_id} processed: {e}")
+
+    @classmethod
+    async def release(cls, update_id: int) -> None:
+        try:
+            await get_redis().delete(cls._keys(update_id)[1])
+        except redis.RedisError as e:
+            logger.warning(f"Could not release update {update_id}: {e}")
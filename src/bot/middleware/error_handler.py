@@ -3,6 +3,8 @@ from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
 from typing import Callable, Dict, Any, Awaitable
 import logging
 
+from bot.utils.dead_letters import DeadLetterQueue
+
 logger = logging.getLogger(__name__)
 
 class ErrorHandlerMiddleware(BaseMiddleware):
@@ -26,6 +28,12 @@ class ErrorHandlerMiddleware(BaseMiddleware):
             logger.error(f"Telegram error: {e}")
             return
         except Exception as e:
+            if data.get('dead_letter_replay'):
+                # The replay command decides what happens to the dead letter
+                raise
             logger.exception(f"Unhandled error: {e}")
-            # Don't raise - webhook must return 200
+            # Don't raise - webhook must return 200; keep the update for replay instead
+            await DeadLetterQueue.add(
+                event.model_dump(mode='json', exclude_none=True, by_alias=True), e, event_type=event.event_type,
+            )
             return
@@ -0,0 +1,67 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from core.metrics import REGISTRY, observe_queries
+from core.metrics.registry import COUNT_BUCKETS
+
+UPDATE_SECONDS = REGISTRY.histogram(
+    'bot_update_duration_seconds', "Time to process one Telegram update", ('update_type',),
+)
+UPDATE_DB_QUERIES = REGISTRY.histogram(
+    'bot_update_db_queries', "SQL queries executed per update", ('update_type',), buckets=COUNT_BUCKETS,
+)
+UPDATE_DB_SECONDS = REGISTRY.histogram(
+    'bot_update_db_duration_seconds', "Time spent in SQL per update", ('update_type',),
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    'bot_handler_duration_seconds', "Handler run time", ('handler', 'status'),
+)
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: times the whole update and counts its SQL queries.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        update_type = event.event_type
+        start = time.perf_counter()
+        with observe_queries() as stats:
+            try:
+                return await handler(event, data)
+            finally:
+                UPDATE_SECONDS.observe(time.perf_counter() - start, update_type=update_type)
+                UPDATE_DB_QUERIES.observe(stats.count, update_type=update_type)
+                UPDATE_DB_SECONDS.observe(stats.duration, update_type=update_type)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: times the matched handler by its function name.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(handler_object.callback, '__name__', 'unknown') if handler_object else 'unknown'
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            return await handler(event, data)
+        except Exception:
+            status = 'error'
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, handler=name, status=status)
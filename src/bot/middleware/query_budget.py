@@ -0,0 +1,115 @@
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from django.conf import settings
+
+from core.metrics import REGISTRY, QueryLog, observe_queries
+
+logger = logging.getLogger(__name__)
+
+BUDGET_VIOLATIONS = REGISTRY.counter(
+    'bot_query_budget_violations_total', "Handler runs over their SQL query budget", ('handler',),
+)
+REPEATED_QUERIES = REGISTRY.counter(
+    'bot_repeated_query_shapes_total', "Handler runs executing one query shape repeatedly (N+1)", ('handler',),
+)
+
+
+@dataclass
+class HandlerQueryStats:
+    calls: int = 0
+    queries: int = 0
+    max_queries: int = 0
+    budget: int = 0
+    violations: int = 0
+    repeated: Dict[str, int] = field(default_factory=dict)
+
+    def as_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'queries': self.queries,
+            'avg_queries': round(self.queries / self.calls, 2) if self.calls else 0,
+            'max_queries': self.max_queries,
+            'budget': self.budget,
+            'violations': self.violations,
+            'repeated': self.repeated,
+        }
+
+
+class QueryBudgetReport:
+    """Per-handler totals collected by QueryBudgetMiddleware, read after a replay run"""
+
+    def __init__(self):
+        self.handlers: Dict[str, HandlerQueryStats] = {}
+
+    def add(self, handler: str, log: QueryLog, budget: int, repeated: Dict[str, int]) -> None:
+        stats = self.handlers.setdefault(handler, HandlerQueryStats())
+        stats.calls += 1
+        stats.queries += log.count
+        stats.max_queries = max(stats.max_queries, log.count)
+        stats.budget = budget
+        if log.count > budget:
+            stats.violations += 1
+        for shape, count in repeated.items():
+            stats.repeated[shape] = max(stats.repeated.get(shape, 0), count)
+
+    def reset(self) -> None:
+        self.handlers.clear()
+
+    def as_dict(self) -> dict:
+        return {name: stats.as_dict() for name, stats in sorted(self.handlers.items())}
+
+    def format(self) -> str:
+        lines = [f"{'handler':<40} {'calls':>6} {'avg':>6} {'max':>5} {'budget':>6} {'over':>5}"]
+        for name, stats in sorted(self.handlers.items(), key=lambda item: -item[1].max_queries):
+            row = stats.as_dict()
+            lines.append(
+                f"{name:<40} {row['calls']:>6} {row['avg_queries']:>6} {row['max_queries']:>5} "
+                f"{row['budget']:>6} {row['violations']:>5}"
+            )
+            for shape, count in stats.repeated.items():
+                lines.append(f"    {count}x {shape[:160]}")
+        return '\n'.join(lines)
+
+
+query_budget_report = QueryBudgetReport()
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Development/staging inner middleware: records every SQL statement of a handler run,
+    warns when the handler goes over its query budget or repeats a query shape (N+1).
+
+    The budget defaults to QUERY_BUDGET_DEFAULT and can be set per handler with a flag:
+    `@router.callback_query(F.data == "my_cards", flags={"query_budget": 6})`.
+    """
+
+    def __init__(self, report: QueryBudgetReport = query_budget_report):
+        self.report = report
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(handler_object.callback, '__name__', 'unknown') if handler_object else 'unknown'
+        budget = get_flag(data, 'query_budget', default=settings.QUERY_BUDGET_DEFAULT)
+
+        with observe_queries(QueryLog()) as log:
+            try:
+                return await handler(event, data)
+            finally:
+                repeated = log.repeated(settings.QUERY_REPEAT_THRESHOLD)
+                self.report.add(name, log, budget, repeated)
+                if log.count > budget:
+                    BUDGET_VIOLATIONS.inc(handler=name)
+                    logger.warning(f"Handler {name} ran {log.count} queries, budget is {budget}")
+                if repeated:
+                    REPEATED_QUERIES.inc(handler=name)
+                    for shape, count in repeated.items():
+                        logger.warning(f"Handler {name} repeated a query {count} times: {shape}")
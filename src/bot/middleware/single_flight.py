@@ -0,0 +1,91 @@
+"""
+Per-user single-flight guard for expensive handlers (payments, card confirmation).
+
+A handler opts in with a flag naming its action:
+`@router.callback_query(F.data.startswith("make_payment_"), flags={"single_flight": "make_payment"})`.
+While one run of the action is in flight for a user, their repeated presses are
+answered with a short "processing" notice instead of running the handler again
+(a new order, a new Click request). The in-flight marker is a Redis key taken with
+SET NX; it is released when the handler returns, and expires after
+SINGLE_FLIGHT_TTL in case the process dies mid-run.
+"""
+import logging
+import uuid
+from typing import Any, Awaitable, Callable, Dict
+
+import redis
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery, Message
+from django.conf import settings
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_PRESSES = REGISTRY.counter(
+    'bot_single_flight_rejected_total', "Handler runs skipped because the same action was in flight", ('action',),
+)
+
+KEY = 'inflight:{}:{}'
+PROCESSING_TEXT = "⏳ So'rovingiz bajarilmoqda, iltimos kuting."
+
+# Delete the key only while it still holds our token: after the TTL it may belong to a newer run
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlightMiddleware(BaseMiddleware):
+    """Inner middleware: one in-flight run per user of handlers flagged with `single_flight`"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        action = get_flag(data, 'single_flight')
+        user = getattr(event, 'from_user', None)
+        if not settings.SINGLE_FLIGHT_ENABLED or not action or user is None:
+            return await handler(event, data)
+
+        key = KEY.format(action, user.id)
+        token = uuid.uuid4().hex
+        if not await self.acquire(key, token):
+            DUPLICATE_PRESSES.inc(action=action)
+            logger.info(f"Duplicate {action} from {user.id} ignored")
+            await self.answer_duplicate(event)
+            return
+
+        try:
+            return await handler(event, data)
+        finally:
+            await self.release(key, token)
+
+    @staticmethod
+    async def acquire(key: str, token: str) -> bool:
+        try:
+            return bool(await get_redis().set(key, token, nx=True, ex=settings.SINGLE_FLIGHT_TTL))
+        except redis.RedisError as e:
+            # Running twice beats not running at all
+            logger.warning(f"Single-flight guard unavailable: {e}")
+            return True
+
+    @staticmethod
+    async def release(key: str, token: str) -> None:
+        try:
+            release = get_redis().register_script(RELEASE_SCRIPT)
+            await release(keys=[key], args=[token])
+        except redis.RedisError as e:
+            logger.warning(f"Could not release {key}: {e}")
+
+    @staticmethod
+    async def answer_duplicate(event: Any) -> None:
+        # A toast for button presses, a short reply for messages
+        if isinstance(event, (CallbackQuery, Message)):
+            await event.answer(PROCESSING_TEXT)
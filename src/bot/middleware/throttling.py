@@ -0,0 +1,164 @@
+"""
+Per-user flood throttling of messages and button presses.
+
+Every handler run of a user counts against a sliding window of its handler group:
+the `throttle` flag of the handler (`flags={"throttle": "status"}`), or 'default'.
+Windows live in Redis sorted sets, so the limit holds across webhook workers
+and the polling worker. Groups and their policies are THROTTLE_POLICIES:
+
+- 'drop': ignore the event;
+- 'delay': wait for the window to free up, at most THROTTLE_MAX_DELAY_SECONDS, then drop;
+- 'answer': tell the user to wait with a callback answer (messages are dropped).
+
+A local pre-filter spares Redis the bulk of a flood: a process that already saw
+`limit` events of the key inside the window, or was told by Redis that the key is
+blocked, rejects without asking Redis. A throttled user only waits on their own
+key; nothing is shared with other users' updates.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict
+
+import redis
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import CallbackQuery
+from django.conf import settings
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+THROTTLED_EVENTS = REGISTRY.counter(
+    'bot_throttled_events_total', "Messages and button presses held back by the flood throttle", ('group', 'action'),
+)
+
+KEY = 'throttle:{}:{}'
+COOLDOWN_TEXT = "⏳ Juda tez! {} soniyadan so'ng qayta urinib ko'ring."
+
+# KEYS[1]: sorted set of event times; ARGV: window (ms), limit, unique member.
+# Records the event and returns 0, or returns the milliseconds until the window has room.
+WINDOW_SCRIPT = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local window = tonumber(ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], window)
+    return 0
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+return math.max(1, tonumber(oldest[2]) + window - now)
+"""
+
+
+@dataclass(frozen=True)
+class ThrottlePolicy:
+    limit: int
+    window: float
+    action: str = 'drop'
+
+
+def get_policy(group: str) -> ThrottlePolicy:
+    policies = settings.THROTTLE_POLICIES
+    return ThrottlePolicy(*policies.get(group, policies['default']))
+
+
+class LocalPreFilter:
+    """Per-process view of the windows; only ever rejects events Redis would reject too"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._events: 'OrderedDict[str, deque[float]]' = OrderedDict()
+        self._blocked: Dict[str, float] = {}
+
+    def check(self, key: str, policy: ThrottlePolicy) -> float:
+        """Seconds the key is known to be blocked for, 0 when Redis has to decide"""
+        now = time.monotonic()
+        until = self._blocked.get(key)
+        if until is not None:
+            if until > now:
+                return until - now
+            del self._blocked[key]
+
+        events = self._events.get(key)
+        if events is None:
+            return 0
+        while events and events[0] <= now - policy.window:
+            events.popleft()
+        if len(events) >= policy.limit:
+            return events[0] + policy.window - now
+        return 0
+
+    def record(self, key: str, policy: ThrottlePolicy) -> None:
+        events = self._events.get(key)
+        if events is None:
+            events = self._events[key] = deque(maxlen=policy.limit)
+            if len(self._events) > self.max_keys:
+                self._events.popitem(last=False)
+        else:
+            self._events.move_to_end(key)
+        events.append(time.monotonic())
+
+    def block(self, key: str, seconds: float) -> None:
+        if len(self._blocked) > self.max_keys:
+            now = time.monotonic()
+            self._blocked = {key: until for key, until in self._blocked.items() if until > now}
+        self._blocked[key] = time.monotonic() + seconds
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Inner middleware of messages and callback queries: per-user sliding windows per handler group"""
+
+    def __init__(self, local: LocalPreFilter = None):
+        self.local = local or LocalPreFilter()
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        user = getattr(event, 'from_user', None)
+        if not settings.THROTTLE_ENABLED or user is None:
+            return await handler(event, data)
+
+        group = get_flag(data, 'throttle', default='default')
+        policy = get_policy(group)
+        key = KEY.format(group, user.id)
+
+        wait = await self.hit(key, policy)
+        if wait and policy.action == 'delay' and wait <= settings.THROTTLE_MAX_DELAY_SECONDS:
+            await asyncio.sleep(wait)
+            wait = await self.hit(key, policy)
+        if not wait:
+            return await handler(event, data)
+
+        THROTTLED_EVENTS.inc(group=group, action=policy.action)
+        logger.info(f"Throttled {group} of user {user.id} for {wait:.1f}s")
+        if policy.action == 'answer' and isinstance(event, CallbackQuery):
+            await event.answer(COOLDOWN_TEXT.format(max(1, round(wait))))
+
+    async def hit(self, key: str, policy: ThrottlePolicy) -> float:
+        """Count the event; returns 0 when it may run, else the seconds until the window has room"""
+        wait = self.local.check(key, policy)
+        if wait:
+            return wait
+        try:
+            window = get_redis().register_script(WINDOW_SCRIPT)
+            wait_ms = await window(keys=[key], args=[int(policy.window * 1000), policy.limit, uuid.uuid4().hex])
+        except redis.RedisError as e:
+            # Fall back to the local windows only
+            logger.warning(f"Throttle unavailable: {e}")
+            wait_ms = 0
+        if wait_ms:
+            self.local.block(key, wait_ms / 1000)
+            return wait_ms / 1000
+        self.local.record(key, policy)
+        return 0
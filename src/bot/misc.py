@@ -1,22 +1,29 @@
-import asyncio
+"""
+Dispatcher and bot lifecycle of the web process (and `manage.py runbot`).
 
+Nothing is built at import: the dispatcher, with the routers and their handlers,
+is created by the first `get_dispatcher()` call, the bot by `bot.client.get_bot()`.
+"""
 from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
 from aiogram.types import Update
 from django.conf import settings
 from loguru import logger
 
+from core.jobs import supervisor
 from .helpers import get_bot_webhook_url
+from .middleware.dedup import UpdateDedupMiddleware
 from .middleware.error_handler import ErrorHandlerMiddleware
-from .routers import router
+from .middleware.metrics import HandlerMetricsMiddleware, UpdateMetricsMiddleware
+from .middleware.query_budget import QueryBudgetMiddleware, query_budget_report
+from .middleware.single_flight import SingleFlightMiddleware
+from .middleware.throttling import ThrottlingMiddleware
+from .client import get_bot
+from .polling import PollingRunner
 from .utils.storage import DjangoRedisStorage
+from users.registration import registration_flusher
 from aiogram.types import BotCommand, BotCommandScopeDefault
 
-
-bot = Bot(
-    token=settings.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-)
+_dispatcher: Dispatcher | None = None
 
 
 async def set_commands(bot: Bot):
@@ -31,13 +38,20 @@ async def set_commands(bot: Bot):
 
 
 async def on_startup():
+    bot = get_bot()
+    aiogram_dispatcher = get_dispatcher()
     await set_commands(bot)
 
+    if settings.REGISTRATION_BUFFER_ENABLED:
+        registration_flusher.start()
+
     if settings.DEBUG is False:
         webhook_info = await bot.get_webhook_info()
-        if webhook_info.url != get_bot_webhook_url():
+        allowed_updates = aiogram_dispatcher.resolve_used_update_types()
+        if webhook_info.url != get_bot_webhook_url() or set(webhook_info.allowed_updates or ()) != set(allowed_updates):
             await bot.set_webhook(
-                get_bot_webhook_url(), secret_token=settings.BOT_WEBHOOK_SECRET
+                get_bot_webhook_url(), secret_token=settings.BOT_WEBHOOK_SECRET,
+                allowed_updates=allowed_updates,
             )
     else:
         # 🛠 Delete webhook before polling
@@ -46,30 +60,72 @@ async def on_startup():
 
 
 async def on_shutdown():
-    await bot.session.close()
+    await registration_flusher.stop()
+    await get_bot().session.close()
+    if settings.QUERY_BUDGET_ENABLED and query_budget_report.handlers:
+        logger.info(f"Query budget report:\n{query_budget_report.format()}")
     logger.info("Bot shut down")
 
 
 def init_dispatcher():
-    dp = Dispatcher(storage=DjangoRedisStorage())
+    from .routers import router
+
+    dp = Dispatcher(storage=DjangoRedisStorage(state_ttl=settings.FSM_STATE_TTL, data_ttl=settings.FSM_DATA_TTL))
+
+    # Outermost, so the timings include the error handler and every query of the update
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Telegram retries and replayed webhooks must not run the handlers twice
+    dp.update.outer_middleware(UpdateDedupMiddleware())
 
     # Register error handler middleware
     dp.update.middleware(ErrorHandlerMiddleware())
 
+    # Inner middlewares of the root router apply to the handlers of every included router
+    throttling = ThrottlingMiddleware()
+    for event_name, observer in dp.observers.items():
+        if event_name not in ('update', 'error'):
+            observer.middleware(HandlerMetricsMiddleware())
+            if event_name in ('message', 'callback_query'):
+                observer.middleware(throttling)
+            # Before the query budget: a skipped duplicate runs no queries
+            observer.middleware(SingleFlightMiddleware())
+            if settings.QUERY_BUDGET_ENABLED:
+                observer.middleware(QueryBudgetMiddleware())
+
     dp.include_router(router)
     return dp
 
 
-aiogram_dispatcher = init_dispatcher()
+def get_dispatcher() -> Dispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = init_dispatcher()
+    return _dispatcher
 
 
 async def feed_update(update: Update):
-    await aiogram_dispatcher.feed_update(bot, update)
+    await get_dispatcher().feed_update(get_bot(), update)
+
+
+async def feed_raw_update(update: dict, **kwargs):
+    await get_dispatcher().feed_raw_update(get_bot(), update, **kwargs)
 
 
-async def feed_raw_update(update: dict):
-    await aiogram_dispatcher.feed_raw_update(bot, update)
+@supervisor.kind('polling', max_queued=0, on_shutdown='drain')
+async def polling_job(job):
+    """Development polling inside the web process; finishes the fetched updates on shutdown"""
+    aiogram_dispatcher = get_dispatcher()
+    runner = PollingRunner(
+        aiogram_dispatcher, get_bot(),
+        limit=settings.POLLING_LIMIT,
+        timeout=settings.POLLING_TIMEOUT,
+        concurrency=settings.POLLING_CONCURRENCY,
+        max_pending=settings.POLLING_MAX_PENDING,
+        allowed_updates=aiogram_dispatcher.resolve_used_update_types(),
+    )
+    job.on_stop(runner.stop)
+    await runner.run(shutdown_timeout=settings.BACKGROUND_JOBS_SHUTDOWN_TIMEOUT)
 
 
 def run_polling():
-    asyncio.create_task(aiogram_dispatcher.start_polling(bot, handle_signals=False))
+    supervisor.submit('polling')
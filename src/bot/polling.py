@@ -0,0 +1,202 @@
+"""
+Long-polling worker behind `manage.py runbot`.
+
+Updates are fetched in batches with getUpdates and processed concurrently, up to
+`concurrency` at a time, while updates of the same chat run strictly in arrival
+order. Fetching pauses while `max_pending` updates are waiting, so a crash loses
+at most that many. The offset of the oldest unfinished update is saved in Redis,
+so a restarted worker resumes where the previous one stopped. Updates it fetches
+again below the previous worker's last fetch are fed with `resumed_update=True`:
+the dedup middleware then skips the ones that finished, not the ones that were
+still running.
+"""
+import asyncio
+import logging
+import time
+
+import redis
+from aiogram import Bot, Dispatcher
+from aiogram.dispatcher.middlewares.user_context import UserContextMiddleware
+from aiogram.exceptions import TelegramConflictError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import Update
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+POLLING_UPDATES = REGISTRY.counter(
+    'bot_polling_updates_total', "Updates processed by the polling worker", ('status',),
+)
+POLLING_BATCH_SIZE = REGISTRY.histogram(
+    'bot_polling_batch_size', "Updates returned by one getUpdates call",
+    buckets=(0, 1, 5, 10, 25, 50, 100),
+)
+POLLING_FETCH_SECONDS = REGISTRY.histogram(
+    'bot_polling_fetch_duration_seconds', "getUpdates round trip, including the long-poll wait",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+POLLING_PENDING = REGISTRY.gauge(
+    'bot_polling_pending_updates', "Fetched updates not processed yet",
+)
+POLLING_FETCH_ERRORS = REGISTRY.counter(
+    'bot_polling_fetch_errors_total', "Failed getUpdates calls", ('error',),
+)
+
+MAX_BACKOFF = 30
+
+
+def ordering_key(update: Update) -> int:
+    """Chat (or user) the update belongs to; updates without one are independent"""
+    context = UserContextMiddleware.resolve_event_context(update)
+    if context.chat:
+        return context.chat.id
+    if context.user:
+        return context.user.id
+    return -update.update_id
+
+
+class PollingRunner:
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, *, limit: int = 100, timeout: int = 30,
+                 concurrency: int = 50, max_pending: int = 1000, allowed_updates: list[str] = None):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.limit = limit
+        self.timeout = timeout
+        self.max_pending = max(max_pending, limit)
+        self.allowed_updates = allowed_updates
+        self.offset_key = f'bot:polling:offset:{bot.id}'
+        self.fetched_key = f'bot:polling:fetched:{bot.id}'
+
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tails: dict[int, asyncio.Task] = {}
+        self._pending: set[int] = set()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopping = asyncio.Event()
+        self._next_offset: int | None = None
+        self._saved_offset: int | None = None
+        self._saved_fetched: int | None = None
+        # Updates below this were fetched by the previous worker
+        self._resume_below: int | None = None
+
+    def stop(self) -> None:
+        """Stop fetching; `run()` returns once the fetched updates are processed"""
+        self._stopping.set()
+
+    async def run(self, shutdown_timeout: float = 30) -> None:
+        self._next_offset, self._resume_below = await self.load_offset()
+        logger.info(f"Polling started at offset {self._next_offset}")
+        try:
+            await self._fetch_loop()
+        finally:
+            try:
+                await asyncio.wait_for(self._idle.wait(), shutdown_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"{len(self._pending)} updates still running after {shutdown_timeout}s, cancelling")
+                for task in list(self._tails.values()):
+                    task.cancel()
+            await self.save_offset()
+            logger.info(f"Polling stopped at offset {self._saved_offset}")
+
+    async def _fetch_loop(self) -> None:
+        backoff = 1
+        while not self._stopping.is_set():
+            # Back-pressure: don't confirm more updates to Telegram than we are able to work through
+            while len(self._pending) >= self.max_pending and not self._stopping.is_set():
+                await asyncio.sleep(0.05)
+
+            start = time.perf_counter()
+            fetch = asyncio.ensure_future(self.bot.get_updates(
+                offset=self._next_offset, limit=self.limit, timeout=self.timeout,
+                allowed_updates=self.allowed_updates, request_timeout=self.timeout + 10,
+            ))
+            stopping = asyncio.ensure_future(self._stopping.wait())
+            await asyncio.wait({fetch, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            stopping.cancel()
+            if not fetch.done():
+                # Stopped during the long poll, nothing was confirmed by it
+                fetch.cancel()
+                break
+
+            try:
+                updates = fetch.result()
+            except TelegramRetryAfter as e:
+                POLLING_FETCH_ERRORS.inc(error='retry_after')
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError, TelegramConflictError) as e:
+                POLLING_FETCH_ERRORS.inc(error=type(e).__name__)
+                logger.error(f"getUpdates failed, retrying in {backoff}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = 1
+
+            POLLING_FETCH_SECONDS.observe(time.perf_counter() - start)
+            POLLING_BATCH_SIZE.observe(len(updates))
+            for update in updates:
+                self._submit(update)
+                self._next_offset = update.update_id + 1
+            if updates:
+                await self.save_offset()
+
+    def _submit(self, update: Update) -> None:
+        key = ordering_key(update)
+        self._pending.add(update.update_id)
+        self._idle.clear()
+        POLLING_PENDING.set(len(self._pending))
+
+        task = asyncio.create_task(self._process(update, self._tails.get(key)))
+        self._tails[key] = task
+        task.add_done_callback(lambda done: self._done(key, update.update_id, done))
+
+    async def _process(self, update: Update, previous: asyncio.Task | None) -> None:
+        if previous is not None:
+            # Same chat: wait for the earlier update, whatever its outcome
+            await asyncio.wait({previous})
+        async with self._semaphore:
+            try:
+                resumed = self._resume_below is not None and update.update_id < self._resume_below
+                await self.dispatcher.feed_update(self.bot, update, resumed_update=resumed)
+            except Exception as e:
+                POLLING_UPDATES.inc(status='error')
+                logger.exception(f"Update {update.update_id} failed: {e}")
+            else:
+                POLLING_UPDATES.inc(status='ok')
+
+    def _done(self, key: int, update_id: int, task: asyncio.Task) -> None:
+        if self._tails.get(key) is task:
+            del self._tails[key]
+        self._pending.discard(update_id)
+        POLLING_PENDING.set(len(self._pending))
+        if not self._pending:
+            self._idle.set()
+
+    def committed_offset(self) -> int | None:
+        """Oldest unfinished update, or the next one to fetch when nothing is running"""
+        return min(self._pending) if self._pending else self._next_offset
+
+    async def load_offset(self) -> tuple[int | None, int | None]:
+        """The saved offset and the next offset the previous worker would have fetched"""
+        try:
+            offset, fetched = await get_redis().mget(self.offset_key, self.fetched_key)
+        except redis.RedisError as e:
+            logger.warning(f"Could not load the polling offset: {e}")
+            return None, None
+        return int(offset) if offset else None, int(fetched) if fetched else None
+
+    async def save_offset(self) -> None:
+        offset = self.committed_offset()
+        fetched = self._next_offset or offset
+        if offset is None or (offset, fetched) == (self._saved_offset, self._saved_fetched):
+            return
+        try:
+            await get_redis().mset({self.offset_key: offset, self.fetched_key: fetched})
+        except redis.RedisError as e:
+            logger.warning(f"Could not save the polling offset: {e}")
+            return
+        self._saved_offset, self._saved_fetched = offset, fetched
+
+    async def reset_offset(self) -> None:
+        await get_redis().delete(self.offset_key, self.fetched_key)
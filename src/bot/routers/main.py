@@ -1,9 +1,7 @@
 import asyncio
 import logging
-import time
 from datetime import timedelta, datetime
 
-import aiohttp
 from aiogram import F, Bot
 from aiogram import Router, types
 from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
@@ -14,24 +12,34 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQu
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.core.cache import cache
 from django.utils import timezone
 
 from bot.data.states import UserStates, UserCardStates
-from bot.functions import mask_middle, generate_auth_header, get_main_menu_button, get_main_menu_keyboard
+from bot.client import get_bot
+from bot.functions import mask_middle, get_main_menu_button, get_main_menu_keyboard, \
+    aget_user_language, aset_user_language
 from bot.helpers import get_or_create_user_with_state, get_subscription_status
 from bot.keyboards import get_main_menu, get_menu_back_keyboard, back_menu_button, get_mini_menu_keyboard, \
     get_mini_back_keyboard
+from core.asyncdb import get_user, get_user_card
+from core.jobs import JobRejected, supervisor
+from core.replica import read_replica
+from core.resilience import ServiceUnavailable, bulk_traffic
 from core.utils.constants import CONSTANTS
-from order.models import Course, Order, PrivateChannel, Transaction
+from order.click_up.client import click_request, generate_auth_header
+from order.models import Course, Order, OutboxMessage, PrivateChannel, Transaction
+from order.services import SubscriptionLedger
 from users.models import User, UserCard
-from bot.tasks import send_video_to_users_task, copy_video_to_users_task
+from users.registration import RegistrationBuffer
+from users.snapshot import SnapshotCache
 
 
 logger = logging.getLogger(__name__)
 
 router = Router()
 
+CLICK_UNAVAILABLE_TEXT = "⏳ Click to'lov tizimi vaqtincha javob bermayapti. Birozdan so'ng qayta urinib ko'ring."
+
 
 def get_back_keyboard():
     """Create back to main menu keyboard"""
@@ -53,11 +61,11 @@ async def register_user(user_id, username, first_name, last_name):
     return user, created
 
 
-@router.message(Command("start"))
+@router.message(Command("start"), flags={"throttle": "start"})
 async def cmd_start(message: types.Message, state: FSMContext):
     """Handle /start command"""
     telegram_id = message.from_user.id
-    user = await User.objects.filter(telegram_id=telegram_id).afirst()
+    user = await get_user(telegram_id)
     if not user:
         await state.set_state(UserStates.name)
         await message.answer('Ismingizni kiriting:')
@@ -70,13 +78,18 @@ async def cmd_start(message: types.Message, state: FSMContext):
         await message.answer(message_text, reply_markup=get_mini_menu_keyboard())
 
 
-@router.message(Command('check'))
+@router.message(Command('check'), flags={"throttle": "status"})
 async def cmd_check(message: types.Message, state: FSMContext):
-    user = await get_or_create_user_with_state(message, state)
-    if not user:
-        return
+    await state.clear()
+    # Cache hit: no database query at all
+    status = await get_subscription_status(message.from_user.id, message.bot)
+    if status is None:
+        user = await get_or_create_user_with_state(message, state)
+        if not user:
+            return
+        status = await get_subscription_status(user.telegram_id, message.bot, user=user)
 
-    text, keyboard, _ = await get_subscription_status(user, message.from_user.id, message.bot)
+    text, keyboard, _ = status
     await message.answer(text, reply_markup=keyboard)
 
 
@@ -137,13 +150,13 @@ async def admin_panel(message: types.Message):
     """Admin panel - accessible only to staff"""
     user_id = message.from_user.id
 
-    user_lang = cache.get(f"user_lang:{user_id}")
+    user_lang = await aget_user_language(user_id, default=None)
     if not user_lang:
         user = await User.objects.aget(telegram_id=user_id)
         user_lang = user.language
-        cache.set(f"user_lang:{user_id}", user_lang, timeout=None)
+        await aset_user_language(user_id, user_lang)
     else:
-        user = await User.objects.filter(telegram_id=user_id).afirst()
+        user = await get_user(user_id)
 
     if not user.is_staff:
         if user.language == CONSTANTS.LANGUAGES.RU:
@@ -177,9 +190,13 @@ async def admin_panel(message: types.Message):
         await message.answer(text, reply_markup=keyboard.as_markup())
 
 
-@router.message(UserStates.name)
+@router.message(UserStates.name, F.text, flags={"throttle": "input"})
 async def handle_user_name(message: types.Message, state: FSMContext):
-    name = message.text
+    # Longer names would fail the insert of the whole registration batch
+    name = message.text.strip()[:User._meta.get_field('first_name').max_length]
+    if not name:
+        await message.answer("Ismingizni kiriting:")
+        return
     await state.update_data(
         name=name
     )
@@ -188,27 +205,38 @@ async def handle_user_name(message: types.Message, state: FSMContext):
                         '(Masalan: 998901234567)')
 
 
-@router.message(UserStates.phone)
+@router.message(UserStates.phone, F.text, flags={"throttle": "input"})
 async def handle_user_phone(message: types.Message, state: FSMContext):
     telegram_id = message.from_user.id
-    phone = message.text
+    phone = message.text.strip()
+    if not phone or len(phone) > User._meta.get_field('phone').max_length:
+        await message.answer('Telefon raqamingizni kiriting:\n'
+                             '(Masalan: 998901234567)')
+        return
 
     data = await state.get_data()
 
-    user, _ = await User.objects.aget_or_create(
-        telegram_id=telegram_id,
-        defaults={
-            "first_name": data.get('name'),
-            "last_name": message.from_user.last_name,
-            "phone": phone
-        }
-    )
+    fields = {
+        "first_name": data.get('name'),
+        "last_name": message.from_user.last_name,
+        "phone": phone
+    }
+    if settings.REGISTRATION_BUFFER_ENABLED:
+        await RegistrationBuffer.add(telegram_id, **fields)
+    else:
+        await User.objects.aget_or_create(telegram_id=telegram_id, defaults=fields)
 
     await state.clear()
 
     await message.answer("Menyu:", reply_markup=get_mini_menu_keyboard())
 
 
+@router.message(StateFilter(UserStates.name, UserStates.phone), flags={"throttle": "input"})
+async def handle_registration_non_text(message: types.Message):
+    """Photos, stickers and the like sent instead of the name or phone"""
+    await message.answer("Iltimos, javobni matn ko'rinishida yuboring.")
+
+
 @router.callback_query(lambda c: c.data == 'subscription_info')
 async def handle_subscription_info(callback_query: CallbackQuery, state: FSMContext):
     text = (
@@ -372,7 +400,7 @@ async def handle_payment_type(callback: types.CallbackQuery, state: FSMContext):
     )
 
 
-@router.callback_query(F.data.startswith("click_payment_"))
+@router.callback_query(F.data.startswith("click_payment_"), flags={"throttle": "payment"})
 async def click_payment(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
@@ -385,11 +413,7 @@ async def click_payment(callback: types.CallbackQuery, state: FSMContext):
 
     user_id = callback.from_user.id
 
-    order = await Order.objects.acreate(
-        user_id=user_id,
-        course_id=course.id,
-        amount=course.amount,
-    )
+    order = await Order.objects.aget_or_create_pending(user_id=user_id, course=course)
 
     base_url = "https://my.click.uz/services/pay"
     return_url = ""
@@ -473,7 +497,7 @@ async def handle_course_subscription(callback: types.CallbackQuery, state: FSMCo
     )
 
 
-@router.callback_query(F.data.startswith("make_payment_"))
+@router.callback_query(F.data.startswith("make_payment_"), flags={"single_flight": "make_payment", "throttle": "payment"})
 async def handle_make_payment(callback: types.CallbackQuery, state: FSMContext):
     telegram_id = callback.from_user.id
     await state.clear()
@@ -497,11 +521,7 @@ async def handle_make_payment(callback: types.CallbackQuery, state: FSMContext):
         await callback.message.edit_text("❌ Karta topilmadi yoki tasdiqlanmagan.", reply_markup=get_main_menu_keyboard())
         return
 
-    order = await Order.objects.acreate(
-        user=user,
-        amount=course.amount,
-        course=course
-    )
+    order = await Order.objects.aget_or_create_pending(user_id=user.telegram_id, course=course)
 
     url = f'{settings.CLICK_BASE_URL}/payment'
 
@@ -517,9 +537,11 @@ async def handle_make_payment(callback: types.CallbackQuery, state: FSMContext):
         "amount": float(course.amount),
         "transaction_parameter": str(order.id)
     }
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            res_json = await response.json()
+    try:
+        res_json = await click_request('POST', url, headers=headers, json=payload)
+    except ServiceUnavailable:
+        await callback.message.edit_text(CLICK_UNAVAILABLE_TEXT, reply_markup=get_main_menu_keyboard())
+        return
 
     if res_json.get("error_code") == -5017:
         order.status = CONSTANTS.PaymentStatus.FAILED
@@ -538,73 +560,20 @@ async def handle_make_payment(callback: types.CallbackQuery, state: FSMContext):
         )
         return
 
-    order.status = CONSTANTS.PaymentStatus.SUCCESS
-    order.payment_id = res_json.get("payment_id")
-    await order.asave()
-
-    user.is_auto_subscribe = True
-    user.is_subscribed = True
-
-    if user.subscription_start_date is None:
-        user.subscription_start_date = timezone.now().date()
-
-    if user.subscription_end_date is None:
-        user.subscription_end_date = timezone.now().date() + timedelta(days=course.period)
-    else:
-        user.subscription_end_date = user.subscription_end_date + timedelta(days=course.period)
-
-    await user.asave()
-
-    private_channel = await PrivateChannel.objects.filter(course=course).afirst()
-
-    if not private_channel:
-        await callback.message.answer("❌ Kanal topilmadi.")
-        return
-
-    expire_timestamp = int(time.time() + 3600)
-
-    try:
-        invite_link = await callback.bot.create_chat_invite_link(
-            chat_id=private_channel.private_channel_id,
-            name=f"User_{telegram_id}",
-            member_limit=1,
-            creates_join_request=False,
-            expire_date=expire_timestamp
-        )
-    except Exception as e:
-        await callback.message.edit_text("❌ Taklif havolasini yaratishda xatolik yuz berdi.", reply_markup=get_main_menu_keyboard())
-        return
-
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(
-                text="Yopiq Kanal yoki guruhga ulanish",
-                url=invite_link.invite_link
-            )
-        ],
-        [
-            InlineKeyboardButton(
-                text="Savol berish",
-                url='https://t.me/yolda_korishamiz_support'
-            )
-        ],
-        [get_main_menu_button()]
-    ])
+    # The invite link is sent by the outbox dispatcher once the extension is committed
+    await SubscriptionLedger.aextend(
+        order, is_auto_subscribe=True, payment_id=res_json.get("payment_id"),
+        notification=OutboxMessage.Kind.SUBSCRIPTION_PAID,
+    )
 
     await callback.message.edit_text(
-        "✅ *Tabriklaymiz!*\n\n"
-        f"Sizning {course.name} to'lovingiz muvaffaqiyatli qabul qilindi — endi yopiq kanal yoki guruh siz uchun ochiq!\n\n"
-        "👉 Avvalo pastdagi havolani bosib kanalga yoki guruhga o'ting.\n"
-        "🔔 So'ngra kanalda yoki guruhda *\"Подписаться\"* tugmasini bosib, a'zo bo'ling.\n\n"
-        "⚡️ *Eslatma:* tugma faqat 1 soat davomida faol!\n"
-        "🔁 Agar havola ishlamasa, birozdan so'ng yana urinib ko'ring.\n\n"
-        "👇 Pastdagi *\"Yopiq kanal yoki guruhga o'tish\"* tugmasini bosing va yangi bosqichni boshlang!",
-        parse_mode="Markdown",
-        reply_markup=keyboard
+        "✅ To'lovingiz qabul qilindi!\n\n"
+        "🔗 Yopiq kanal yoki guruhga ulanish havolasi bir necha soniyada alohida xabar bilan yuboriladi.",
+        reply_markup=get_main_menu_keyboard()
     )
 
 
-@router.message(UserCardStates.card_number)
+@router.message(UserCardStates.card_number, flags={"throttle": "input"})
 async def handle_card_number(message: types.Message, state: FSMContext):
     raw_input = message.text
     card_number = raw_input.replace(" ", "")
@@ -619,7 +588,7 @@ async def handle_card_number(message: types.Message, state: FSMContext):
     await message.answer("✅ Endi karta tugash muddatini kiriting. Masalan: 06/29")
 
 
-@router.message(UserCardStates.card_pan)
+@router.message(UserCardStates.card_pan, flags={"single_flight": "add_card", "throttle": "input"})
 async def handle_card_pan(message: types.Message, state: FSMContext):
     card_pan = message.text
     if '/' not in card_pan:
@@ -650,12 +619,15 @@ async def handle_card_pan(message: types.Message, state: FSMContext):
     url = f'{settings.CLICK_BASE_URL}/request'
 
     try:
-        timeout = aiohttp.ClientTimeout(total=15)
-
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                res_json = await response.json()
+        res_json = await click_request('POST', url, headers=headers, json=payload)
 
+    except ServiceUnavailable:
+        await state.clear()
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🔒 Obuna bo'lish", callback_data="subscribe_private_channel")]
+        ])
+        await message.answer(CLICK_UNAVAILABLE_TEXT, reply_markup=keyboard)
+        return
     except asyncio.TimeoutError:
         await state.clear()
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -694,6 +666,9 @@ async def handle_card_pan(message: types.Message, state: FSMContext):
     user = await User.objects.aget(telegram_id=message.from_user.id)
     marked_pan = mask_middle(card_number)
 
+    # A new token replaces any card the user started adding but never confirmed
+    await UserCard.objects.filter(user=user, is_confirmed=False).adelete()
+
     await UserCard.objects.acreate(
         user=user,
         marked_pan=marked_pan,
@@ -705,7 +680,7 @@ async def handle_card_pan(message: types.Message, state: FSMContext):
     await state.set_state(UserCardStates.confirmation)
 
 
-@router.message(UserCardStates.confirmation)
+@router.message(UserCardStates.confirmation, flags={"single_flight": "confirm_card", "throttle": "input"})
 async def handle_confirmation(message: types.Message, state: FSMContext):
     sms_code = message.text
     if not sms_code.isdigit() or len(sms_code) != 6:
@@ -729,9 +704,12 @@ async def handle_confirmation(message: types.Message, state: FSMContext):
         "sms_code": int(sms_code),
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            res_json = await response.json()
+    try:
+        res_json = await click_request('POST', url, headers=headers, json=payload)
+    except ServiceUnavailable:
+        # The state is kept, so the user can send the code again
+        await message.answer(CLICK_UNAVAILABLE_TEXT)
+        return
 
     if res_json.get('error_code'):
         await state.clear()
@@ -785,20 +763,20 @@ async def handle_my_cards(callback: types.CallbackQuery, state: FSMContext):
     )
 
 
-@router.callback_query(lambda c: c.data == 'check_membership_info')
+@router.callback_query(lambda c: c.data == 'check_membership_info', flags={"throttle": "status"})
 async def handle_check_membership_info(callback: types.CallbackQuery, state: FSMContext):
     await callback.answer()
 
     try:
-        user = await User.objects.filter(telegram_id=callback.from_user.id).afirst()
+        status = await get_subscription_status(callback.from_user.id, callback.bot)
 
-        if not user:
+        if status is None:
             text = "Foydalanuvchi topilmadi. Iltimos, /start buyrug'ini bosing."
             keyboard = InlineKeyboardMarkup(inline_keyboard=[[back_menu_button()]])
             await callback.message.edit_text(text, reply_markup=keyboard)
             return
 
-        text, keyboard, _ = await get_subscription_status(user, callback.from_user.id, callback.bot)
+        text, keyboard, _ = status
         await callback.message.edit_text(text, reply_markup=keyboard)
 
     except TelegramBadRequest as e:
@@ -862,7 +840,7 @@ async def handle_cancel_membership(callback: types.CallbackQuery, state: FSMCont
         return
 
 
-@router.callback_query(lambda c: c.data == 'confirm_cancel_membership')
+@router.callback_query(lambda c: c.data == 'confirm_cancel_membership', flags={"single_flight": "cancel_membership"})
 async def handle_confirm_cancel_membership(callback: types.CallbackQuery, state: FSMContext):
     telegram_id = callback.from_user.id
     user = await User.objects.aget(telegram_id=telegram_id)
@@ -873,7 +851,7 @@ async def handle_confirm_cancel_membership(callback: types.CallbackQuery, state:
     builder.button(text='🔙 Orqaga', callback_data="main_menu")
     builder.adjust(1)
 
-    user_card = await UserCard.objects.filter(user=user, is_confirmed=True).afirst()
+    user_card = await get_user_card(user.telegram_id, confirmed_only=True)
     if not user_card:
         await callback.message.edit_text("Sizda ulangan kartalar yo'q", reply_markup=builder.as_markup())
         return
@@ -890,11 +868,12 @@ async def handle_confirm_cancel_membership(callback: types.CallbackQuery, state:
 
     url = f'{settings.CLICK_BASE_URL}/{payload['service_id']}/{payload["card_token"]}'
 
-    async with aiohttp.ClientSession() as session:
-        async with session.delete(url, headers=headers, json=payload) as response:
-            res_json = await response.json()
+    try:
+        res_json = await click_request('DELETE', url, headers=headers, json=payload)
+    except ServiceUnavailable:
+        await callback.message.edit_text(CLICK_UNAVAILABLE_TEXT, reply_markup=builder.as_markup())
+        return
 
-    print(res_json)
     await user_card.adelete()
     await callback.message.edit_text("Obuna o`chirildi.", reply_markup=builder.as_markup())
 
@@ -915,7 +894,7 @@ async def send_motivation_video_prompt(callback: types.CallbackQuery, state: FSM
     await callback.answer()
 
     user_id = callback.from_user.id
-    user_lang = cache.get(f"user_lang:{user_id}")
+    user_lang = await aget_user_language(user_id, default=None)
 
     if user_lang == CONSTANTS.LANGUAGES.RU:
         text = "📹 Отправьте мотивационное видео для рассылки всем пользователям:"
@@ -933,7 +912,7 @@ async def send_motivation_text_prompt(callback: types.CallbackQuery, state: FSMC
     await callback.answer()
 
     user_id = callback.from_user.id
-    user_lang = cache.get(f"user_lang:{user_id}")
+    user_lang = await aget_user_language(user_id, default=None)
 
     if user_lang == CONSTANTS.LANGUAGES.RU:
         text = "📝 Отправьте мотивационный текст для рассылки всем пользователям:"
@@ -951,10 +930,13 @@ async def receive_motivation_video(message: types.Message, state: FSMContext, bo
     - If forwarded: use copy_message (removes forward tag)
     - If uploaded: use send_video (with file_id)
     """
+    # The Celery task module is only needed here, keep it out of the web process until then
+    from bot.tasks import send_video_to_users_task, copy_video_to_users_task
+
     await state.clear()
 
     user_id = message.from_user.id
-    user_lang = cache.get(f"user_lang:{user_id}")
+    user_lang = await aget_user_language(user_id, default=None)
 
     # Confirm receipt
     if user_lang == CONSTANTS.LANGUAGES.RU:
@@ -997,16 +979,17 @@ async def receive_motivation_text(message: types.Message, state: FSMContext):
     await state.clear()
 
     user_id = message.from_user.id
-    user_lang = cache.get(f"user_lang:{user_id}")
+    user_lang = await aget_user_language(user_id, default=None)
 
     motivation_text = message.text
 
     # Get all users
-    users = User.objects.all()
+    with read_replica():
+        users = [user async for user in User.objects.all()]
     sent_count = 0
     failed_count = 0
 
-    async for user in users:
+    for user in users:
         try:
             prefix = "🎥 Motivatsion matn:\n\n" if user.language == CONSTANTS.LANGUAGES.UZ else "🎥 Мотивационный текст:\n\n"
             await message.bot.send_message(
@@ -1045,84 +1028,94 @@ async def create_invite_with_retry(bot, channel_id, telegram_id, max_retries=5):
         except TelegramRetryAfter as e:
             if attempt < max_retries - 1:
                 wait_time = e.retry_after + 2
-                print(f"Flood control: waiting {wait_time}s (attempt {attempt + 1}/{max_retries})")
+                logger.warning(f"Flood control: waiting {wait_time}s (attempt {attempt + 1}/{max_retries})")
                 await asyncio.sleep(wait_time)
             else:
-                print(f"Failed after {max_retries} attempts for user {telegram_id}")
+                logger.error(f"Invite link for user {telegram_id} failed after {max_retries} attempts")
                 raise
 
     return None
 
 
-async def send_invites_background(bot, channel_id, admin_chat_id):
-    """Background task to send invites"""
-    successful_transactions = [
-        t async for t in Transaction.objects.filter(
-            state=Transaction.SUCCESSFULLY,
-            payment_method=CONSTANTS.PaymentMethod.CLICK
-        ).order_by("-created_at")
-    ]
-
-    sent_count = 0
-    already_member_count = 0
-    error_count = 0
+@supervisor.kind('send_invites', max_queued=0, resumable=True)
+async def send_invites_background(job, channel_id, admin_chat_id):
+    """Background job to send invites, resumes after the last handled transaction on restart"""
+    bot = get_bot()
+    transactions = Transaction.objects.filter(
+        state=Transaction.SUCCESSFULLY,
+        payment_method=CONSTANTS.PaymentMethod.CLICK
+    ).order_by("-id")
+    if 'last_id' in job.checkpoint:
+        transactions = transactions.filter(id__lt=job.checkpoint['last_id'])
+    with read_replica():
+        successful_transactions = [t async for t in transactions]
+
+    sent_count = job.progress.get('sent', 0)
+    already_member_count = job.progress.get('already_member', 0)
+    error_count = job.progress.get('errors', 0)
+    total = sent_count + already_member_count + error_count + len(successful_transactions)
+
+    # Yield to interactive traffic
+    with bulk_traffic():
+        for transaction in successful_transactions:
+            telegram_id = transaction.user_id
+
+            try:
+                # Check membership
+                member = await bot.get_chat_member(chat_id=channel_id, user_id=telegram_id)
+
+                if member.status in ["creator", "administrator", "member", "restricted"]:
+                    already_member_count += 1
+                    continue
+
+                # Create invite link with retry
+                invite_link = await create_invite_with_retry(bot, channel_id, telegram_id)
+
+                if not invite_link:
+                    error_count += 1
+                    continue
+
+                # Send message
+                await bot.send_message(
+                    chat_id=telegram_id,
+                    text=(
+                        f"🎉 To'lovingiz tasdiqlandi!\n\n"
+                        f"🔗 Premium kanalimizga maxsus havola:\n\n"
+                        f"{invite_link.invite_link}\n\n"
+                        f"⚠️ Muhim:\n"
+                        f"• Havola 24 soat ichida amal qiladi\n"
+                        f"• Faqat bir marta ishlatiladi\n"
+                        f"• Darhol qo'shilish uchun havolani bosing\n\n"
+                        f"Xush kelibsiz! 🚀"
+                    )
+                )
 
-    for transaction in successful_transactions:
-        telegram_id = transaction.user_id
+                sent_count += 1
 
-        try:
-            # Check membership
-            member = await bot.get_chat_member(chat_id=channel_id, user_id=telegram_id)
+                # The shared rate limiter paces the messages; without it, pause by hand
+                if not settings.RATE_LIMIT_ENABLED:
+                    await asyncio.sleep(1)
 
-            if member.status in ["creator", "administrator", "member", "restricted"]:
-                already_member_count += 1
-                print(f"User {telegram_id} is already a member")
+            except TelegramRetryAfter as e:
+                logger.warning(f"Persistent flood control for {telegram_id}, skipping")
+                error_count += 1
+                # Wait before next user
+                await asyncio.sleep(e.retry_after + 2)
                 continue
 
-            # Create invite link with retry
-            invite_link = await create_invite_with_retry(bot, channel_id, telegram_id)
-
-            if not invite_link:
+            except TelegramBadRequest as e:
                 error_count += 1
+                logger.warning(f"Invite for user {telegram_id} failed: {e}")
                 continue
 
-            # Send message
-            await bot.send_message(
-                chat_id=telegram_id,
-                text=(
-                    f"🎉 To'lovingiz tasdiqlandi!\n\n"
-                    f"🔗 Premium kanalimizga maxsus havola:\n\n"
-                    f"{invite_link.invite_link}\n\n"
-                    f"⚠️ Muhim:\n"
-                    f"• Havola 24 soat ichida amal qiladi\n"
-                    f"• Faqat bir marta ishlatiladi\n"
-                    f"• Darhol qo'shilish uchun havolani bosing\n\n"
-                    f"Xush kelibsiz! 🚀"
-                )
-            )
-
-            sent_count += 1
-            print(f"✅ Invite link sent to user {telegram_id}")
-
-            # Longer delay to avoid flood control
-            await asyncio.sleep(1)  # 1 second between users
-
-        except TelegramRetryAfter as e:
-            print(f"Persistent flood control for {telegram_id}, skipping...")
-            error_count += 1
-            # Wait before next user
-            await asyncio.sleep(e.retry_after + 2)
-            continue
-
-        except TelegramBadRequest as e:
-            error_count += 1
-            print(f"Error for user {telegram_id}: {e}")
-            continue
+            except Exception as e:
+                error_count += 1
+                logger.exception(f"Unexpected error sending an invite to user {telegram_id}: {e}")
+                continue
 
-        except Exception as e:
-            error_count += 1
-            print(f"Unexpected error for user {telegram_id}: {e}")
-            continue
+            finally:
+                job.report(sent=sent_count, already_member=already_member_count, errors=error_count, total=total)
+                await job.save(last_id=transaction.id)
 
     # Send final report
     try:
@@ -1133,7 +1126,7 @@ async def send_invites_background(bot, channel_id, admin_chat_id):
                 f"📤 Yuborildi: {sent_count}\n"
                 f"👥 Allaqachon a'zo: {already_member_count}\n"
                 f"❌ Xatoliklar: {error_count}\n"
-                f"📊 Jami: {len(successful_transactions)}"
+                f"📊 Jami: {total}"
             )
         )
     except:
@@ -1145,7 +1138,7 @@ async def send_invites_background(bot, channel_id, admin_chat_id):
 @router.message(Command("send_payment_link"))
 async def send_payment_link(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    user = await User.objects.filter(telegram_id=user_id).afirst()
+    user = await get_user(user_id)
 
     if not user:
         return
@@ -1155,7 +1148,6 @@ async def send_payment_link(message: types.Message, state: FSMContext):
         )
         return
 
-    bot = message.bot
     channel = await PrivateChannel.objects.afirst()
 
     if not channel:
@@ -1164,15 +1156,43 @@ async def send_payment_link(message: types.Message, state: FSMContext):
 
     channel_id = channel.private_channel_id
 
+    try:
+        supervisor.submit('send_invites', channel_id=channel_id, admin_chat_id=message.chat.id)
+    except JobRejected:
+        await message.answer("⏳ Havolalar yuborish allaqachon davom etmoqda. /jobs orqali kuzating.")
+        return
+
     # Immediate response to avoid webhook timeout
     await message.answer(
         "⏳ Jarayon boshlandi!\n\n"
         "Havolalar fonda yuborilmoqda. Tugagach xabar keladi."
     )
 
-    asyncio.create_task(
-        send_invites_background(bot, channel_id, message.chat.id)
-    )
+
+@router.message(Command("jobs"))
+async def list_jobs(message: types.Message):
+    """Admin: background jobs running in this process"""
+    user = await get_user(message.from_user.id)
+    if not user or not user.is_superuser:
+        return
+
+    jobs = supervisor.status()
+    if not jobs:
+        await message.answer("Fonda ishlayotgan jarayonlar yo'q.")
+        return
+
+    lines = []
+    for job in jobs:
+        progress = ", ".join(f"{key}: {value}" for key, value in job['progress'].items()) or "-"
+        lines.append(f"• {job['kind']} [{job['status']}, {job['running_s']} s] — {progress}")
+    await message.answer("⚙️ Fon jarayonlari:\n\n" + "\n".join(lines))
+
+
+@router.chat_member()
+async def on_chat_member(event: types.ChatMemberUpdated):
+    """Joined or left a channel: the cached /check answer shows the wrong membership"""
+    await SnapshotCache.ainvalidate(event.new_chat_member.user.id)
+
 
 # Catch any other callbacks not specified above
 @router.callback_query()
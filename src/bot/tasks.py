@@ -2,10 +2,11 @@
 
 from celery import shared_task
 from django.contrib.auth import get_user_model
-from aiogram import Bot
-from aiogram.exceptions import TelegramForbiddenError
+from django.conf import settings
 import asyncio
 
+from core.replica import read_replica
+from core.resilience import bulk_traffic
 from core.utils.constants import CONSTANTS
 
 User = get_user_model()
@@ -21,10 +22,16 @@ async def send_video_to_users_async(
     Send uploaded video using send_video
     Allows custom captions per user
     """
-    bot = Bot(token=bot_token)
+    # aiogram is imported when a broadcast runs, not when beat loads the task module
+    from aiogram import Bot
+    from aiogram.exceptions import TelegramForbiddenError
+    from bot.utils.session import make_session
+
+    bot = Bot(token=bot_token, session=make_session())
 
     try:
-        users = await asyncio.to_thread(lambda: list(User.objects.all()))
+        with read_replica():
+            users = await asyncio.to_thread(lambda: list(User.objects.all()))
         total_users = len(users)
         sent_count = 0
         failed_count = 0
@@ -75,7 +82,8 @@ async def send_video_to_users_async(
             except Exception:
                 pass
 
-            if i + batch_size < total_users:
+            # The shared rate limiter paces the batches; without it, pause by hand
+            if i + batch_size < total_users and not settings.RATE_LIMIT_ENABLED:
                 await asyncio.sleep(1.0)
 
         await bot.edit_message_text(
@@ -106,10 +114,15 @@ async def copy_video_to_users_async(
     Copy forwarded video using copy_message
     Removes forward tag and preserves exact formatting
     """
-    bot = Bot(token=bot_token)
+    from aiogram import Bot
+    from aiogram.exceptions import TelegramForbiddenError
+    from bot.utils.session import make_session
+
+    bot = Bot(token=bot_token, session=make_session())
 
     try:
-        users = await asyncio.to_thread(lambda: list(User.objects.all()))
+        with read_replica():
+            users = await asyncio.to_thread(lambda: list(User.objects.all()))
         total_users = len(users)
         sent_count = 0
         failed_count = 0
@@ -156,7 +169,8 @@ async def copy_video_to_users_async(
             except Exception:
                 pass
 
-            if i + batch_size < total_users:
+            # The shared rate limiter paces the batches; without it, pause by hand
+            if i + batch_size < total_users and not settings.RATE_LIMIT_ENABLED:
                 await asyncio.sleep(1.0)
 
         await bot.edit_message_text(
@@ -185,9 +199,10 @@ def copy_video_to_users_task(
     admin_chat_id: int
 ):
     """Celery task for forwarded videos"""
-    return asyncio.run(
-        copy_video_to_users_async(from_chat_id, message_id, bot_token, admin_chat_id)
-    )
+    with bulk_traffic():
+        return asyncio.run(
+            copy_video_to_users_async(from_chat_id, message_id, bot_token, admin_chat_id)
+        )
 
 
 @shared_task
@@ -198,6 +213,7 @@ def send_video_to_users_task(
     admin_chat_id: int
 ):
     """Celery task for uploaded videos"""
-    return asyncio.run(
-        send_video_to_users_async(video_file_id, caption, bot_token, admin_chat_id)
-    )
+    with bulk_traffic():
+        return asyncio.run(
+            send_video_to_users_async(video_file_id, caption, bot_token, admin_chat_id)
+        )
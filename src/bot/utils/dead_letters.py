@@ -0,0 +1,60 @@
+"""
+Dead-letter stream for Telegram updates whose handler failed.
+
+The webhook always answers 200, so Telegram never retries a failed update; the raw
+update is kept here with the error instead and `manage.py replay_dead_letters`
+feeds it through the dispatcher again once the cause is fixed.
+"""
+import json
+import logging
+import time
+import traceback
+
+import redis
+from django.conf import settings
+
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = 'updates:dead-letters'
+
+
+class DeadLetterQueue:
+    @staticmethod
+    async def add(update: dict, error: BaseException, event_type: str = '') -> str | None:
+        """Store a failed raw update, returns the stream entry id"""
+        fields = {
+            'update_id': update.get('update_id', ''),
+            'update': json.dumps(update, ensure_ascii=False),
+            'error': f"{type(error).__name__}: {error}",
+            'traceback': ''.join(traceback.format_exception(error))[-4000:],
+            'event_type': event_type,
+            'failed_at': int(time.time()),
+        }
+        try:
+            entry_id = await get_redis().xadd(
+                STREAM_KEY, fields, maxlen=settings.DEAD_LETTER_MAXLEN, approximate=True,
+            )
+        except redis.RedisError as e:
+            logger.error(f"Could not dead-letter update {fields['update_id']}: {e}")
+            return None
+        return entry_id.decode()
+
+    @staticmethod
+    async def read(count: int = 100, after: str = '-', until: str = '+') -> list[tuple[str, dict]]:
+        """Oldest entries first, `after` is exclusive so it can be the last id read"""
+        start = f'({after}' if after != '-' else after
+        entries = await get_redis().xrange(STREAM_KEY, min=start, max=until, count=count)
+        return [
+            (entry_id.decode(), {key.decode(): value.decode() for key, value in fields.items()})
+            for entry_id, fields in entries
+        ]
+
+    @staticmethod
+    async def delete(*entry_ids: str) -> int:
+        return await get_redis().xdel(STREAM_KEY, *entry_ids) if entry_ids else 0
+
+    @staticmethod
+    async def length() -> int:
+        return await get_redis().xlen(STREAM_KEY)
@@ -0,0 +1,166 @@
+"""
+Cluster-wide Bot API rate limiter.
+
+Every process (web workers, polling worker, Celery) takes tokens from the same
+Redis token buckets before sending a message: one global bucket (~30 msg/s for
+the whole bot) and one per chat (1 msg/s in private chats, 20 msg/min in groups
+and channels). The buckets are checked and taken atomically in one Lua script,
+using the Redis clock, so the processes don't need synchronized clocks.
+
+Traffic is interactive unless it runs inside `core.resilience.bulk_traffic()`: broadcasts, nightly
+renewals and notifications leave the last RATE_LIMIT_INTERACTIVE_RESERVE global
+tokens to interactive handlers, so users keep getting answers during a broadcast.
+"""
+import asyncio
+import logging
+
+import redis
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from django.conf import settings
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+from core.resilience import is_bulk_traffic
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_WAIT = REGISTRY.histogram(
+    'bot_api_rate_limit_wait_seconds', "Time a Bot API message waited for rate limit tokens", ('priority',),
+    buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+FLOOD_WAITS = REGISTRY.counter(
+    'bot_api_flood_waits_total', "Flood control errors (retry_after) returned by the Bot API", ('priority',),
+)
+
+GLOBAL_KEY = 'bot:ratelimit:global'
+CHAT_KEY = 'bot:ratelimit:chat:{}'
+
+# KEYS: buckets; ARGV: rate (tokens/ms), capacity and reserve of each bucket.
+# Takes a token from every bucket, or from none and returns the milliseconds to wait.
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local wait = 0
+local tokens = {}
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    local reserve = tonumber(ARGV[i * 3])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    available = math.min(capacity, available + elapsed * rate)
+    tokens[i] = available
+    if available < 1 + reserve then
+        wait = math.max(wait, math.ceil((1 + reserve - available) / rate))
+    end
+end
+if wait > 0 then
+    return wait
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local capacity = tonumber(ARGV[i * 3 - 1])
+    redis.call('HSET', key, 'tokens', tokens[i] - 1, 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate) + 1000)
+end
+return 0
+"""
+
+# Empty the bucket so its next token comes in `seconds`: KEYS[1] bucket; ARGV rate (tokens/ms), seconds
+PENALTY_SCRIPT = """
+local time = redis.call('TIME')
+local now = time[1] * 1000 + math.floor(time[2] / 1000)
+local rate = tonumber(ARGV[1])
+local seconds = tonumber(ARGV[2])
+redis.call('HSET', KEYS[1], 'tokens', 1 - rate * seconds * 1000, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], seconds * 1000 + 60000)
+return 1
+"""
+
+def is_rate_limited(method: TelegramMethod) -> bool:
+    """Methods that post a message to a chat (send*, copy*, forward*)"""
+    name = type(method).__name__
+    return name.startswith(('Send', 'Copy', 'Forward')) and name != 'SendChatAction'
+
+
+def _is_group(chat_id) -> bool:
+    # Groups, supergroups and channels have negative ids (or @usernames)
+    return str(chat_id).startswith(('-', '@'))
+
+
+class RateLimiter:
+    @staticmethod
+    def _chat_bucket(chat_id) -> tuple[str, float, int]:
+        if _is_group(chat_id):
+            return CHAT_KEY.format(chat_id), settings.RATE_LIMIT_GROUP_PER_MINUTE / 60000, settings.RATE_LIMIT_GROUP_PER_MINUTE
+        return CHAT_KEY.format(chat_id), settings.RATE_LIMIT_CHAT_PER_SECOND / 1000, settings.RATE_LIMIT_CHAT_BURST
+
+    @classmethod
+    async def acquire(cls, chat_id=None, bulk: bool = False) -> float:
+        """Wait for a token of the global bucket and of the chat's; returns the seconds waited"""
+        global_rate = settings.RATE_LIMIT_GLOBAL_PER_SECOND
+        keys = [GLOBAL_KEY]
+        args = [global_rate / 1000, global_rate, settings.RATE_LIMIT_INTERACTIVE_RESERVE if bulk else 0]
+        if chat_id is not None:
+            key, rate, capacity = cls._chat_bucket(chat_id)
+            keys.append(key)
+            args += [rate, capacity, 0]
+
+        waited = 0.0
+        while True:
+            try:
+                acquire = get_redis().register_script(ACQUIRE_SCRIPT)
+                wait_ms = await acquire(keys=keys, args=args)
+            except redis.RedisError as e:
+                # Sending unthrottled beats not sending at all
+                logger.warning(f"Rate limiter unavailable: {e}")
+                return waited
+            if not wait_ms:
+                return waited
+            await asyncio.sleep(wait_ms / 1000)
+            waited += wait_ms / 1000
+
+    @classmethod
+    async def penalize(cls, chat_id, seconds: int) -> None:
+        """Flood wait from Telegram: hold back the chat (or the whole bot) for every process"""
+        if chat_id is not None:
+            key, rate, _ = cls._chat_bucket(chat_id)
+        else:
+            key, rate = GLOBAL_KEY, settings.RATE_LIMIT_GLOBAL_PER_SECOND / 1000
+        try:
+            penalty = get_redis().register_script(PENALTY_SCRIPT)
+            await penalty(keys=[key], args=[rate, seconds])
+        except redis.RedisError as e:
+            logger.warning(f"Could not record the flood wait of {key}: {e}")
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: paces message-sending methods with `RateLimiter`"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if not settings.RATE_LIMIT_ENABLED or not is_rate_limited(method):
+            return await make_request(bot, method)
+
+        bulk = is_bulk_traffic()
+        priority = 'bulk' if bulk else 'interactive'
+        chat_id = getattr(method, 'chat_id', None)
+        for attempt in range(settings.RATE_LIMIT_RETRIES + 1):
+            RATE_LIMIT_WAIT.observe(await RateLimiter.acquire(chat_id, bulk), priority=priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                FLOOD_WAITS.inc(priority=priority)
+                logger.warning(f"Flood wait of {e.retry_after}s for {type(method).__name__} to {chat_id}")
+                await RateLimiter.penalize(chat_id, e.retry_after)
+                if attempt == settings.RATE_LIMIT_RETRIES:
+                    raise
@@ -0,0 +1,87 @@
+from aiogram import Bot, __version__
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.methods import GetUpdates, Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import ClientSession
+from aiohttp.hdrs import USER_AGENT
+from aiohttp.http import SERVER_SOFTWARE
+from django.conf import settings
+from yarl import URL
+
+from core.metrics import make_trace_config
+from core.resilience import OutboundGuard
+from .rate_limit import RateLimitMiddleware
+
+# Seconds per Bot API method; uploads get longer, everything else TELEGRAM_TIMEOUT_SECONDS
+TELEGRAM_TIMEOUTS = {
+    'SendVideo': 60,
+    'SendDocument': 60,
+    'SendPhoto': 30,
+    'SendMediaGroup': 60,
+}
+
+# Only transport errors and 5xx trip the breaker; 4xx answers mean Telegram is up
+telegram_guard = OutboundGuard(
+    'telegram',
+    timeouts=TELEGRAM_TIMEOUTS,
+    default_timeout=settings.TELEGRAM_TIMEOUT_SECONDS,
+    slow_call_seconds=settings.TELEGRAM_SLOW_CALL_SECONDS,
+    interactive_limit=settings.TELEGRAM_BULKHEAD_INTERACTIVE,
+    batch_limit=settings.TELEGRAM_BULKHEAD_BATCH,
+    failures=(TelegramNetworkError, TelegramServerError),
+)
+
+
+def _bot_api_endpoint(url: URL) -> str:
+    """Bot API method name; file downloads are grouped so the token and file paths never become labels"""
+    if url.path.startswith('/file/'):
+        return 'file'
+    return url.path.rstrip('/').rsplit('/', 1)[-1]
+
+
+class InstrumentedAiohttpSession(AiohttpSession):
+    """AiohttpSession whose requests are timed by Bot API method and status"""
+
+    async def create_session(self) -> ClientSession:
+        if self._should_reset_connector:
+            await self.close()
+
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=self._connector_type(**self._connector_init),
+                headers={
+                    USER_AGENT: f"{SERVER_SOFTWARE} aiogram/{__version__}",
+                },
+                trace_configs=[make_trace_config('telegram', _bot_api_endpoint)],
+            )
+            self._should_reset_connector = False
+
+        return self._session
+
+
+class GuardMiddleware(BaseRequestMiddleware):
+    """Bot session middleware: runs Bot API calls through `telegram_guard` (long polling excluded)"""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+        async with telegram_guard.call(type(method).__name__):
+            return await make_request(bot, method)
+
+
+def make_session(**kwargs) -> InstrumentedAiohttpSession:
+    """Bot session pointed at BOT_API_BASE_URL when it is set, paced by the shared rate limiter"""
+    api = TelegramAPIServer.from_base(settings.BOT_API_BASE_URL) if settings.BOT_API_BASE_URL else PRODUCTION
+    session = InstrumentedAiohttpSession(api=api, **kwargs)
+    # Outermost first: wait for rate limit tokens before taking a bulkhead slot
+    session.middleware(RateLimitMiddleware())
+    session.middleware(GuardMiddleware())
+    return session
@@ -1,12 +1,20 @@
+"""
+aiogram FSM storage on the project Redis (`core.redis`).
+
+States and data are stored as plain strings under `fsm:` keys, not pickled
+through the Django cache, and expire after FSM_STATE_TTL / FSM_DATA_TTL: an
+abandoned registration or card form does not stay in Redis forever.
+"""
 import json
 from typing import Dict, Any, Optional, cast
 
 from aiogram.fsm.state import State
 from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
 from aiogram.fsm.storage.redis import KeyBuilder, DefaultKeyBuilder, _JsonLoads, _JsonDumps
-from django.core.cache import cache
 from redis.typing import ExpiryT
 
+from core.redis import get_redis
+
 
 class DjangoRedisStorage(BaseStorage):
     def __init__(
@@ -28,17 +36,17 @@ class DjangoRedisStorage(BaseStorage):
     async def set_state(self, key: StorageKey, state: StateType = None) -> None:
         redis_key = self.key_builder.build(key, "state")
         if state is None:
-            await cache.adelete(redis_key)
+            await get_redis().delete(redis_key)
         else:
-            await cache.aset(
+            await get_redis().set(
                 redis_key,
                 cast(str, state.state if isinstance(state, State) else state),
-                self.state_ttl,
+                ex=self.state_ttl,
             )
 
     async def get_state(self, key: StorageKey) -> Optional[str]:
         redis_key = self.key_builder.build(key, "state")
-        value = await cache.aget(redis_key)
+        value = await get_redis().get(redis_key)
         if isinstance(value, bytes):
             return value.decode("utf-8")
         return cast(Optional[str], value)
@@ -46,17 +54,17 @@ class DjangoRedisStorage(BaseStorage):
     async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
         redis_key = self.key_builder.build(key, "data")
         if not data:
-            await cache.adelete(redis_key)
+            await get_redis().delete(redis_key)
             return
-        await cache.aset(
+        await get_redis().set(
             redis_key,
             self.json_dumps(data),
-            self.data_ttl,
+            ex=self.data_ttl,
         )
 
     async def get_data(self, key: StorageKey) -> Dict[str, Any]:
         redis_key = self.key_builder.build(key, "data")
-        value = await cache.aget(redis_key)
+        value = await get_redis().get(redis_key)
         if value is None:
             return {}
         if isinstance(value, bytes):
@@ -64,4 +72,5 @@ class DjangoRedisStorage(BaseStorage):
         return cast(Dict[str, Any], self.json_loads(value))
 
     async def close(self) -> None:
-        await cache.aclose()
\ No newline at end of file
+        # The client is shared with the rest of the process and outlives the dispatcher
+        pass
@@ -4,7 +4,7 @@ import logging
 from django.conf import settings
 from django.http import HttpResponse
 
-from .misc import feed_raw_update
+from .utils.dead_letters import DeadLetterQueue
 
 logger = logging.getLogger(__name__)
 
@@ -18,9 +18,18 @@ async def process_update(request):
     if request.method == "POST":
         body_unicode = request.body.decode('utf-8')
         try:
-            await feed_raw_update(json.loads(body_unicode))
+            update = json.loads(body_unicode)
+        except ValueError as e:
+            logger.error(f"Invalid update payload: {e}")
+            return HttpResponse(status=200)
+        # Imported here: URL checks import this module in Celery workers, which never feed updates
+        from .misc import feed_raw_update
+
+        try:
+            await feed_raw_update(update)
         except Exception as e:
             logger.exception(e)
+            await DeadLetterQueue.add(update, e)
         return HttpResponse(status=200)
     return HttpResponse('Method not allowed', status=405)
 
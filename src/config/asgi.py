@@ -7,6 +7,8 @@ from django.conf import settings
 from django.core.asgi import ASGIHandler as _ASGIHandler
 from django.utils.module_loading import import_string
 
+from core.metrics.endpoint import metrics_app
+
 
 class ASGIHandler(_ASGIHandler):
     async def __call__(self, scope, receive, send):
@@ -14,6 +16,9 @@ class ASGIHandler(_ASGIHandler):
         if scope["type"] == "lifespan":
             await self.lifespan(scope, receive, send)
             return
+        if scope["path"] == settings.METRICS_PATH:
+            await metrics_app(scope, receive, send)
+            return
         async with ThreadSensitiveContext():
             await self.handle(scope, receive, send)
 
@@ -2,6 +2,7 @@ import os
 
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_init
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -12,7 +13,20 @@ app.config_from_object('django.conf:settings', namespace='CELERY')  # Remove f-s
 
 app.autodiscover_tasks()
 
+
+@worker_init.connect
+def preload_bot_client(**kwargs):
+    # Task modules import aiogram lazily, so beat never loads it. Workers do send messages:
+    # import it once in the parent, so the forked pool processes share it
+    from bot.client import preload
+
+    preload()
+
 app.conf.beat_schedule = {
+    'build-renewal-worklist': {
+        'task': 'core.tasks.build_renewal_worklist',
+        'schedule': crontab(hour=0, minute=0),
+    },
     'send-expiration-notifications': {
         'task': 'core.tasks.send_membership_expire_notification',
         'schedule': crontab(hour=6, minute=0),
@@ -25,4 +39,12 @@ app.conf.beat_schedule = {
         'task': 'core.tasks.kick_unpaid_users',
         'schedule': crontab(hour=23, minute=30),
     },
+    'ensure-transaction-partitions': {
+        'task': 'order.tasks.ensure_transaction_partitions',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'sweep-stale-records': {
+        'task': 'order.tasks.sweep_stale_records',
+        'schedule': crontab(hour=4, minute=0),
+    },
 }
\ No newline at end of file
@@ -1,12 +1,22 @@
 import contextlib
 
-from bot.misc import on_startup, on_shutdown
+from bot.misc import get_dispatcher, on_startup, on_shutdown
+from core.asyncdb import pool_context
+from core.jobs import supervisor
+from order.outbox import start_dispatcher
 
 
 @contextlib.asynccontextmanager
 async def lifespan_context():
-    try:
-        await on_startup()
-        yield
-    finally:
-        await on_shutdown()
+    async with pool_context():
+        # Build the routers first: they register the job kinds that resuming needs
+        get_dispatcher()
+        await supervisor.start()
+        start_dispatcher()
+        try:
+            await on_startup()
+            yield
+        finally:
+            # Jobs still use the bot session closed by on_shutdown
+            await supervisor.shutdown()
+            await on_shutdown()
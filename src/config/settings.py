@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 
-from decouple import AutoConfig
+from decouple import AutoConfig, Csv
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -95,10 +95,40 @@ DATABASES = {
         "PORT": config("POSTGRES_PORT", default=5432, cast=int),
     }
 }
+# Django's native connection pool, requires psycopg 3 (`pool` extra); replaces CONN_MAX_AGE
+DB_POOL_ENABLED = config('DB_POOL_ENABLED', default=False, cast=bool)
+if DB_POOL_ENABLED:
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=int),
+        },
+    }
+# Native async pool for the hot async reads (core.asyncdb), psycopg 3 only
+ASYNC_DB_POOL_ENABLED = config('ASYNC_DB_POOL_ENABLED', default=False, cast=bool)
+ASYNC_DB_POOL_MIN_SIZE = config('ASYNC_DB_POOL_MIN_SIZE', default=1, cast=int)
+ASYNC_DB_POOL_MAX_SIZE = config('ASYNC_DB_POOL_MAX_SIZE', default=10, cast=int)
+# Streaming read replica for bulk/reporting reads (see core.replica); disabled when no host is set
+POSTGRES_REPLICA_HOST = config('POSTGRES_REPLICA_HOST', default='')
+if POSTGRES_REPLICA_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': POSTGRES_REPLICA_HOST,
+        'PORT': config('POSTGRES_REPLICA_PORT', default=5432, cast=int),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.replica.ReplicaRouter']
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=30, cast=int)
+REPLICA_LAG_CHECK_SECONDS = config('REPLICA_LAG_CHECK_SECONDS', default=5, cast=int)
+REDIS_URL = config('REDIS_URL', default='redis://127.0.0.1:6379/1')
+# Per event loop; callers beyond it wait for a free connection
+REDIS_MAX_CONNECTIONS = config('REDIS_MAX_CONNECTIONS', default=50, cast=int)
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": config('REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        "LOCATION": REDIS_URL,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
@@ -154,6 +184,9 @@ BOT_WEBHOOK_PATH = 'process-bot-updates'
 
 BOT_WEBHOOK_SECRET = config('BOT_WEBHOOK_SECRET', default='')
 
+# Alternative Bot API server (local Bot API server or the bench fake), empty means api.telegram.org
+BOT_API_BASE_URL = config('BOT_API_BASE_URL', default='')
+
 CSRF_TRUSTED_ORIGINS = [
     "http://*.localhost:1040",
     "http://*.localhost:8003",
@@ -168,7 +201,7 @@ CLICK_SERVICE_ID = config('CLICK_SERVICE_ID', default='')
 CLICK_MERCHANT_ID = config('CLICK_MERCHANT_ID', default='')
 CLICK_SECRET_KEY = config('CLICK_SECRET_KEY', default='')
 CLICK_MERCHANT_USER_ID = config('CLICK_MERCHANT_USER_ID', default='')
-CLICK_BASE_URL = 'https://api.click.uz/v2/merchant/card_token'
+CLICK_BASE_URL = config('CLICK_BASE_URL', default='https://api.click.uz/v2/merchant/card_token')
 
 CLICK_AMOUNT_FIELD = "amount"
 
@@ -178,6 +211,127 @@ OFERTA_URL = 'https://docs.google.com/document/d/14YUQcNkBseMwLNicWUBqkA_fnlxMNO
 
 RUN_SCHEDULER = config('RUN_SCHEDULER', default=False, cast=bool)
 
+# Orders: a pending order for the same purchase is reused inside this window
+ORDER_REUSE_WINDOW_MINUTES = config('ORDER_REUSE_WINDOW_MINUTES', default=30, cast=int)
+
+# Retention sweeper
+RETENTION_PENDING_ORDER_DAYS = config('RETENTION_PENDING_ORDER_DAYS', default=7, cast=int)
+RETENTION_FAILED_ORDER_DAYS = config('RETENTION_FAILED_ORDER_DAYS', default=90, cast=int)
+RETENTION_UNCONFIRMED_CARD_HOURS = config('RETENTION_UNCONFIRMED_CARD_HOURS', default=24, cast=int)
+RETENTION_TRANSACTION_DAYS = config('RETENTION_TRANSACTION_DAYS', default=90, cast=int)
+RETENTION_BATCH_SIZE = config('RETENTION_BATCH_SIZE', default=1000, cast=int)
+
+# Monthly partitions of the Transaction table
+TRANSACTION_PARTITION_MONTHS_AHEAD = config('TRANSACTION_PARTITION_MONTHS_AHEAD', default=3, cast=int)
+TRANSACTION_PARTITION_RETAIN_MONTHS = config('TRANSACTION_PARTITION_RETAIN_MONTHS', default=24, cast=int)
+
+# Transactional outbox of post-payment Telegram messages (order/outbox.py)
+OUTBOX_DISPATCHER_ENABLED = config('OUTBOX_DISPATCHER_ENABLED', default=True, cast=bool)
+OUTBOX_BATCH_SIZE = config('OUTBOX_BATCH_SIZE', default=50, cast=int)
+OUTBOX_POLL_SECONDS = config('OUTBOX_POLL_SECONDS', default=2, cast=float)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=120, cast=int)
+OUTBOX_RETRY_SECONDS = config('OUTBOX_RETRY_SECONDS', default=10, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=8, cast=int)
+RETENTION_OUTBOX_DAYS = config('RETENTION_OUTBOX_DAYS', default=30, cast=int)
+
+# Nightly renewal worklist
+RENEWAL_CLAIM_BATCH_SIZE = config('RENEWAL_CLAIM_BATCH_SIZE', default=100, cast=int)
+RENEWAL_CLAIM_LEASE_MINUTES = config('RENEWAL_CLAIM_LEASE_MINUTES', default=30, cast=int)
+# Number of Celery shard tasks the nightly pipeline fans out into
+NIGHTLY_SHARDS = config('NIGHTLY_SHARDS', default=4, cast=int)
+
+# Metrics: served straight from the ASGI handler, bypassing the Django middleware stack
+METRICS_PATH = config('METRICS_PATH', default='/metrics')
+# Bearer token required to scrape, empty disables the check
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_CELERY_QUEUES = config('METRICS_CELERY_QUEUES', default='celery', cast=Csv())
+
+# Per-handler SQL query budget and N+1 detection, meant for development and staging
+QUERY_BUDGET_ENABLED = config('QUERY_BUDGET_ENABLED', default=DEBUG, cast=bool)
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=10, cast=int)
+# A query shape executed this many times in one handler run is reported as N+1
+QUERY_REPEAT_THRESHOLD = config('QUERY_REPEAT_THRESHOLD', default=3, cast=int)
+
+# Write-behind registration: new users are buffered in Redis and bulk inserted (users.registration)
+REGISTRATION_BUFFER_ENABLED = config('REGISTRATION_BUFFER_ENABLED', default=True, cast=bool)
+REGISTRATION_FLUSH_INTERVAL_MS = config('REGISTRATION_FLUSH_INTERVAL_MS', default=300, cast=int)
+REGISTRATION_FLUSH_SIZE = config('REGISTRATION_FLUSH_SIZE', default=500, cast=int)
+
+# Redis keyspace policy (core/keyspace.py): unfinished FSM forms expire, per-user attributes
+# live in hash buckets and expire after the last write. Size USER_ATTRS_BUCKETS to about
+# users / 80, so even the fullest bucket stays under the listpack limit (128 fields by default)
+FSM_STATE_TTL = config('FSM_STATE_TTL', default=24 * 3600, cast=int)
+FSM_DATA_TTL = config('FSM_DATA_TTL', default=24 * 3600, cast=int)
+USER_ATTRS_BUCKETS = config('USER_ATTRS_BUCKETS', default=1000, cast=int)
+USER_ATTRS_TTL = config('USER_ATTRS_TTL', default=90 * 24 * 3600, cast=int)
+
+# Cached /check answer (users/snapshot.py); dropped on every subscription change, the TTL covers channel changes
+SUBSCRIPTION_SNAPSHOT_TTL = config('SUBSCRIPTION_SNAPSHOT_TTL', default=600, cast=int)
+
+# Per-user flood throttling (bot/middleware/throttling.py): handler group -> (events, window seconds, action).
+# Handlers pick a group with the `throttle` flag; action is 'drop', 'delay' or 'answer'
+THROTTLE_ENABLED = config('THROTTLE_ENABLED', default=True, cast=bool)
+THROTTLE_POLICIES = {
+    'default': (20, 10, 'answer'),
+    'start': (5, 30, 'drop'),
+    'status': (5, 30, 'answer'),
+    'payment': (10, 60, 'answer'),
+    'input': (10, 10, 'delay'),
+}
+# Longest wait of the 'delay' action; events that would wait longer are dropped
+THROTTLE_MAX_DELAY_SECONDS = config('THROTTLE_MAX_DELAY_SECONDS', default=2, cast=float)
+
+# Per-user single-flight guard of payment and card handlers (bot/middleware/single_flight.py)
+SINGLE_FLIGHT_ENABLED = config('SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+# Upper bound of one handler run; the guard is released as soon as the handler returns
+SINGLE_FLIGHT_TTL = config('SINGLE_FLIGHT_TTL', default=60, cast=int)
+
+# Update de-duplication by update_id; Telegram keeps undelivered updates for 24 hours
+UPDATE_DEDUP_ENABLED = config('UPDATE_DEDUP_ENABLED', default=True, cast=bool)
+UPDATE_DEDUP_TTL = config('UPDATE_DEDUP_TTL', default=24 * 3600, cast=int)
+# How long a running update keeps its duplicates out before it counts as abandoned
+UPDATE_DEDUP_INFLIGHT_TTL = config('UPDATE_DEDUP_INFLIGHT_TTL', default=120, cast=int)
+# Failed updates kept for `manage.py replay_dead_letters`
+DEAD_LETTER_MAXLEN = config('DEAD_LETTER_MAXLEN', default=10000, cast=int)
+
+# `manage.py runbot` long-polling worker
+POLLING_LIMIT = config('POLLING_LIMIT', default=100, cast=int)
+POLLING_TIMEOUT = config('POLLING_TIMEOUT', default=30, cast=int)
+POLLING_CONCURRENCY = config('POLLING_CONCURRENCY', default=50, cast=int)
+POLLING_MAX_PENDING = config('POLLING_MAX_PENDING', default=1000, cast=int)
+POLLING_METRICS_PORT = config('POLLING_METRICS_PORT', default=0, cast=int)
+
+# Bot API rate limiter shared by every process (bot/utils/rate_limit.py)
+RATE_LIMIT_ENABLED = config('RATE_LIMIT_ENABLED', default=True, cast=bool)
+RATE_LIMIT_GLOBAL_PER_SECOND = config('RATE_LIMIT_GLOBAL_PER_SECOND', default=30, cast=int)
+RATE_LIMIT_CHAT_PER_SECOND = config('RATE_LIMIT_CHAT_PER_SECOND', default=1, cast=int)
+RATE_LIMIT_CHAT_BURST = config('RATE_LIMIT_CHAT_BURST', default=3, cast=int)
+RATE_LIMIT_GROUP_PER_MINUTE = config('RATE_LIMIT_GROUP_PER_MINUTE', default=20, cast=int)
+# Global tokens bulk traffic leaves to interactive handlers
+RATE_LIMIT_INTERACTIVE_RESERVE = config('RATE_LIMIT_INTERACTIVE_RESERVE', default=5, cast=int)
+# Retries after a flood wait, once the limiter has held the chat back for retry_after
+RATE_LIMIT_RETRIES = config('RATE_LIMIT_RETRIES', default=1, cast=int)
+
+# Outbound call resilience (core/resilience.py): circuit breakers over the last BREAKER_WINDOW calls
+BREAKER_WINDOW = config('BREAKER_WINDOW', default=20, cast=int)
+BREAKER_MIN_CALLS = config('BREAKER_MIN_CALLS', default=10, cast=int)
+BREAKER_FAILURE_RATE = config('BREAKER_FAILURE_RATE', default=0.5, cast=float)
+BREAKER_SLOW_CALL_RATE = config('BREAKER_SLOW_CALL_RATE', default=0.8, cast=float)
+BREAKER_OPEN_SECONDS = config('BREAKER_OPEN_SECONDS', default=30, cast=int)
+# How long a call may wait for a free bulkhead slot before it is rejected
+BULKHEAD_INTERACTIVE_QUEUE_SECONDS = config('BULKHEAD_INTERACTIVE_QUEUE_SECONDS', default=2, cast=float)
+BULKHEAD_BATCH_QUEUE_SECONDS = config('BULKHEAD_BATCH_QUEUE_SECONDS', default=60, cast=float)
+CLICK_SLOW_CALL_SECONDS = config('CLICK_SLOW_CALL_SECONDS', default=5, cast=float)
+CLICK_BULKHEAD_INTERACTIVE = config('CLICK_BULKHEAD_INTERACTIVE', default=10, cast=int)
+CLICK_BULKHEAD_BATCH = config('CLICK_BULKHEAD_BATCH', default=4, cast=int)
+TELEGRAM_TIMEOUT_SECONDS = config('TELEGRAM_TIMEOUT_SECONDS', default=15, cast=float)
+TELEGRAM_SLOW_CALL_SECONDS = config('TELEGRAM_SLOW_CALL_SECONDS', default=5, cast=float)
+TELEGRAM_BULKHEAD_INTERACTIVE = config('TELEGRAM_BULKHEAD_INTERACTIVE', default=50, cast=int)
+TELEGRAM_BULKHEAD_BATCH = config('TELEGRAM_BULKHEAD_BATCH', default=30, cast=int)
+
+# How long 'drain' background jobs may keep running after the lifespan shutdown starts
+BACKGROUND_JOBS_SHUTDOWN_TIMEOUT = config('BACKGROUND_JOBS_SHUTDOWN_TIMEOUT', default=20, cast=int)
+
 CELERY_BROKER_URL = f'redis://{config("REDIS_HOST", default="localhost")}:6379/1'
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
 CELERY_RESULT_EXPIRES = 48 * 3600
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+
+
+class CoreConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'core'
+
+    def ready(self):
+        from core.metrics import REGISTRY, celery as celery_metrics
+        from core.metrics.db import install_execute_wrapper
+
+        connection_created.connect(install_execute_wrapper, dispatch_uid='core.metrics.db')
+        REGISTRY.add_collector(celery_metrics.collect)
@@ -0,0 +1,2 @@
+from .pool import get_pool, pool_context
+from .queries import claim_renewal_items, get_user, get_user_card
@@ -0,0 +1,79 @@
+"""
+Native async Postgres pool (psycopg 3) for the hottest read paths.
+
+A pool belongs to the event loop that opened it: the ASGI lifespan opens one for
+the web process and async Celery tasks can open a short-lived one with
+`pool_context()`. Without psycopg 3, with ASYNC_DB_POOL_ENABLED off, or outside
+such a context, `get_pool()` returns None and callers use the Django async ORM.
+"""
+import asyncio
+import contextlib
+import logging
+import weakref
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+try:
+    from psycopg.conninfo import make_conninfo
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+logger = logging.getLogger(__name__)
+
+POOL_ALIAS = 'async_pool'
+
+_pools: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncConnectionPool]' = weakref.WeakKeyDictionary()
+
+
+def is_available() -> bool:
+    return settings.ASYNC_DB_POOL_ENABLED and AsyncConnectionPool is not None
+
+
+def get_pool():
+    """The pool opened for the running event loop, if any"""
+    try:
+        return _pools.get(asyncio.get_running_loop())
+    except RuntimeError:
+        return None
+
+
+def _conninfo() -> str:
+    database = settings.DATABASES[DEFAULT_DB_ALIAS]
+    return make_conninfo(
+        dbname=database['NAME'],
+        user=database['USER'],
+        password=database['PASSWORD'],
+        host=database['HOST'],
+        port=database['PORT'],
+        application_name='async_pool',
+        # Same session settings Django uses, so rows decode to the same Python values
+        client_encoding='UTF8',
+        options=f"-c TimeZone={'UTC' if settings.USE_TZ else settings.TIME_ZONE}",
+    )
+
+
+@contextlib.asynccontextmanager
+async def pool_context():
+    """Open a pool for the running loop for the duration of the block (no-op if unavailable or already open)"""
+    loop = asyncio.get_running_loop()
+    if not is_available() or loop in _pools:
+        yield _pools.get(loop)
+        return
+
+    pool = AsyncConnectionPool(
+        _conninfo(),
+        min_size=settings.ASYNC_DB_POOL_MIN_SIZE,
+        max_size=settings.ASYNC_DB_POOL_MAX_SIZE,
+        kwargs={'autocommit': True},
+        open=False,
+    )
+    await pool.open()
+    _pools[loop] = pool
+    logger.info(f"Async DB pool opened ({settings.ASYNC_DB_POOL_MIN_SIZE}-{settings.ASYNC_DB_POOL_MAX_SIZE})")
+    try:
+        yield pool
+    finally:
+        _pools.pop(loop, None)
+        await pool.close()
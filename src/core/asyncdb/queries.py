@@ -0,0 +1,137 @@
+"""
+Hot queries on the native async pool, returning regular model instances.
+Each falls back to the Django async ORM when no pool is open for the running loop.
+"""
+import time
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from core.metrics.db import record_query
+from order.models import Course, RenewalWorkItem
+from order.services import RenewalWorklistService
+from users.models import User, UserCard
+from users.registration import RegistrationBuffer
+
+from .pool import POOL_ALIAS, get_pool
+
+
+def _columns(model, alias: str = None) -> str:
+    prefix = f'{alias}.' if alias else ''
+    return ', '.join(f'{prefix}"{field.column}"' for field in model._meta.concrete_fields)
+
+
+def _build(model, values):
+    """Model instance from a row slice in concrete field order, as the ORM would load it"""
+    fields = model._meta.concrete_fields
+    connection = connections[DEFAULT_DB_ALIAS]
+    values = [
+        field.from_db_value(value, None, connection) if hasattr(field, 'from_db_value') else value
+        for field, value in zip(fields, values)
+    ]
+    return model.from_db(DEFAULT_DB_ALIAS, [field.attname for field in fields], values)
+
+
+async def _fetch(pool, sql: str, params) -> list[tuple]:
+    start = time.perf_counter()
+    async with pool.connection() as connection:
+        cursor = await connection.execute(sql, params)
+        rows = await cursor.fetchall()
+    record_query(sql, time.perf_counter() - start, POOL_ALIAS)
+    return rows
+
+
+USER_SQL = f'SELECT {_columns(User)} FROM "{User._meta.db_table}" WHERE "telegram_id" = %s'
+
+
+async def get_user(telegram_id: int) -> User | None:
+    """User by telegram_id, including registrations still waiting in the write-behind buffer"""
+    pool = get_pool()
+    if pool is None:
+        user = await User.objects.filter(telegram_id=telegram_id).afirst()
+    else:
+        rows = await _fetch(pool, USER_SQL, [telegram_id])
+        user = _build(User, rows[0]) if rows else None
+    if user is None and settings.REGISTRATION_BUFFER_ENABLED:
+        user = await RegistrationBuffer.get(telegram_id)
+    return user
+
+
+CARD_SQL = f'SELECT {_columns(UserCard)} FROM "{UserCard._meta.db_table}" WHERE "user_id" = %s'
+
+
+async def get_user_card(telegram_id: int, confirmed_only: bool = False) -> UserCard | None:
+    """First card of the user by id, like `UserCard.objects.filter(user_id=...).afirst()`"""
+    pool = get_pool()
+    if pool is None:
+        queryset = UserCard.objects.filter(user_id=telegram_id)
+        if confirmed_only:
+            queryset = queryset.filter(is_confirmed=True)
+        return await queryset.afirst()
+    sql = CARD_SQL + (' AND "is_confirmed"' if confirmed_only else '') + ' ORDER BY "id" LIMIT 1'
+    rows = await _fetch(pool, sql, [telegram_id])
+    return _build(UserCard, rows[0]) if rows else None
+
+
+def _claim_sql(sharded: bool) -> str:
+    item_table = RenewalWorkItem._meta.db_table
+    shard_filter = 'AND MOD("user_id", %(shards)s) = %(shard)s' if sharded else ''
+    return f"""
+        WITH claimed AS (
+            UPDATE "{item_table}"
+               SET "status" = %(processing)s, "claimed_at" = %(now)s,
+                   "attempts" = "attempts" + 1, "updated_at" = %(now)s
+             WHERE "id" IN (
+                SELECT "id" FROM "{item_table}"
+                 WHERE "due_date" = %(due_date)s AND "stage" = %(stage)s {shard_filter}
+                   AND ("status" = %(pending)s OR ("status" = %(processing)s AND "claimed_at" < %(stale_before)s))
+                 ORDER BY "id"
+                 LIMIT %(limit)s
+                   FOR UPDATE SKIP LOCKED
+             )
+            RETURNING *
+        )
+        SELECT {_columns(RenewalWorkItem, 'claimed')}, {_columns(User, 'u')}, {_columns(Course, 'c')}
+          FROM claimed
+          JOIN "{User._meta.db_table}" u ON u."telegram_id" = claimed."user_id"
+          LEFT JOIN "{Course._meta.db_table}" c ON c."id" = claimed."course_id"
+         ORDER BY claimed."id"
+    """
+
+
+async def claim_renewal_items(stage: str, due_date: date = None, limit: int = None,
+                              shard: int = 0, shards: int = 1) -> list[RenewalWorkItem]:
+    """
+    RenewalWorklistService.claim as one UPDATE ... RETURNING statement, with user and course loaded.
+    """
+    pool = get_pool()
+    if pool is None:
+        return await sync_to_async(RenewalWorklistService.claim)(stage, due_date, limit, shard=shard, shards=shards)
+
+    now = timezone.now()
+    params = {
+        'stage': stage,
+        'due_date': due_date or timezone.localdate(),
+        'limit': limit or settings.RENEWAL_CLAIM_BATCH_SIZE,
+        'shard': shard,
+        'shards': shards,
+        'now': now,
+        'stale_before': now - timedelta(minutes=settings.RENEWAL_CLAIM_LEASE_MINUTES),
+        'pending': RenewalWorkItem.Status.PENDING,
+        'processing': RenewalWorkItem.Status.PROCESSING,
+    }
+    rows = await _fetch(pool, _claim_sql(shards > 1), params)
+
+    item_width = len(RenewalWorkItem._meta.concrete_fields)
+    user_width = len(User._meta.concrete_fields)
+    items = []
+    for row in rows:
+        item = _build(RenewalWorkItem, row[:item_width])
+        item.user = _build(User, row[item_width:item_width + user_width])
+        course_values = row[item_width + user_width:]
+        item.course = _build(Course, course_values) if course_values[0] is not None else None
+        items.append(item)
+    return items
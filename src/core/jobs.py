@@ -0,0 +1,274 @@
+"""
+Supervised background jobs of the web process.
+
+Long in-process work (admin bulk operations, polling in development) is submitted
+to `supervisor` instead of a bare `asyncio.create_task`. Every job kind has its own
+concurrency limit and queue bound, jobs are strongly referenced until they finish,
+report progress, and are drained or cancelled when the ASGI lifespan shuts down.
+
+Resumable kinds persist their parameters, progress and checkpoint in Redis; a job
+interrupted by a restart is picked up again by the next process that starts. While a
+process runs a persisted job it keeps an ownership key alive, so other workers
+don't resume it twice.
+"""
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+import redis
+from django.conf import settings
+
+from core.metrics import REGISTRY
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+STATE_KEY = 'jobs:state'
+OWNER_KEY = 'jobs:owner:{}'
+OWNER_TTL = 60
+
+JOBS_FINISHED = REGISTRY.counter(
+    'background_jobs_finished_total', "Background jobs by outcome", ('kind', 'status'),
+)
+JOBS_ACTIVE = REGISTRY.gauge(
+    'background_jobs', "Background jobs waiting for a slot or running", ('kind', 'status'),
+)
+JOB_SECONDS = REGISTRY.histogram(
+    'background_job_duration_seconds', "Background job run time", ('kind',),
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 4 * 3600),
+)
+
+
+class JobRejected(Exception):
+    """The kind's queue is full or the supervisor is shutting down"""
+
+
+@dataclass
+class JobKind:
+    name: str
+    handler: Callable[..., Awaitable[Any]]
+    concurrency: int = 1
+    # Jobs allowed to wait for a free slot
+    max_queued: int = 10
+    # 'drain': wait for the job on shutdown (up to the timeout); 'cancel': cancel it right away
+    on_shutdown: str = 'cancel'
+    resumable: bool = False
+
+
+@dataclass
+class Job:
+    id: str
+    kind: JobKind
+    params: dict
+    checkpoint: dict = field(default_factory=dict)
+    progress: dict = field(default_factory=dict)
+    status: str = 'queued'
+    submitted_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    task: asyncio.Task | None = None
+    stop_callbacks: list[Callable[[], None]] = field(default_factory=list)
+
+    def report(self, **progress) -> None:
+        """Update the progress counters shown by `supervisor.status()`"""
+        self.progress.update(progress)
+
+    async def save(self, **checkpoint) -> None:
+        """Persist the checkpoint (and progress) of a resumable job"""
+        self.checkpoint.update(checkpoint)
+        if self.kind.resumable:
+            await supervisor.persist(self)
+
+    def on_stop(self, callback: Callable[[], None]) -> None:
+        """Called when the supervisor shuts down, for jobs that can stop early on their own"""
+        self.stop_callbacks.append(callback)
+
+    def as_dict(self) -> dict:
+        return {
+            'id': self.id,
+            'kind': self.kind.name,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'running_s': round(time.time() - self.started_at) if self.started_at else 0,
+        }
+
+
+class JobSupervisor:
+    def __init__(self):
+        self.kinds: dict[str, JobKind] = {}
+        self.jobs: dict[str, Job] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._accepting = False
+        self._owner = uuid.uuid4().hex
+        self._heartbeat: asyncio.Task | None = None
+
+    def register(self, name: str, handler, **options) -> JobKind:
+        kind = self.kinds[name] = JobKind(name, handler, **options)
+        return kind
+
+    def kind(self, name: str, **options):
+        """Decorator form of `register`"""
+        def decorator(handler):
+            self.register(name, handler, **options)
+            return handler
+        return decorator
+
+    def submit(self, name: str, **params) -> Job:
+        """Queue a job; `params` must be JSON-serializable for resumable kinds"""
+        if not self._accepting:
+            raise JobRejected("Background jobs are not running")
+        kind = self.kinds[name]
+        active = sum(1 for job in self.jobs.values() if job.kind is kind)
+        if active >= kind.concurrency + kind.max_queued:
+            raise JobRejected(f"Too many {name} jobs")
+        return self._start(Job(uuid.uuid4().hex[:12], kind, params))
+
+    def _start(self, job: Job) -> Job:
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job), name=f"job:{job.kind.name}:{job.id}")
+        self._track()
+        return job
+
+    def _track(self) -> None:
+        for kind in self.kinds:
+            for status in ('queued', 'running'):
+                count = sum(1 for job in self.jobs.values() if job.kind.name == kind and job.status == status)
+                JOBS_ACTIVE.set(count, kind=kind, status=status)
+
+    async def _run(self, job: Job) -> None:
+        kind = job.kind
+        semaphore = self._semaphores.setdefault(kind.name, asyncio.Semaphore(kind.concurrency))
+        try:
+            if kind.resumable:
+                await self.persist(job)
+            async with semaphore:
+                job.status = 'running'
+                job.started_at = time.time()
+                self._track()
+                logger.info(f"Job {kind.name}:{job.id} started")
+                await kind.handler(job, **job.params)
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+            logger.warning(f"Job {kind.name}:{job.id} cancelled at {job.progress}")
+            # Resumable jobs keep their state; release them so the next process resumes right away
+            await self._release(job)
+            raise
+        except Exception as e:
+            job.status = 'failed'
+            logger.exception(f"Job {kind.name}:{job.id} failed: {e}")
+            await self._forget(job)
+        else:
+            job.status = 'done'
+            logger.info(f"Job {kind.name}:{job.id} done: {job.progress}")
+            await self._forget(job)
+        finally:
+            JOBS_FINISHED.inc(kind=kind.name, status=job.status)
+            if job.started_at:
+                JOB_SECONDS.observe(time.time() - job.started_at, kind=kind.name)
+            self.jobs.pop(job.id, None)
+            self._track()
+
+    def status(self) -> list[dict]:
+        return [job.as_dict() for job in self.jobs.values()]
+
+    # Persistence
+
+    async def persist(self, job: Job) -> None:
+        state = {
+            'kind': job.kind.name,
+            'params': job.params,
+            'checkpoint': job.checkpoint,
+            'progress': job.progress,
+            'submitted_at': job.submitted_at,
+        }
+        try:
+            client = get_redis()
+            await client.hset(STATE_KEY, job.id, json.dumps(state))
+            await client.set(OWNER_KEY.format(job.id), self._owner, ex=OWNER_TTL)
+        except redis.RedisError as e:
+            logger.warning(f"Could not persist job {job.id}: {e}")
+
+    async def _forget(self, job: Job) -> None:
+        if not job.kind.resumable:
+            return
+        try:
+            client = get_redis()
+            await client.hdel(STATE_KEY, job.id)
+            await client.delete(OWNER_KEY.format(job.id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not remove job {job.id}: {e}")
+
+    async def _release(self, job: Job) -> None:
+        if not job.kind.resumable:
+            return
+        try:
+            await get_redis().delete(OWNER_KEY.format(job.id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not release job {job.id}: {e}")
+
+    async def _resume(self) -> None:
+        """Restart persisted jobs whose owner process is gone"""
+        client = get_redis()
+        for job_id, raw in (await client.hgetall(STATE_KEY)).items():
+            job_id = job_id.decode()
+            state = json.loads(raw)
+            kind = self.kinds.get(state['kind'])
+            if kind is None or not kind.resumable:
+                await client.hdel(STATE_KEY, job_id)
+                continue
+            # Claim it, unless another live process runs it
+            if not await client.set(OWNER_KEY.format(job_id), self._owner, ex=OWNER_TTL, nx=True):
+                continue
+            job = Job(job_id, kind, state['params'], state['checkpoint'], state['progress'],
+                      submitted_at=state['submitted_at'])
+            logger.info(f"Resuming job {kind.name}:{job_id} at {job.checkpoint}")
+            self._start(job)
+
+    async def _keep_ownership(self) -> None:
+        while True:
+            await asyncio.sleep(OWNER_TTL / 3)
+            owned = [job for job in self.jobs.values() if job.kind.resumable]
+            try:
+                client = get_redis()
+                for job in owned:
+                    await client.set(OWNER_KEY.format(job.id), self._owner, ex=OWNER_TTL)
+            except redis.RedisError as e:
+                logger.warning(f"Could not refresh job ownership: {e}")
+
+    # Lifecycle
+
+    async def start(self) -> None:
+        self._accepting = True
+        self._heartbeat = asyncio.create_task(self._keep_ownership())
+        try:
+            await self._resume()
+        except redis.RedisError as e:
+            logger.warning(f"Could not resume background jobs: {e}")
+
+    async def shutdown(self, timeout: float = None) -> None:
+        """Stop accepting jobs, let 'drain' jobs finish within `timeout`, cancel the rest"""
+        timeout = settings.BACKGROUND_JOBS_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        self._accepting = False
+        jobs = list(self.jobs.values())
+        for job in jobs:
+            for callback in job.stop_callbacks:
+                callback()
+            if job.kind.on_shutdown != 'drain':
+                job.task.cancel()
+
+        tasks = [job.task for job in jobs]
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+
+
+supervisor = JobSupervisor()
@@ -0,0 +1,131 @@
+"""
+Redis keyspace policy.
+
+Every key family the project writes to the cache database is declared in
+`KEYSPACE` with its prefix and what bounds it (a TTL, a cap, or a consumer that
+drains it). Redis memory then follows the active users, not everyone who ever
+touched the bot, and `manage.py redis_keyspace` can attribute memory to an owner.
+
+Small per-user values (the interface language) are not a key per user: they are
+fields of hash buckets `user:attrs:<crc32(telegram_id) % USER_ATTRS_BUCKETS>`.
+Telegram IDs are sparse, so they are hashed rather than divided into ranges: every
+bucket gets its share of the users. With about 80 fields per bucket it keeps
+Redis' compact listpack encoding (hash-max-listpack-entries, 128 by default) and
+costs a fraction of the per-key overhead. A bucket expires USER_ATTRS_TTL after
+its last write; values are plain strings, not pickles.
+"""
+import logging
+import zlib
+from dataclasses import dataclass
+
+import redis
+from django.conf import settings
+from django_redis import get_redis_connection
+
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+USER_ATTRS_KEY = 'user:attrs:{}'
+
+
+@dataclass(frozen=True)
+class Namespace:
+    prefix: str
+    owner: str
+    # How the family is bounded
+    policy: str
+
+
+KEYSPACE = [
+    Namespace('fsm:', 'bot.utils.storage', 'FSM_STATE_TTL / FSM_DATA_TTL'),
+    Namespace('user:attrs:', 'core.keyspace', 'USER_ATTRS_TTL per bucket'),
+    Namespace('subscription:snapshot:', 'users.snapshot', 'SUBSCRIPTION_SNAPSHOT_TTL'),
+    Namespace('throttle:', 'bot.middleware.throttling', 'policy window'),
+    Namespace('inflight:', 'bot.middleware.single_flight', 'SINGLE_FLIGHT_TTL'),
+    Namespace('bot:ratelimit:', 'bot.utils.rate_limit', 'bucket refill time'),
+    Namespace('bot:polling:', 'bot.polling', 'one key per bot'),
+    Namespace('updates:seen:', 'bot.middleware.dedup', 'UPDATE_DEDUP_TTL'),
+    Namespace('updates:inflight:', 'bot.middleware.dedup', 'UPDATE_DEDUP_INFLIGHT_TTL'),
+    Namespace('updates:dead-letters', 'bot.utils.dead_letters', 'DEAD_LETTER_MAXLEN entries'),
+    Namespace('registrations:', 'users.registration', 'drained by the flusher'),
+    Namespace('jobs:', 'core.jobs', 'removed when the job ends'),
+    Namespace('metrics:', 'core.metrics.celery', 'one field per task, state and bucket'),
+    Namespace('celery-task-meta-', 'celery results', 'result_expires'),
+    Namespace(':1:user_lang:', 'legacy', 'none: replaced by user:attrs, delete with --delete-legacy'),
+    Namespace(':1:', 'django cache', 'per call timeout'),
+]
+LEGACY_PATTERNS = [':1:user_lang:*', ':1:fsm:*']
+
+
+def namespace_of(key: str) -> str:
+    """Declared prefix of `key` (the longest match), or its first segment"""
+    matches = [namespace.prefix for namespace in KEYSPACE if key.startswith(namespace.prefix)]
+    if matches:
+        return max(matches, key=len)
+    return key.split(':', 1)[0] + ':*' if ':' in key else key
+
+
+class UserAttributes:
+    """Small per-user string values in bucketed hashes"""
+
+    @staticmethod
+    def _location(telegram_id: int, name: str) -> tuple[str, str]:
+        telegram_id = str(int(telegram_id))
+        bucket = zlib.crc32(telegram_id.encode()) % settings.USER_ATTRS_BUCKETS
+        return USER_ATTRS_KEY.format(bucket), f'{telegram_id}:{name}'
+
+    @classmethod
+    async def aget(cls, telegram_id: int, name: str) -> str | None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            value = await get_redis().hget(key, field)
+        except redis.RedisError as e:
+            logger.warning(f"User attribute {name} unavailable: {e}")
+            return None
+        return value.decode() if value is not None else None
+
+    @classmethod
+    async def aset(cls, telegram_id: int, name: str, value: str) -> None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                await pipe.hset(key, field, value).expire(key, settings.USER_ATTRS_TTL).execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not store user attribute {name}: {e}")
+
+    @classmethod
+    async def adelete(cls, telegram_id: int, name: str) -> None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            await get_redis().hdel(key, field)
+        except redis.RedisError as e:
+            logger.warning(f"Could not delete user attribute {name}: {e}")
+
+    @classmethod
+    def get(cls, telegram_id: int, name: str) -> str | None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            value = get_redis_connection('default').hget(key, field)
+        except redis.RedisError as e:
+            logger.warning(f"User attribute {name} unavailable: {e}")
+            return None
+        return value.decode() if value is not None else None
+
+    @classmethod
+    def set(cls, telegram_id: int, name: str, value: str) -> None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            get_redis_connection('default').pipeline(transaction=False).hset(key, field, value).expire(
+                key, settings.USER_ATTRS_TTL
+            ).execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not store user attribute {name}: {e}")
+
+    @classmethod
+    def delete(cls, telegram_id: int, name: str) -> None:
+        key, field = cls._location(telegram_id, name)
+        try:
+            get_redis_connection('default').hdel(key, field)
+        except redis.RedisError as e:
+            logger.warning(f"Could not delete user attribute {name}: {e}")
@@ -0,0 +1,106 @@
+import random
+from collections import Counter, defaultdict
+
+import redis
+from django.core.management import BaseCommand, CommandError
+from django_redis import get_redis_connection
+
+from core.keyspace import KEYSPACE, LEGACY_PATTERNS, namespace_of
+
+
+class Command(BaseCommand):
+    help = "Report Redis memory per key prefix (MEMORY USAGE sampling), optionally delete legacy keys"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=float, default=0.1, help="Fraction of keys measured, 0-1")
+        parser.add_argument('--min-samples', type=int, default=20,
+                            help="Always measure this many keys of every prefix, so small prefixes show up")
+        parser.add_argument('--match', default='*', help="Only scan keys matching this pattern")
+        parser.add_argument('--scan-count', type=int, default=1000, help="COUNT hint of each SCAN call")
+        parser.add_argument('--delete-legacy', action='store_true',
+                            help=f"UNLINK keys replaced by the keyspace policy: {', '.join(LEGACY_PATTERNS)}")
+
+    def handle(self, *args, **options):
+        client = get_redis_connection('default')
+        if options['delete_legacy']:
+            self.delete_legacy(client, options['scan_count'])
+            return
+
+        keys = Counter()
+        stats = defaultdict(lambda: {'sampled': 0, 'bytes': 0, 'no_ttl': 0, 'types': Counter()})
+        batch = []
+        for key in client.scan_iter(match=options['match'], count=options['scan_count']):
+            namespace = namespace_of(key.decode(errors='replace'))
+            keys[namespace] += 1
+            if keys[namespace] <= options['min_samples'] or random.random() < options['sample']:
+                batch.append((namespace, key))
+            if len(batch) >= 500:
+                self.measure(client, batch, stats)
+                batch = []
+        if batch:
+            self.measure(client, batch, stats)
+        self.report(keys, stats)
+
+    @staticmethod
+    def measure(client, batch, stats):
+        pipe = client.pipeline(transaction=False)
+        for _, key in batch:
+            pipe.execute_command('MEMORY', 'USAGE', key, 'SAMPLES', 5)
+            pipe.execute_command('OBJECT', 'ENCODING', key)
+            pipe.pttl(key)
+        try:
+            results = pipe.execute(raise_on_error=False)
+        except redis.RedisError as e:
+            raise CommandError(f"Could not sample keys: {e}")
+        for index, (namespace, _) in enumerate(batch):
+            usage, encoding, ttl = results[index * 3:index * 3 + 3]
+            if isinstance(usage, redis.ResponseError):
+                raise CommandError(f"MEMORY USAGE is not supported by this server: {usage}")
+            if usage is None:
+                # Expired between SCAN and MEMORY USAGE
+                continue
+            namespace_stats = stats[namespace]
+            namespace_stats['sampled'] += 1
+            namespace_stats['bytes'] += usage
+            namespace_stats['types'][encoding.decode() if isinstance(encoding, bytes) else '?'] += 1
+            if ttl == -1:
+                namespace_stats['no_ttl'] += 1
+
+    def report(self, keys, stats):
+        policies = {namespace.prefix: namespace.policy for namespace in KEYSPACE}
+        rows = []
+        for namespace, count in keys.items():
+            namespace_stats = stats[namespace]
+            sampled = namespace_stats['sampled'] or 1
+            average = namespace_stats['bytes'] / sampled
+            rows.append((
+                namespace, count, average * count, average,
+                100 * namespace_stats['no_ttl'] / sampled,
+                ' '.join(f"{name}:{n}" for name, n in namespace_stats['types'].most_common()),
+                policies.get(namespace, 'undeclared'),
+            ))
+        rows.sort(key=lambda row: -row[2])
+
+        self.stdout.write(
+            f"{'prefix':<26} {'keys':>9} {'est. MB':>9} {'avg B':>8} {'no TTL':>7}  {'encodings':<24} policy"
+        )
+        for namespace, count, total, average, no_ttl, encodings, policy in rows:
+            self.stdout.write(
+                f"{namespace:<26} {count:>9} {total / 2 ** 20:>9.2f} {average:>8.0f} {no_ttl:>6.0f}%  "
+                f"{encodings:<24} {policy}"
+            )
+        total_mb = sum(row[2] for row in rows) / 2 ** 20
+        self.stdout.write(f"{sum(keys.values())} keys, ~{total_mb:.2f} MB estimated")
+
+    def delete_legacy(self, client, scan_count):
+        deleted = 0
+        for pattern in LEGACY_PATTERNS:
+            batch = []
+            for key in client.scan_iter(match=pattern, count=scan_count):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted += client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += client.unlink(*batch)
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} legacy keys"))
@@ -0,0 +1,3 @@
+from .registry import REGISTRY, Counter, Gauge, Histogram
+from .db import QueryLog, QueryStats, observe_queries
+from .http import make_trace_config
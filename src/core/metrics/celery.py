@@ -0,0 +1,99 @@
+"""
+Celery task duration and queue depth.
+
+Workers run in other processes, so task timings are accumulated in a Redis hash on
+the broker and read back, together with the queue lengths, on every scrape.
+"""
+import logging
+import math
+import time
+
+import redis
+import redis.asyncio as aioredis
+from celery.signals import task_postrun, task_prerun
+from django.conf import settings
+
+from .registry import DEFAULT_BUCKETS, format_labels, format_value
+
+logger = logging.getLogger(__name__)
+
+TASK_STATS_KEY = 'metrics:celery:tasks'
+BUCKETS = DEFAULT_BUCKETS + (30.0, 60.0, 300.0, 900.0, math.inf)
+
+_started: dict[str, float] = {}
+_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=1)
+    return _client
+
+
+@task_prerun.connect
+def _on_task_prerun(task_id=None, **kwargs):
+    _started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def _on_task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _started.pop(task_id, None)
+    if started is None:
+        return
+    duration = time.perf_counter() - started
+    prefix = f"{task.name}\t{state or 'UNKNOWN'}"
+    bucket = next(bound for bound in BUCKETS if duration <= bound)
+    try:
+        pipe = _get_client().pipeline(transaction=False)
+        pipe.hincrby(TASK_STATS_KEY, f"{prefix}\t{format_value(bucket)}", 1)
+        pipe.hincrbyfloat(TASK_STATS_KEY, f"{prefix}\tsum", duration)
+        pipe.hincrby(TASK_STATS_KEY, f"{prefix}\tcount", 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not record Celery task metrics: {e}")
+
+
+def _render_task_stats(raw: dict) -> list[str]:
+    name = 'celery_task_duration_seconds'
+    series = {}
+    for field, value in raw.items():
+        task, state, kind = field.decode().split('\t')
+        series.setdefault((task, state), {})[kind] = float(value)
+
+    lines = [f"# HELP {name} Celery task run time", f"# TYPE {name} histogram"]
+    for (task, state), values in sorted(series.items()):
+        labels = {'task': task, 'state': state}
+        cumulative = 0
+        for bound in BUCKETS:
+            cumulative += values.get(format_value(bound), 0)
+            lines.append(f"{name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {format_value(cumulative)}")
+        lines.append(f"{name}_sum{format_labels(labels)} {format_value(values.get('sum', 0))}")
+        lines.append(f"{name}_count{format_labels(labels)} {format_value(values.get('count', 0))}")
+    return lines
+
+
+async def collect() -> list[str]:
+    """Registry collector: queue depth gauges and task durations from the broker"""
+    lines = [
+        "# HELP celery_queue_length Messages waiting in a Celery queue",
+        "# TYPE celery_queue_length gauge",
+    ]
+    client = aioredis.Redis.from_url(settings.CELERY_BROKER_URL, socket_timeout=1, socket_connect_timeout=1)
+    try:
+        for queue in settings.METRICS_CELERY_QUEUES:
+            length = await client.llen(queue)
+            lines.append(f"celery_queue_length{format_labels({'queue': queue})} {length}")
+        lines.extend(_render_task_stats(await client.hgetall(TASK_STATS_KEY)))
+        up = 1
+    except redis.RedisError as e:
+        logger.warning(f"Could not collect Celery metrics: {e}")
+        up = 0
+    finally:
+        await client.aclose()
+    lines += [
+        "# HELP celery_metrics_up Whether the Celery broker could be read",
+        "# TYPE celery_metrics_up gauge",
+        f"celery_metrics_up {up}",
+    ]
+    return lines
@@ -0,0 +1,104 @@
+"""
+Database query counting and timing.
+
+Every connection gets an execute wrapper on creation. Queries are always recorded
+in the global histogram; inside `observe_queries()` they are also collected on a
+`QueryStats` object. The stats live in a context variable, so queries issued from
+`sync_to_async` threads are attributed to the update that awaited them. Scopes
+nest: a query is recorded on the innermost stats and all of its parents.
+"""
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from .registry import REGISTRY
+
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    'db_query_duration_seconds', "Time spent executing SQL queries", ('alias',),
+)
+
+_current_stats: ContextVar['QueryStats | None'] = ContextVar('query_stats', default=None)
+
+
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*%s\s*,?)+\)', re.IGNORECASE)
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql: str) -> str:
+    """Query shape: literals and parameters replaced, IN lists collapsed"""
+    sql = _LITERAL_RE.sub('%s', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+@dataclass
+class QueryStats:
+    count: int = 0
+    duration: float = 0.0
+    parent: 'QueryStats | None' = field(default=None, repr=False)
+
+    def record(self, sql: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        if self.parent is not None:
+            self.parent.record(sql, duration)
+
+
+@dataclass
+class QueryLog(QueryStats):
+    """QueryStats that also keeps every statement"""
+    statements: list[tuple[str, float]] = field(default_factory=list)
+
+    def record(self, sql: str, duration: float) -> None:
+        self.statements.append((sql, duration))
+        super().record(sql, duration)
+
+    def shapes(self) -> dict[str, int]:
+        counts = {}
+        for sql, _ in self.statements:
+            shape = fingerprint(sql)
+            counts[shape] = counts.get(shape, 0) + 1
+        return counts
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        return {shape: count for shape, count in self.shapes().items() if count >= threshold}
+
+
+@contextmanager
+def observe_queries(stats: QueryStats = None):
+    stats = stats or QueryStats()
+    stats.parent = _current_stats.get()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def current_stats() -> QueryStats | None:
+    return _current_stats.get()
+
+
+def record_query(sql: str, duration: float, alias: str) -> None:
+    """Account a query run outside the Django connection wrappers (e.g. on the async pool)"""
+    DB_QUERY_SECONDS.observe(duration, alias=alias)
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(sql, duration)
+
+
+def _execute_wrapper(execute, sql, params, many, context):
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record_query(sql, time.perf_counter() - start, context['connection'].alias)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """`connection_created` receiver"""
+    if _execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_execute_wrapper)
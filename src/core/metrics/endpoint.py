@@ -0,0 +1,57 @@
+"""
+Bare ASGI app serving the registry. It is dispatched in `config.asgi` before the
+request reaches Django, so scrapes skip the middleware stack and the ORM.
+Processes without the web app (the polling worker) serve it with `start_metrics_server`.
+"""
+import hmac
+
+from aiohttp import web
+from django.conf import settings
+
+from .registry import REGISTRY
+
+CONTENT_TYPE = b'text/plain; version=0.0.4; charset=utf-8'
+
+
+async def _respond(send, status: int, body: bytes, content_type: bytes = b'text/plain') -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', content_type), (b'content-length', str(len(body)).encode())],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _is_authorized(authorization: bytes) -> bool:
+    if not settings.METRICS_TOKEN:
+        return True
+    expected = f"Bearer {settings.METRICS_TOKEN}".encode()
+    return hmac.compare_digest(authorization, expected)
+
+
+async def metrics_app(scope, receive, send):
+    if scope['method'] not in ('GET', 'HEAD'):
+        await _respond(send, 405, b'Method not allowed')
+        return
+    headers = dict(scope.get('headers') or [])
+    if not _is_authorized(headers.get(b'authorization', b'')):
+        await _respond(send, 401, b'Unauthorized')
+        return
+    body = (await REGISTRY.render()).encode()
+    await _respond(send, 200, body, CONTENT_TYPE)
+
+
+async def _aiohttp_handler(request: web.Request) -> web.Response:
+    if not _is_authorized(request.headers.get('Authorization', '').encode()):
+        return web.Response(status=401, text='Unauthorized')
+    return web.Response(body=(await REGISTRY.render()).encode(), headers={'Content-Type': CONTENT_TYPE.decode()})
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve METRICS_PATH on host:port from the running loop; clean up with `await runner.cleanup()`"""
+    app = web.Application()
+    app.router.add_get(settings.METRICS_PATH, _aiohttp_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,52 @@
+"""
+Outbound HTTP timing for aiohttp sessions (Telegram Bot API, Click).
+"""
+import time
+from types import SimpleNamespace
+from typing import Callable
+
+import aiohttp
+from yarl import URL
+
+from .registry import REGISTRY
+
+HTTP_CLIENT_SECONDS = REGISTRY.histogram(
+    'http_client_request_duration_seconds',
+    "Outbound HTTP request duration",
+    ('client', 'endpoint', 'method', 'status'),
+)
+
+
+def last_path_segment(url: URL) -> str:
+    return url.path.rstrip('/').rsplit('/', 1)[-1] or '/'
+
+
+def make_trace_config(client: str, resolve_endpoint: Callable[[URL], str] = last_path_segment) -> aiohttp.TraceConfig:
+    """
+    Trace config recording every request of a session under `client`.
+    `resolve_endpoint` maps the URL to a low-cardinality label and must never return secrets.
+    """
+
+    async def on_request_start(session, context: SimpleNamespace, params):
+        context.started = time.perf_counter()
+
+    def observe(context, params, status):
+        HTTP_CLIENT_SECONDS.observe(
+            time.perf_counter() - context.started,
+            client=client,
+            endpoint=resolve_endpoint(params.url),
+            method=params.method,
+            status=status,
+        )
+
+    async def on_request_end(session, context, params):
+        observe(context, params, params.response.status)
+
+    async def on_request_exception(session, context, params):
+        observe(context, params, type(params.exception).__name__)
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
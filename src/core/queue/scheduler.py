@@ -6,27 +6,23 @@ from datetime import date, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from django.utils import timezone
 from django.conf import settings
-import aiohttp
 
-from bot.functions import generate_auth_header
-from order.models import Course, PrivateChannel, Order
+from bot.client import get_bot
+from core.utils.constants import CONSTANTS
+from order.click_up.client import click_request, generate_auth_header
+from order.models import Course, PrivateChannel, Order, OutboxMessage
+from order.services import SubscriptionLedger
 from users.models import User, UserCard
 
-scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
-scheduler.start()
-
 logger = logging.getLogger(__name__)
 
-from bot.misc import bot
+# Created and started by `setup_scheduler()`, never at import
+scheduler = None
 
 
 async def process_auto_payment(user, course, user_card):
     """Process automatic payment for a user"""
-    order = await Order.objects.acreate(
-        user=user,
-        amount=course.amount,
-        course=course,
-    )
+    order = await Order.objects.aget_or_create_pending(user_id=user.telegram_id, course=course)
 
     url = f'{settings.CLICK_BASE_URL}/payment'
     headers = {
@@ -42,37 +38,35 @@ async def process_auto_payment(user, course, user_card):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                res_json = await response.json()
-
-        error_code = res_json.get("error_code")
-        payment_id = res_json.get("payment_id")
-
-        if error_code == -5017:  # Insufficient funds
-            order.payment_id = payment_id
-            await order.asave()
-            return False, "insufficient_funds"
-
-        elif error_code and error_code != 0:  # Other errors
-            order.payment_id = payment_id
-            await order.asave()
-            return False, "payment_error"
-
-        # Update user subscription
-        user.subscription_end_date = timezone.now().date() + timedelta(days=course.period)
-        if not user.is_subscribed:
-            user.subscription_start_date = timezone.now().date()
-            user.is_subscribed = True
-        await user.asave()
-
-        logger.info(f"Successfully renewed subscription for user {user.telegram_id}")
-        return True, "success"
-
+        res_json = await click_request('POST', url, headers=headers, json=payload)
     except Exception as e:
         logger.error(f"Payment processing failed for user {user.telegram_id}: {e}")
         return False, "network_error"
 
+    error_code = res_json.get("error_code")
+    payment_id = res_json.get("payment_id")
+
+    if error_code == -5017:  # Insufficient funds
+        order.status = CONSTANTS.PaymentStatus.FAILED
+        order.payment_id = payment_id
+        await order.asave(update_fields=["status", "payment_id", "updated_at"])
+        return False, "insufficient_funds"
+
+    elif error_code and error_code != 0:  # Other errors
+        order.status = CONSTANTS.PaymentStatus.FAILED
+        order.payment_id = payment_id
+        await order.asave(update_fields=["status", "payment_id", "updated_at"])
+        return False, "payment_error"
+
+    # Charged: errors past this point must not be reported as a retryable payment failure
+    await SubscriptionLedger.aextend(
+        order, is_auto_subscribe=True, payment_id=payment_id,
+        notification=OutboxMessage.Kind.SUBSCRIPTION_RENEWED,
+    )
+
+    logger.info(f"Successfully renewed subscription for user {user.telegram_id}")
+    return True, "success"
+
 
 async def remove_user_from_channels():
     """
@@ -102,12 +96,12 @@ async def remove_user_from_channels():
 
                     if not user.is_auto_subscribe:
                         # Users without auto-subscribe: kick immediately
-                        await bot.send_message(
+                        await get_bot().send_message(
                             telegram_id,
                             "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
                         )
 
-                        await bot.ban_chat_member(
+                        await get_bot().ban_chat_member(
                             chat_id=private_channel.private_channel_id,
                             user_id=telegram_id,
                             until_date=until_date
@@ -122,11 +116,11 @@ async def remove_user_from_channels():
 
                         if not user_card:
                             # No card available: kick immediately
-                            await bot.send_message(
+                            await get_bot().send_message(
                                 telegram_id,
                                 "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
                             )
-                            await bot.ban_chat_member(
+                            await get_bot().ban_chat_member(
                                 chat_id=private_channel.private_channel_id,
                                 user_id=telegram_id,
                                 until_date=until_date
@@ -139,7 +133,6 @@ async def remove_user_from_channels():
                             success, error_type = await process_auto_payment(user, course, user_card)
 
                             if success:
-                                await bot.send_message(telegram_id, "Kartadan pul yechib olindi. Obuna uzaytirildi.")
                                 logger.info(f"Successfully renewed subscription for user {telegram_id}")
                             else:
                                 # Payment failed: send warning, keep user for 1 hour retry
@@ -154,7 +147,7 @@ async def remove_user_from_channels():
                                         "1 soatdan so'ng qayta yechishga urinish bo'ladi."
                                     )
 
-                                await bot.send_message(telegram_id, message)
+                                await get_bot().send_message(telegram_id, message)
                                 logger.warning(f"Payment failed for user {telegram_id}, will retry in 1 hour")
                                 # Don't change subscription status - keep for retry
 
@@ -213,11 +206,11 @@ async def kick_unpaid_users_handler():
 
                         if not user_card:
                             # No card: kick user
-                            await bot.send_message(
+                            await get_bot().send_message(
                                 telegram_id,
                                 "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
                             )
-                            await bot.ban_chat_member(
+                            await get_bot().ban_chat_member(
                                 chat_id=private_channel.private_channel_id,
                                 user_id=telegram_id,
                                 until_date=until_date
@@ -230,7 +223,6 @@ async def kick_unpaid_users_handler():
                             success, error_type = await process_auto_payment(user, course, user_card)
 
                             if success:
-                                await bot.send_message(telegram_id, "Kartadan pul yechib olindi. Obuna uzaytirildi.")
                                 logger.info(f"Second attempt successful for user {telegram_id}")
                             else:
                                 # Second attempt failed: kick user
@@ -242,8 +234,8 @@ async def kick_unpaid_users_handler():
                                 else:
                                     message = "To'lov amalga oshmadi. Yopiq kanaldan chiqarildingiz!"
 
-                                await bot.send_message(telegram_id, message)
-                                await bot.ban_chat_member(
+                                await get_bot().send_message(telegram_id, message)
+                                await get_bot().ban_chat_member(
                                     chat_id=private_channel.private_channel_id,
                                     user_id=telegram_id,
                                     until_date=until_date
@@ -274,9 +266,12 @@ def kick_unpaid_users_handler_sync():
 
 def setup_scheduler():
     """Setup and start the scheduler with jobs - only run once per application"""
-    print(settings.RUN_SCHEDULER)
+    global scheduler
     if settings.RUN_SCHEDULER:
+        if scheduler is not None:
+            return
         try:
+            scheduler = BackgroundScheduler(timezone=settings.TIME_ZONE)
             scheduler.add_job(
                 remove_user_from_channels_sync,
                 trigger='cron',
@@ -305,11 +300,8 @@ def setup_scheduler():
 def shutdown_scheduler():
     """Gracefully shutdown the scheduler"""
     try:
-        if scheduler.running:
+        if scheduler is not None and scheduler.running:
             scheduler.shutdown()
             logger.info("Scheduler shutdown successfully")
     except Exception as e:
         logger.error(f"Error shutting down scheduler: {e}")
-
-
-setup_scheduler()
@@ -0,0 +1,27 @@
+"""
+Shared asyncio Redis client (REDIS_URL, the cache database) for code that needs
+more than the cache API: buffers, counters, scripts.
+
+redis.asyncio connections belong to the event loop that created them, so there is
+one client per running loop (the web process has one, every Celery run its own).
+Its pool is blocking: a burst of concurrent callers (the rate limiter during a
+broadcast) waits for a free connection instead of failing.
+"""
+import asyncio
+import weakref
+
+import redis.asyncio as aioredis
+from django.conf import settings
+
+_clients: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]' = weakref.WeakKeyDictionary()
+
+
+def get_redis() -> aioredis.Redis:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.REDIS_URL, max_connections=settings.REDIS_MAX_CONNECTIONS, timeout=2, socket_timeout=2,
+        )
+        client = _clients[loop] = aioredis.Redis(connection_pool=pool)
+    return client
@@ -0,0 +1,132 @@
+"""
+Read-replica routing.
+
+Nothing is routed to the replica implicitly: bulk and reporting reads opt in with
+`read_replica()`, everything else (and every write) stays on the primary. The
+context lives in a context variable, so it follows `sync_to_async` and
+`asyncio.to_thread` calls made inside it. The replica is skipped while it is
+unreachable or lagging more than REPLICA_MAX_LAG_SECONDS behind the primary.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = 'replica'
+
+REPLICA_LAG_SECONDS = REGISTRY.gauge(
+    'db_replica_lag_seconds', "Replication lag of the read replica at the last check",
+)
+REPLICA_FALLBACKS = REGISTRY.counter(
+    'db_replica_fallbacks_total', "Replica reads sent to the primary instead", ('reason',),
+)
+
+_use_replica: ContextVar[bool] = ContextVar('use_replica', default=False)
+
+# Lag is checked at most once per REPLICA_LAG_CHECK_SECONDS per process
+_last_check = {'at': 0.0, 'healthy': False, 'reason': ''}
+
+# 0 while the replica has replayed everything it received, so an idle primary doesn't look like lag.
+# NULL when no WAL receiver is streaming: the replica has replayed all it has, which may be
+# arbitrarily old. `status` reads NULL without pg_read_all_stats; a running receiver then counts.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (
+            SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'
+        ) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+@contextmanager
+def read_replica():
+    """Route reads inside the block to the replica (when it is configured and healthy)"""
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_configured() -> bool:
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def replica_lag() -> float | None:
+    """Seconds behind the primary, None when the replica is not streaming from it"""
+    with connections[REPLICA_ALIAS].cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        lag = cursor.fetchone()[0]
+    return float(lag) if lag is not None else None
+
+
+def replica_healthy() -> bool:
+    """Whether the replica is reachable and within the lag budget (cached)"""
+    now = time.monotonic()
+    if now - _last_check['at'] < settings.REPLICA_LAG_CHECK_SECONDS:
+        return _last_check['healthy']
+
+    try:
+        lag = replica_lag()
+    except DatabaseError as e:
+        logger.warning(f"Read replica unavailable, using the primary: {e}")
+        healthy, reason = False, 'unavailable'
+    else:
+        if lag is None:
+            logger.warning("Read replica is not streaming from the primary, using the primary")
+            healthy, reason = False, 'not_streaming'
+        else:
+            REPLICA_LAG_SECONDS.set(lag)
+            healthy = lag <= settings.REPLICA_MAX_LAG_SECONDS
+            reason = '' if healthy else 'lag'
+            if not healthy:
+                logger.warning(f"Read replica is {lag:.1f}s behind, using the primary")
+
+    _last_check.update(at=now, healthy=healthy, reason=reason)
+    return healthy
+
+
+class ReplicaRouter:
+    """Send reads inside `read_replica()` to the replica, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if not _use_replica.get() or not replica_configured():
+            return None
+        if replica_healthy():
+            return REPLICA_ALIAS
+        REPLICA_FALLBACKS.inc(reason=_last_check['reason'])
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaChangelistMixin:
+    """Admin mixin: serve changelist pages (GET only) from the replica"""
+
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        with read_replica():
+            response = super().changelist_view(request, extra_context)
+            # The page's queries run when the TemplateResponse renders, so render it here
+            if hasattr(response, 'render'):
+                response.render()
+            return response
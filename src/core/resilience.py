@@ -0,0 +1,216 @@
+"""
+Resilience layer for outbound calls (Click, Telegram Bot API).
+
+Every call goes through an `OutboundGuard`:
+
+- a per-endpoint timeout, so a slow upstream can't hold a worker indefinitely;
+- a circuit breaker that opens when too many of the recent calls failed or were
+  slow, fails fast (`CircuitOpen`) while open, and lets a single trial call
+  through after BREAKER_OPEN_SECONDS;
+- two bulkheads, so batch traffic (`bulk_traffic()`: broadcasts, nightly
+  renewals) and interactive handlers never take each other's connection slots.
+  A caller that doesn't get a slot within its queue timeout is rejected
+  (`BulkheadFull`) instead of piling up.
+
+Breakers are per process: each worker notices an outage within a few calls.
+"""
+import asyncio
+import logging
+import time
+import weakref
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from core.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BREAKER_STATE = REGISTRY.gauge(
+    'circuit_breaker_state', "Circuit breaker state: 0 closed, 1 half-open, 2 open", ('client',),
+)
+BREAKER_TRANSITIONS = REGISTRY.counter(
+    'circuit_breaker_transitions_total', "Circuit breaker state changes", ('client', 'state'),
+)
+REJECTED_CALLS = REGISTRY.counter(
+    'outbound_calls_rejected_total', "Outbound calls failed fast by the resilience layer", ('client', 'reason'),
+)
+BULKHEAD_IN_USE = REGISTRY.gauge(
+    'bulkhead_in_use', "Outbound calls holding a bulkhead slot", ('client', 'pool'),
+)
+
+CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+_bulk: ContextVar[bool] = ContextVar('bulk_traffic', default=False)
+
+
+@contextmanager
+def bulk_traffic():
+    """Outbound calls made inside the block are batch traffic and yield to interactive ones"""
+    token = _bulk.set(True)
+    try:
+        yield
+    finally:
+        _bulk.reset(token)
+
+
+def is_bulk_traffic() -> bool:
+    return _bulk.get()
+
+
+class ServiceUnavailable(Exception):
+    """The call was not made: the upstream is considered down or overloaded"""
+
+
+class CircuitOpen(ServiceUnavailable):
+    pass
+
+
+class BulkheadFull(ServiceUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Rolling window of the last BREAKER_WINDOW call outcomes of one client"""
+
+    def __init__(self, name: str, slow_call_seconds: float):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._trial = False
+        # (failed, slow) of the recent calls
+        self._calls: deque[tuple[bool, bool]] = deque(maxlen=settings.BREAKER_WINDOW)
+        BREAKER_STATE.set(0, client=name)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"Circuit breaker {self.name}: {self.state} -> {state}")
+        self.state = state
+        BREAKER_STATE.set(STATE_VALUES[state], client=self.name)
+        BREAKER_TRANSITIONS.inc(client=self.name, state=state)
+
+    def before_call(self) -> None:
+        """Raise `CircuitOpen` unless the call may go through"""
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < settings.BREAKER_OPEN_SECONDS:
+                raise CircuitOpen(f"{self.name} circuit is open")
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            # One trial call at a time
+            if self._trial:
+                raise CircuitOpen(f"{self.name} circuit is half-open")
+            self._trial = True
+
+    def record(self, failed: bool, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        if self.state == HALF_OPEN:
+            self._trial = False
+            if failed or slow:
+                self._open()
+            else:
+                self._calls.clear()
+                self._transition(CLOSED)
+            return
+
+        self._calls.append((failed, slow))
+        if len(self._calls) < settings.BREAKER_MIN_CALLS:
+            return
+        failure_rate = sum(failed for failed, _ in self._calls) / len(self._calls)
+        slow_rate = sum(slow for _, slow in self._calls) / len(self._calls)
+        if failure_rate >= settings.BREAKER_FAILURE_RATE or slow_rate >= settings.BREAKER_SLOW_CALL_RATE:
+            self._open()
+
+    def release_trial(self) -> None:
+        """The trial call was cancelled before it had an outcome"""
+        self._trial = False
+
+    def _open(self) -> None:
+        self.opened_at = time.monotonic()
+        self._calls.clear()
+        self._transition(OPEN)
+
+
+class Bulkhead:
+    """Bounded concurrency; asyncio semaphores belong to one event loop, so there is one per loop"""
+
+    def __init__(self, client: str, pool: str, limit: int, queue_timeout: float):
+        self.client = client
+        self.pool = pool
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._semaphores: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]' = (
+            weakref.WeakKeyDictionary()
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise BulkheadFull(f"No free {self.client} {self.pool} slot in {self.queue_timeout}s") from None
+        BULKHEAD_IN_USE.inc(client=self.client, pool=self.pool)
+        try:
+            yield
+        finally:
+            semaphore.release()
+            BULKHEAD_IN_USE.dec(client=self.client, pool=self.pool)
+
+
+class OutboundGuard:
+    """
+    Timeout + circuit breaker + bulkheads of one outbound client.
+    Exceptions of `failures` (and timeouts) count against the breaker; any other
+    exception means the upstream answered and counts as a success.
+    """
+
+    def __init__(self, name: str, *, timeouts: dict[str, float], default_timeout: float,
+                 slow_call_seconds: float, interactive_limit: int, batch_limit: int,
+                 failures: tuple[type[BaseException], ...] = (Exception,)):
+        self.name = name
+        self.timeouts = timeouts
+        self.default_timeout = default_timeout
+        self.failures = failures
+        self.breaker = CircuitBreaker(name, slow_call_seconds)
+        self.interactive = Bulkhead(name, 'interactive', interactive_limit, settings.BULKHEAD_INTERACTIVE_QUEUE_SECONDS)
+        self.batch = Bulkhead(name, 'batch', batch_limit, settings.BULKHEAD_BATCH_QUEUE_SECONDS)
+
+    @asynccontextmanager
+    async def call(self, endpoint: str):
+        """Guard one call to `endpoint`; raises `ServiceUnavailable` without calling when failing fast"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpen:
+            REJECTED_CALLS.inc(client=self.name, reason='circuit_open')
+            raise
+
+        bulkhead = self.batch if is_bulk_traffic() else self.interactive
+        try:
+            async with bulkhead.slot():
+                start = time.monotonic()
+                try:
+                    async with asyncio.timeout(self.timeouts.get(endpoint, self.default_timeout)):
+                        yield
+                except asyncio.CancelledError:
+                    self.breaker.release_trial()
+                    raise
+                except (TimeoutError, *self.failures):
+                    self.breaker.record(True, time.monotonic() - start)
+                    raise
+                except BaseException:
+                    self.breaker.record(False, time.monotonic() - start)
+                    raise
+                else:
+                    self.breaker.record(False, time.monotonic() - start)
+        except BulkheadFull:
+            self.breaker.release_trial()
+            REJECTED_CALLS.inc(client=self.name, reason='bulkhead_full')
+            raise
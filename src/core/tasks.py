@@ -1,29 +1,30 @@
 import logging
 import time
+from collections import Counter
 from datetime import date, timedelta
 
-from aiogram.exceptions import TelegramForbiddenError
-from celery import shared_task
+from celery import chord, group, shared_task
 from django.utils import timezone
 from django.conf import settings
-import aiohttp
-from asgiref.sync import async_to_sync
-
-from bot.functions import generate_auth_header
-from order.models import Course, PrivateChannel, Order
-from users.models import User, UserCard
-from bot.misc import bot
+from asgiref.sync import async_to_sync, sync_to_async
+
+from bot.client import get_bot
+from core.asyncdb import claim_renewal_items, get_user_card, pool_context
+from core.replica import read_replica
+from core.resilience import bulk_traffic
+from core.utils.constants import CONSTANTS
+from order.click_up.client import click_request, generate_auth_header
+from order.models import PrivateChannel, Order, OutboxMessage, RenewalWorkItem
+from order.services import RenewalWorklistService, SubscriptionLedger
+from users.models import User
+from users.snapshot import SnapshotCache
 
 logger = logging.getLogger(__name__)
 
 
 async def process_auto_payment(user, course, user_card):
     """Process automatic payment for a user"""
-    order = await Order.objects.acreate(
-        user=user,
-        amount=course.amount,
-        course=course,
-    )
+    order = await Order.objects.aget_or_create_pending(user_id=user.telegram_id, course=course)
 
     url = f'{settings.CLICK_BASE_URL}/payment'
     headers = {
@@ -39,219 +40,204 @@ async def process_auto_payment(user, course, user_card):
     }
 
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload) as response:
-                res_json = await response.json()
+        res_json = await click_request('POST', url, headers=headers, json=payload)
+    except Exception as e:
+        logger.error(f"Payment processing failed for user {user.telegram_id}: {e}")
+        return False, "network_error"
 
-        error_code = res_json.get("error_code")
-        payment_id = res_json.get("payment_id")
+    error_code = res_json.get("error_code")
+    payment_id = res_json.get("payment_id")
+
+    if error_code == -5017:
+        order.status = CONSTANTS.PaymentStatus.FAILED
+        order.payment_id = payment_id
+        await order.asave(update_fields=["status", "payment_id", "updated_at"])
+        return False, "insufficient_funds"
+
+    elif error_code and error_code != 0:
+        order.status = CONSTANTS.PaymentStatus.FAILED
+        order.payment_id = payment_id
+        await order.asave(update_fields=["status", "payment_id", "updated_at"])
+        return False, "payment_error"
+
+    # Charged: errors past this point must not be reported as a retryable payment failure
+    await SubscriptionLedger.aextend(
+        order, is_auto_subscribe=True, payment_id=payment_id,
+        notification=OutboxMessage.Kind.SUBSCRIPTION_RENEWED,
+    )
 
-        if error_code == -5017:
-            order.payment_id = payment_id
-            await order.asave()
-            return False, "insufficient_funds"
+    logger.info(f"Successfully renewed subscription for user {user.telegram_id}")
+    return True, "success"
 
-        elif error_code and error_code != 0:
-            order.payment_id = payment_id
-            await order.asave()
-            return False, "payment_error"
 
-        user.subscription_end_date = timezone.now().date() + timedelta(days=course.period)
-        if not user.is_subscribed:
-            user.is_subscribed = True
-        await user.asave()
+KICK_MESSAGES = {
+    "insufficient_funds": (
+        "Obunani avtomat uzaytirish uchun kartada yetarli mablag` mavjud emas. "
+        "Yopiq kanaldan chiqarildingiz!"
+    ),
+    "payment_error": "To'lov amalga oshmadi. Yopiq kanaldan chiqarildingiz!",
+    "network_error": "To'lov amalga oshmadi. Yopiq kanaldan chiqarildingiz!",
+}
+DEFAULT_KICK_MESSAGE = "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
 
-        logger.info(f"Successfully renewed subscription for user {user.telegram_id}")
-        return True, "success"
 
-    except Exception as e:
-        logger.error(f"Payment processing failed for user {user.telegram_id}: {e}")
-        return False, "network_error"
+async def _get_private_channel(course, cache: dict):
+    course_id = course.id if course else None
+    if course_id not in cache:
+        queryset = PrivateChannel.objects.all()
+        if course_id is not None:
+            queryset = queryset.filter(course_id=course_id)
+        cache[course_id] = await queryset.afirst()
+    return cache[course_id]
+
 
+async def _kick_work_item(item, private_channel, until_date):
+    """Kick stage: notify the user, ban them from the channel and close the subscription"""
+    # Imported here: Celery beat loads this module too and never talks to Telegram
+    from aiogram.exceptions import TelegramForbiddenError
+
+    telegram_id = item.user_id
+
+    try:
+        await get_bot().send_message(telegram_id, KICK_MESSAGES.get(item.reason, DEFAULT_KICK_MESSAGE))
+    except TelegramForbiddenError:
+        logger.info(f"User {telegram_id} blocked the bot")
 
-async def _process_expired_subscriptions():
-    """Process expired subscriptions - first attempt"""
     try:
-        until_date = int(time.time()) + 60
-
-        courses = Course.objects.all()
-        async for course in courses:
-            private_channel = await PrivateChannel.objects.filter(course_id=course.id).afirst()
-
-            if not course or not private_channel:
-                logger.error("Course or private channel not found")
-                return
-
-            today = date.today()
-            expired_users = User.objects.filter(is_subscribed=True, subscription_end_date__lte=today, is_foreigner=False)
-            if not await expired_users.aexists():
-                return
-
-            processed_count = 0
-            async for user in expired_users:
-                try:
-                    telegram_id = user.telegram_id
-
-                    if not user.is_auto_subscribe:
-                        await bot.send_message(
-                            telegram_id,
-                            "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
-                        )
-                        try:
-                            await bot.ban_chat_member(
-                                chat_id=private_channel.private_channel_id,
-                                user_id=telegram_id,
-                                until_date=until_date
-                            )
-                        except TelegramForbiddenError:
-                            logger.error(f"User not found with {telegram_id}")
-
-                        user.is_subscribed = False
-                        user.is_auto_subscribe = False
-                        await user.asave()
-                        logger.info(f"Removed non-auto-subscribe user {telegram_id}")
-
-                    else:
-                        user_card = await UserCard.objects.filter(user_id=telegram_id).afirst()
-
-                        if not user_card:
-                            await bot.send_message(
-                                telegram_id,
-                                "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
-                            )
-
-                            try:
-                                await bot.ban_chat_member(
-                                    chat_id=private_channel.private_channel_id,
-                                    user_id=telegram_id,
-                                    until_date=until_date
-                                )
-                            except e:
-                                logger.error(e)
-
-                            user.is_subscribed = False
-                            user.is_auto_subscribe = False
-                            await user.asave()
-
-                            logger.info(f"Removed user {telegram_id} - no card available")
-                        else:
-                            success, error_type = await process_auto_payment(user, course, user_card)
-
-                            if success:
-                                await bot.send_message(telegram_id, "Kartadan pul yechib olindi. Obuna uzaytirildi.")
-                                logger.info(f"Successfully renewed subscription for user {telegram_id}")
-                            else:
-                                if error_type == "insufficient_funds":
-                                    message = (
-                                        "Obunani avtomat uzaytirish uchun kartada yetarli mablag` mavjud emas. "
-                                        "1 soatdan so'ng qayta yechishga urinish bo'ladi. Hisobingizni to'ldiring!"
-                                    )
-                                else:
-                                    message = (
-                                        "To'lov yechib olishda xatolik yuz berdi. "
-                                        "1 soatdan so'ng qayta yechishga urinish bo'ladi."
-                                    )
-
-                                await bot.send_message(telegram_id, message)
-                                logger.warning(f"Payment failed for user {telegram_id}, will retry in 1 hour")
-
-                    processed_count += 1
-
-                except Exception as e:
-                    logger.error(f"Error processing user {user.telegram_id}: {e}")
+        await get_bot().ban_chat_member(
+            chat_id=private_channel.private_channel_id,
+            user_id=telegram_id,
+            until_date=until_date
+        )
+    except TelegramForbiddenError:
+        logger.error(f"User not found with {telegram_id}")
+
+    await User.objects.filter(telegram_id=telegram_id).aupdate(
+        is_subscribed=False, is_auto_subscribe=False, updated_at=timezone.now()
+    )
+    await SnapshotCache.ainvalidate(telegram_id)
+    await sync_to_async(RenewalWorklistService.complete)(item, RenewalWorkItem.Outcome.KICKED)
+    logger.info(f"Removed user {telegram_id} ({item.reason or 'expired'})")
+    return RenewalWorkItem.Outcome.KICKED
+
+
+async def _charge_work_item(item, stage):
+    """Charge and retry stages: try to renew with the saved card, otherwise hand over to the next stage"""
+    user = item.user
+    telegram_id = user.telegram_id
+
+    if not user.is_auto_subscribe:
+        await sync_to_async(RenewalWorklistService.advance)(item, RenewalWorkItem.Stage.KICK, "not_auto_subscribe")
+        return RenewalWorkItem.Stage.KICK
+
+    user_card = await get_user_card(telegram_id)
+    if not user_card or not item.course:
+        await sync_to_async(RenewalWorklistService.advance)(item, RenewalWorkItem.Stage.KICK, "no_card")
+        return RenewalWorkItem.Stage.KICK
+
+    success, error_type = await process_auto_payment(user, item.course, user_card)
+
+    if success:
+        # The user is notified through the outbox written with the extension
+        await sync_to_async(RenewalWorklistService.complete)(item, RenewalWorkItem.Outcome.RENEWED)
+        logger.info(f"Successfully renewed subscription for user {telegram_id} ({stage})")
+        return RenewalWorkItem.Outcome.RENEWED
+
+    if stage == RenewalWorkItem.Stage.CHARGE:
+        if error_type == "insufficient_funds":
+            message = (
+                "Obunani avtomat uzaytirish uchun kartada yetarli mablag` mavjud emas. "
+                "1 soatdan so'ng qayta yechishga urinish bo'ladi. Hisobingizni to'ldiring!"
+            )
+        else:
+            message = (
+                "To'lov yechib olishda xatolik yuz berdi. "
+                "1 soatdan so'ng qayta yechishga urinish bo'ladi."
+            )
+        await get_bot().send_message(telegram_id, message)
+        await sync_to_async(RenewalWorklistService.advance)(item, RenewalWorkItem.Stage.RETRY, error_type)
+        logger.warning(f"Payment failed for user {telegram_id}, will retry in 1 hour")
+        return RenewalWorkItem.Stage.RETRY
+
+    await sync_to_async(RenewalWorklistService.advance)(item, RenewalWorkItem.Stage.KICK, error_type)
+    return RenewalWorkItem.Stage.KICK
+
+
+async def _process_renewal_stage(stage, due_date=None, shard=0, shards=1):
+    """
+    Consume one stage of the renewal worklist (optionally a single shard of it).
+    Returns a counter of outcomes (renewed, kicked, skipped, next stage names, failed).
+    """
+    due_date = due_date or timezone.localdate()
+    until_date = int(time.time()) + 60
+    channels = {}
+    counts = Counter()
+
+    while True:
+        items = await claim_renewal_items(stage, due_date, shard=shard, shards=shards)
+        if not items:
+            break
+
+        for item in items:
+            try:
+                user = item.user
+                # The worklist is a snapshot - skip users who paid or were removed in the meantime
+                if not user.is_subscribed or (
+                    user.subscription_end_date and user.subscription_end_date > due_date
+                ):
+                    await sync_to_async(RenewalWorklistService.complete)(item, RenewalWorkItem.Outcome.SKIPPED)
+                    counts[RenewalWorkItem.Outcome.SKIPPED] += 1
                     continue
 
-            logger.info(f"First attempt: Processed {processed_count} expired subscriptions")
+                if stage == RenewalWorkItem.Stage.KICK:
+                    private_channel = await _get_private_channel(item.course, channels)
+                    if not private_channel:
+                        raise PrivateChannel.DoesNotExist("Private channel not found")
+                    result = await _kick_work_item(item, private_channel, until_date)
+                else:
+                    result = await _charge_work_item(item, stage)
 
-    except Exception as e:
-        logger.error(f"Error in _process_expired_subscriptions: {e}")
+                counts[result] += 1
 
+            except Exception as e:
+                logger.error(f"Error processing renewal item {item.id} for user {item.user_id}: {e}")
+                await sync_to_async(RenewalWorklistService.fail)(item, str(e))
+                counts[RenewalWorkItem.Status.FAILED] += 1
 
-async def _kick_unpaid_users():
-    """Kick users who failed payment - second attempt"""
-    try:
-        until_date = int(time.time()) + 60
-
-        courses = Course.objects.all()
-        async for course in courses:
-            private_channel = await PrivateChannel.objects.filter(course_id=course.id).afirst()
-
-            if not course or not private_channel:
-                logger.error("Course or private channel not found")
-                return
-
-            today = date.today()
-            expired_users = User.objects.filter(is_subscribed=True, subscription_end_date__lte=today, is_foreigner=False)
-            if not await expired_users.aexists():
-                return
-
-            processed_count = 0
-            async for user in expired_users:
-                try:
-                    telegram_id = user.telegram_id
-
-                    if user.is_auto_subscribe:
-                        user_card = await UserCard.objects.filter(user_id=telegram_id).afirst()
-
-                        if not user_card:
-                            await bot.send_message(
-                                telegram_id,
-                                "Sizning obunangiz tugaganligi uchun yopiq kanaldan chiqarildingiz!"
-                            )
-                            try:
-                                await bot.ban_chat_member(
-                                    chat_id=private_channel.private_channel_id,
-                                    user_id=telegram_id,
-                                    until_date=until_date
-                                )
-                            except TelegramForbiddenError:
-                                logger.error(f"User not found with {telegram_id}")
-
-                            user.is_subscribed = False
-                            user.is_auto_subscribe = False
-                            await user.asave()
-                            logger.info(f"Final removal: User {telegram_id} - no card")
-                        else:
-                            success, error_type = await process_auto_payment(user, course, user_card)
-
-                            if success:
-                                await bot.send_message(telegram_id, "Kartadan pul yechib olindi. Obuna uzaytirildi.")
-                                logger.info(f"Second attempt successful for user {telegram_id}")
-                            else:
-                                if error_type == "insufficient_funds":
-                                    message = (
-                                        "Obunani avtomat uzaytirish uchun kartada yetarli mablag` mavjud emas. "
-                                        "Yopiq kanaldan chiqarildingiz!"
-                                    )
-                                else:
-                                    message = "To'lov amalga oshmadi. Yopiq kanaldan chiqarildingiz!"
-
-                                await bot.send_message(telegram_id, message)
-
-                                try:
-                                    await bot.ban_chat_member(
-                                        chat_id=private_channel.private_channel_id,
-                                        user_id=telegram_id,
-                                        until_date=until_date
-                                    )
-                                except TelegramForbiddenError:
-                                    logger.error(f"User not found with {telegram_id}")
-
-                                user.is_subscribed = False
-                                user.is_auto_subscribe = False
-                                await user.asave()
-                                logger.info(f"Final removal: User {telegram_id} after failed second attempt")
-
-                    processed_count += 1
-
-                except Exception as e:
-                    logger.error(f"Error processing user {user.telegram_id} in second attempt: {e}")
-                    continue
+    logger.info(f"Renewal stage '{stage}' for {due_date} (shard {shard}/{shards}): {dict(counts)}")
+    return counts
 
-            logger.info(f"Second attempt: Processed {processed_count} users")
 
+async def _process_renewal_shard(stages, shard, shards):
+    """Run the given worklist stages, in order, for one shard"""
+    counts = Counter()
+    try:
+        async with pool_context():
+            for stage in stages:
+                counts.update(await _process_renewal_stage(stage, shard=shard, shards=shards))
     except Exception as e:
-        logger.error(f"Error in _kick_unpaid_users: {e}")
+        logger.error(f"Error in renewal shard {shard}/{shards}: {e}")
+        counts["errors"] += 1
+    finally:
+        # Each Celery run gets its own event loop, don't carry the aiohttp session over
+        await get_bot().session.close()
+    return {str(key): value for key, value in counts.items()}
+
+
+async def _notify_admins(text):
+    async for admin in User.objects.filter(is_superuser=True):
+        try:
+            await get_bot().send_message(chat_id=admin.telegram_id, text=text)
+        except Exception as e:
+            logger.error(f"Failed to send nightly summary to admin {admin.telegram_id}: {e}")
+    await get_bot().session.close()
+
+
+def _fan_out_renewal(stages, label):
+    """Split the worklist stages into NIGHTLY_SHARDS tasks and aggregate them with a chord"""
+    shards = max(settings.NIGHTLY_SHARDS, 1)
+    header = group(process_renewal_shard.s(stages, shard, shards) for shard in range(shards))
+    return chord(header)(summarize_renewal_shards.s(label, time.time())).id
 
 
 async def _send_membership_expire_notification():
@@ -295,7 +281,7 @@ async def _send_membership_expire_notification():
                     "📌 Obunani uzaytirish uchun to'lov qiling."
                 )
 
-                await bot.send_message(
+                await get_bot().send_message(
                     chat_id=user.telegram_id,
                     text=message,
                     parse_mode='HTML'
@@ -320,7 +306,7 @@ async def _send_membership_expire_notification():
                     "📌 Obunani davom ettirish uchun <b>HOZIROQ</b> to'lov qiling."
                 )
 
-                await bot.send_message(
+                await get_bot().send_message(
                     chat_id=user.telegram_id,
                     text=message,
                     parse_mode='HTML'
@@ -346,7 +332,7 @@ async def _send_membership_expire_notification():
                     "⏰ Qolgan vaqt: Soat 22:30 gacha"
                 )
 
-                await bot.send_message(
+                await get_bot().send_message(
                     chat_id=user.telegram_id,
                     text=message,
                     parse_mode='HTML'
@@ -366,19 +352,70 @@ async def _send_membership_expire_notification():
         logger.error(f"Error in send_membership_expire_notification: {e}")
 
 
+@shared_task
+def build_renewal_worklist():
+    """Celery task: Snapshot today's due renewals into the worklist"""
+    created = RenewalWorklistService.build()
+    logger.info(f"Renewal worklist built: {created} new items")
+    return created
+
+
+@shared_task
+def process_renewal_shard(stages, shard, shards):
+    """Celery task: Process one shard of the renewal worklist"""
+    started = time.monotonic()
+    with bulk_traffic():
+        counts = async_to_sync(_process_renewal_shard)(stages, shard, shards)
+    return {"shard": shard, "counts": counts, "duration": round(time.monotonic() - started, 2)}
+
+
+@shared_task
+def summarize_renewal_shards(results, label, started_at):
+    """Celery chord callback: Aggregate shard results and report them to the admins"""
+    totals = Counter()
+    for result in results:
+        totals.update(result["counts"])
+
+    durations = [result["duration"] for result in results]
+    wall_time = time.time() - started_at
+    summary = {
+        "label": label,
+        "shards": len(results),
+        "counts": dict(totals),
+        "slowest_shard": max(durations, default=0),
+        "wall_time": round(wall_time, 2),
+    }
+    logger.info(f"Nightly renewal summary: {summary}")
+
+    lines = [f"🌙 Tungi jarayon yakunlandi: {label}", ""]
+    lines += [f"{key}: {value}" for key, value in sorted(totals.items())]
+    lines += [
+        "",
+        f"Shardlar: {len(results)}",
+        f"Eng sekin shard: {summary['slowest_shard']} s",
+        f"Umumiy vaqt: {summary['wall_time']} s",
+    ]
+    async_to_sync(_notify_admins)("\n".join(lines))
+    return summary
+
+
 @shared_task
 def process_expired_subscriptions():
     """Celery task: First payment attempt"""
-    async_to_sync(_process_expired_subscriptions)()
+    # Picks up users that became due after the midnight snapshot; existing rows are kept
+    RenewalWorklistService.build()
+    return _fan_out_renewal([RenewalWorkItem.Stage.CHARGE, RenewalWorkItem.Stage.KICK], "first-payment-attempt")
 
 
 @shared_task
 def kick_unpaid_users():
     """Celery task: Second payment attempt and kick"""
-    async_to_sync(_kick_unpaid_users)()
+    return _fan_out_renewal([RenewalWorkItem.Stage.RETRY, RenewalWorkItem.Stage.KICK], "second-payment-attempt-and-kick")
 
 
 @shared_task
 def send_membership_expire_notification():
     """Celery task: Send subscription expiration notifications"""
-    async_to_sync(_send_membership_expire_notification)()
+    # Only reads users, the scans can be served by the replica
+    with read_replica(), bulk_traffic():
+        async_to_sync(_send_membership_expire_notification)()
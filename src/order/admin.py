@@ -1,10 +1,12 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import UserCourseSubscription, Course, Order, PrivateChannel, Transaction
+
+from core.replica import ReplicaChangelistMixin
+from .models import UserCourseSubscription, Course, Order, PrivateChannel, Transaction, RenewalWorkItem, OutboxMessage
 
 
 @admin.register(UserCourseSubscription)
-class UserCourseSubscriptionAdmin(admin.ModelAdmin):
+class UserCourseSubscriptionAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'order', 'start_date', 'status')
     list_filter = ('status', 'start_date',)
     search_fields = ('user__telegram_id', 'order__id')
@@ -18,7 +20,7 @@ class UserCourseSubscriptionAdmin(admin.ModelAdmin):
 
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('user', 'course', 'amount', 'created_at', 'status')
     list_filter = ('status', 'created_at',)
     search_fields = ('user__telegram_id',)
@@ -26,7 +28,7 @@ class OrderAdmin(admin.ModelAdmin):
 
 
 @admin.register(Transaction)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(ReplicaChangelistMixin, admin.ModelAdmin):
     list_display = ('id', 'transaction_id', 'user', 'amount', 'get_state_display',
                     'payment_method', 'perform_time', 'cancel_time', 'created_at')
     list_filter = ('state', 'payment_method', 'created_at',)
@@ -86,3 +88,28 @@ class PrivateChannelAdmin(admin.ModelAdmin):
 
     def course_name(self, obj):
         return obj.course.name
+
+
+@admin.register(RenewalWorkItem)
+class RenewalWorkItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'course', 'due_date', 'stage', 'status', 'outcome', 'reason',
+                    'attempts', 'claimed_at', 'processed_at')
+    list_filter = ('due_date', 'stage', 'status', 'outcome', 'reason')
+    search_fields = ('user__telegram_id',)
+    list_select_related = ('user', 'course')
+    date_hierarchy = 'due_date'
+    ordering = ('-due_date', 'id')
+    # Facet counts next to each filter give per-stage progress at a glance
+    show_facets = admin.ShowFacets.ALWAYS
+    readonly_fields = ('created_at', 'updated_at', 'claimed_at', 'processed_at', 'attempts', 'last_error')
+    raw_id_fields = ('user',)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user_id', 'status', 'attempts', 'available_at', 'sent_at', 'created_at')
+    list_filter = ('status', 'kind', 'created_at')
+    search_fields = ('user_id', 'key')
+    ordering = ('-id',)
+    show_facets = admin.ShowFacets.ALWAYS
+    readonly_fields = ('key', 'created_at', 'updated_at', 'claimed_at', 'sent_at', 'attempts', 'last_error')
@@ -0,0 +1,265 @@
+"""
+Local stand-in for Click: the card_token Merchant API (request/verify/payment/delete)
+and the Shop API callbacks (prepare/complete) into `ClickWebhook`.
+
+Knobs: response latency and jitter, a share of calls answered with an error code
+(-5017 by default), a share of calls that hang past the client timeout, and a share
+of Shop API callbacks delivered twice at once to exercise webhook idempotency.
+"""
+import asyncio
+import hashlib
+import itertools
+import logging
+import random
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, Callable
+
+import aiohttp
+from aiohttp import web
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.test import RequestFactory
+from django.utils import timezone
+
+from order.click_up.const import Action
+
+logger = logging.getLogger(__name__)
+
+API_PREFIX = '/v2/merchant/card_token'
+
+ERROR_NOTES = {
+    0: "Успешно проведено",
+    -5017: "Недостаточно средств",
+    -5001: "Карта не найдена",
+    -5002: "Карта заблокирована",
+    -500: "Системная ошибка",
+}
+
+Callback = Callable[[dict], Awaitable[dict]]
+
+
+def sign_shop_request(params: dict, service_id=None, secret_key=None) -> str:
+    """sign_string as checked by ClickWebhook.check_auth"""
+    text_parts = [
+        params['click_trans_id'],
+        service_id or settings.CLICK_SERVICE_ID,
+        secret_key or settings.CLICK_SECRET_KEY,
+        params['merchant_trans_id'],
+        params.get('merchant_prepare_id') or "",
+        params['amount'],
+        params['action'],
+        params['sign_time'],
+    ]
+    return hashlib.md5(''.join(map(str, text_parts)).encode('utf-8')).hexdigest()
+
+
+def webhook_callback() -> Callback:
+    """Callback delivering Shop API requests to ClickWebhook in-process, without an HTTP server"""
+    from order.views import ClickWebhook
+
+    view = ClickWebhook.as_view()
+    factory = RequestFactory()
+
+    @sync_to_async
+    def call(form: dict) -> dict:
+        response = view(factory.post('/payments/prepare/update/', data=form))
+        response.render()
+        return response.data
+
+    return call
+
+
+def http_callback(url: str, session: aiohttp.ClientSession) -> Callback:
+    """Callback posting Shop API requests to a running server, e.g. BASE_URL + /payments/prepare/update/"""
+
+    async def call(form: dict) -> dict:
+        async with session.post(url, data=form) as response:
+            return await response.json()
+
+    return call
+
+
+class FakeClickAPI:
+    def __init__(
+        self,
+        host='127.0.0.1',
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        error_codes=(-5017,),
+        error_endpoints=('payment',),
+        timeout_rate=0.0,
+        hang=30.0,
+        duplicate_rate=0.0,
+        callback: Callback = None,
+        seed=None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.error_endpoints = tuple(error_endpoints)
+        self.timeout_rate = timeout_rate
+        self.hang = hang
+        self.duplicate_rate = duplicate_rate
+        self.callback = callback
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.callbacks = Counter()
+        self.cards = {}
+        self._ids = itertools.count(int(time.time()) * 1000)
+        self._runner = None
+        self._tasks = set()
+
+    @property
+    def url(self) -> str:
+        """Value for CLICK_BASE_URL"""
+        return f"http://{self.host}:{self.port}{API_PREFIX}"
+
+    async def start(self) -> 'FakeClickAPI':
+        app = web.Application()
+        app.router.add_post(f'{API_PREFIX}/request', self.handle_request)
+        app.router.add_post(f'{API_PREFIX}/verify', self.handle_verify)
+        app.router.add_post(f'{API_PREFIX}/payment', self.handle_payment)
+        app.router.add_delete(f'{API_PREFIX}/{{service_id}}/{{card_token}}', self.handle_delete)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+        logger.info(f"Fake Click API listening on {self.url}")
+        return self
+
+    async def stop(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def stats(self) -> dict:
+        return {'calls': dict(self.calls), 'errors': dict(self.errors), 'callbacks': dict(self.callbacks)}
+
+    async def _simulate(self, endpoint: str) -> int:
+        """Apply latency and fault injection, return the error code to answer with"""
+        self.calls[endpoint] += 1
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            self.errors['timeout'] += 1
+            await asyncio.sleep(self.hang)
+        delay = self.latency + (self.random.uniform(-self.jitter, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if endpoint in self.error_endpoints and self.error_rate and self.random.random() < self.error_rate:
+            error_code = self.random.choice(self.error_codes)
+            self.errors[error_code] += 1
+            return error_code
+        return 0
+
+    @staticmethod
+    def _answer(error_code: int, **data) -> web.Response:
+        return web.json_response({'error_code': error_code, 'error_note': ERROR_NOTES.get(error_code, "Ошибка"), **data})
+
+    async def handle_request(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        error_code = await self._simulate('request')
+        if error_code:
+            return self._answer(error_code)
+        card_token = str(uuid.uuid4()).upper()
+        card_number = str(payload.get('card_number', ''))
+        self.cards[card_token] = {'card_number': card_number, 'verified': False}
+        return self._answer(
+            0,
+            card_token=card_token,
+            phone_number=f"99890***{self.random.randrange(10000):04d}",
+            temporary=payload.get('temporary', 0),
+        )
+
+    async def handle_verify(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        error_code = await self._simulate('verify')
+        card = self.cards.get(payload.get('card_token'))
+        if not error_code and card is None:
+            error_code = -5001
+        if error_code:
+            return self._answer(error_code)
+        card['verified'] = True
+        number = card['card_number']
+        return self._answer(0, card_number=f"{number[:6]}******{number[-4:]}")
+
+    async def handle_payment(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        error_code = await self._simulate('payment')
+        payment_id = next(self._ids)
+        if error_code:
+            return self._answer(error_code, payment_id=payment_id, payment_status=-1)
+
+        if self.callback is not None and payload.get('transaction_parameter'):
+            task = asyncio.create_task(
+                self.deliver(str(payload['transaction_parameter']), payload.get('amount'), click_trans_id=payment_id)
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return self._answer(0, payment_id=payment_id, payment_status=2)
+
+    async def handle_delete(self, request: web.Request) -> web.Response:
+        error_code = await self._simulate('delete')
+        if error_code:
+            return self._answer(error_code)
+        self.cards.pop(request.match_info['card_token'], None)
+        return self._answer(0)
+
+    async def _send(self, form: dict) -> dict:
+        action = 'prepare' if form['action'] == Action.PREPARE else 'complete'
+        self.callbacks[action] += 1
+        if self.duplicate_rate and self.random.random() < self.duplicate_rate:
+            self.callbacks[f"{action}_duplicate"] += 1
+            results = await asyncio.gather(self.callback(form), self.callback(form), return_exceptions=True)
+            for result in results:
+                if not isinstance(result, Exception):
+                    return result
+            raise results[0]
+        return await self.callback(form)
+
+    async def deliver(self, merchant_trans_id: str, amount, click_trans_id=None, error=0) -> dict:
+        """
+        Run the Shop API handshake for one order: prepare, then complete with the
+        merchant_prepare_id the webhook returned. Returns the complete response.
+        """
+        click_trans_id = click_trans_id or next(self._ids)
+        form = {
+            'click_trans_id': str(click_trans_id),
+            'service_id': str(settings.CLICK_SERVICE_ID),
+            'click_paydoc_id': str(click_trans_id),
+            'merchant_trans_id': merchant_trans_id,
+            # Whole soums, as the Shop API sends them
+            'amount': str(int(amount)),
+            'action': Action.PREPARE,
+            'error': str(error),
+            'error_note': ERROR_NOTES.get(error, "Ошибка"),
+            'sign_time': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        form['sign_string'] = sign_shop_request(form)
+        try:
+            prepared = await self._send(form)
+            merchant_prepare_id = prepared.get('merchant_prepare_id')
+            if prepared.get('error') not in (0, '0', None) or merchant_prepare_id is None:
+                return prepared
+
+            form.update(action=Action.COMPLETE, merchant_prepare_id=str(merchant_prepare_id))
+            form['sign_string'] = sign_shop_request(form)
+            return await self._send(form)
+        except Exception as e:
+            self.callbacks['failed'] += 1
+            logger.error(f"Shop API callback for order {merchant_trans_id} failed: {e}")
+            return {'error': -500, 'error_note': str(e)}
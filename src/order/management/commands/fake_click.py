@@ -0,0 +1,55 @@
+import asyncio
+
+import aiohttp
+from django.core.management import BaseCommand
+
+from order.click_up.fake_server import FakeClickAPI, http_callback, webhook_callback
+
+
+class Command(BaseCommand):
+    help = "Run a local fake Click card_token API; point CLICK_BASE_URL at the printed URL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=100)
+        parser.add_argument('--jitter-ms', type=float, default=30)
+        parser.add_argument('--error-rate', type=float, default=0, help="Share of payments answered with an error")
+        parser.add_argument('--error-codes', default='-5017', help="Comma separated error codes to pick from")
+        parser.add_argument('--timeout-rate', type=float, default=0, help="Share of calls that hang for --hang seconds")
+        parser.add_argument('--hang', type=float, default=30)
+        parser.add_argument('--duplicate-rate', type=float, default=0,
+                            help="Share of Shop API callbacks delivered twice at once")
+        parser.add_argument('--callback-url', default=None,
+                            help="Post Shop API prepare/complete here after each payment "
+                                 "('local' calls ClickWebhook in-process)")
+
+    def handle(self, *args, **options):
+        asyncio.run(self.serve(options))
+
+    async def serve(self, options):
+        async with aiohttp.ClientSession() as session:
+            callback = None
+            if options['callback_url'] == 'local':
+                callback = webhook_callback()
+            elif options['callback_url']:
+                callback = http_callback(options['callback_url'], session)
+
+            fake_click = FakeClickAPI(
+                host=options['host'],
+                port=options['port'],
+                latency=options['latency_ms'] / 1000,
+                jitter=options['jitter_ms'] / 1000,
+                error_rate=options['error_rate'],
+                error_codes=[int(code) for code in options['error_codes'].split(',')],
+                timeout_rate=options['timeout_rate'],
+                hang=options['hang'],
+                duplicate_rate=options['duplicate_rate'],
+                callback=callback,
+            )
+            async with fake_click:
+                self.stdout.write(self.style.SUCCESS(f"CLICK_BASE_URL={fake_click.url}"))
+                try:
+                    await asyncio.Event().wait()
+                finally:
+                    self.stdout.write(str(fake_click.stats()))
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from order import partitions
+
+
+class Command(BaseCommand):
+    help = "Create upcoming monthly Transaction partitions and detach or archive old ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.TRANSACTION_PARTITION_MONTHS_AHEAD,
+            help="How many months ahead partitions should exist",
+        )
+        parser.add_argument(
+            '--retain', type=int, default=settings.TRANSACTION_PARTITION_RETAIN_MONTHS,
+            help="Partitions older than this many months are detached",
+        )
+        parser.add_argument(
+            '--archive-dir', type=Path, default=None,
+            help="Dump detached partitions to gzipped CSV files in this directory and drop them",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only print what would be done")
+
+    def handle(self, *args, **options):
+        if not partitions.is_partitioned():
+            raise CommandError(f"{partitions.PARENT_TABLE} is not partitioned, run migrations first")
+
+        if options['dry_run']:
+            self.stdout.write(f"Existing: {', '.join(partitions.list_partitions()) or '-'}")
+            expired = partitions.expired_partitions(options['retain'])
+            self.stdout.write(f"Would detach: {', '.join(expired) or '-'}")
+            return
+
+        created = partitions.ensure_partitions(options['ahead'])
+        for name in created:
+            self.stdout.write(self.style.SUCCESS(f"Created {name}"))
+
+        for name in partitions.expired_partitions(options['retain']):
+            partitions.detach_partition(name)
+            if options['archive_dir']:
+                path = partitions.archive_table(name, options['archive_dir'])
+                self.stdout.write(self.style.SUCCESS(f"Archived {name} -> {path}"))
+            else:
+                self.stdout.write(self.style.WARNING(f"Detached {name} (kept as a standalone table)"))
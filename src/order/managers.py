@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.utils.constants import CONSTANTS
+
+
+class OrderQuerySet(models.QuerySet):
+    def reusable(self, user_id, course_id, amount, window: timedelta = None):
+        """
+        Pending orders of the same user, course and amount created inside the reuse window
+        that Click has not seen yet (no transaction references them).
+        """
+        from order.models import Transaction
+
+        window = window or timedelta(minutes=settings.ORDER_REUSE_WINDOW_MINUTES)
+        return self.filter(
+            user_id=user_id,
+            course_id=course_id,
+            amount=amount,
+            status=CONSTANTS.PaymentStatus.PENDING,
+            created_at__gte=timezone.now() - window,
+        ).filter(
+            ~Exists(Transaction.objects.filter(order_id=OuterRef('pk')))
+        ).order_by('-created_at')
+
+
+class OrderManager(models.Manager.from_queryset(OrderQuerySet)):
+    def get_or_create_pending(self, user_id, course, amount=None):
+        """
+        Reuse a recent pending order for the same purchase instead of inserting a new row
+        on every retry or abandoned payment flow.
+        """
+        amount = course.amount if amount is None else amount
+        order = self.reusable(user_id, course.id, amount).first()
+        if order is None:
+            order = self.create(user_id=user_id, course=course, amount=amount)
+        else:
+            order.course = course
+        return order
+
+    async def aget_or_create_pending(self, user_id, course, amount=None):
+        amount = course.amount if amount is None else amount
+        order = await self.reusable(user_id, course.id, amount).afirst()
+        if order is None:
+            order = await self.acreate(user_id=user_id, course=course, amount=amount)
+        else:
+            order.course = course
+        return order
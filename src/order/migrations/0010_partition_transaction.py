@@ -0,0 +1,86 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:02
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations
+
+# Transaction is converted into a table partitioned by month on created_at.
+# The primary key has to include the partition key, so it becomes (id, created_at);
+# nothing references order_transaction with a foreign key, Django keeps using `id`.
+# Future partitions are created by `manage.py transaction_partitions`.
+PARTITION_TRANSACTION_SQL = """
+ALTER TABLE order_transaction RENAME TO order_transaction_unpartitioned;
+
+CREATE TABLE order_transaction (
+    LIKE order_transaction_unpartitioned INCLUDING CONSTRAINTS
+) PARTITION BY RANGE (created_at);
+
+CREATE SEQUENCE order_transaction_pk_seq OWNED BY order_transaction.id;
+ALTER TABLE order_transaction ALTER COLUMN id SET DEFAULT nextval('order_transaction_pk_seq');
+
+CREATE TABLE order_transaction_default PARTITION OF order_transaction DEFAULT;
+
+DO $$
+DECLARE
+    month date;
+    last_month date := (date_trunc('month', now() AT TIME ZONE 'UTC') + interval '3 months')::date;
+BEGIN
+    SELECT date_trunc('month', COALESCE(MIN(created_at), now()) AT TIME ZONE 'UTC')::date
+      INTO month
+      FROM order_transaction_unpartitioned;
+
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF order_transaction FOR VALUES FROM (%L) TO (%L)',
+            'order_transaction_p' || to_char(month, 'YYYY_MM'),
+            month::timestamp AT TIME ZONE 'UTC',
+            (month + interval '1 month')::timestamp AT TIME ZONE 'UTC'
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+END $$;
+
+INSERT INTO order_transaction SELECT * FROM order_transaction_unpartitioned;
+SELECT setval('order_transaction_pk_seq', COALESCE(MAX(id), 0) + 1, false) FROM order_transaction;
+DROP TABLE order_transaction_unpartitioned;
+
+ALTER TABLE order_transaction ADD CONSTRAINT order_transaction_pkey PRIMARY KEY (id, created_at);
+ALTER TABLE order_transaction ADD CONSTRAINT order_transaction_user_id_72f198c7_fk_users_user_telegram_id
+    FOREIGN KEY (user_id) REFERENCES users_user (telegram_id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX order_transaction_user_id_72f198c7 ON order_transaction (user_id);
+CREATE INDEX order_transaction_order_id_idx ON order_transaction (order_id);
+CREATE INDEX order_transaction_created_at_idx ON order_transaction (created_at);
+"""
+
+UNPARTITION_TRANSACTION_SQL = """
+CREATE TABLE order_transaction_unpartitioned (
+    LIKE order_transaction INCLUDING CONSTRAINTS
+);
+INSERT INTO order_transaction_unpartitioned SELECT * FROM order_transaction;
+DROP TABLE order_transaction;
+ALTER TABLE order_transaction_unpartitioned RENAME TO order_transaction;
+
+ALTER TABLE order_transaction ADD CONSTRAINT order_transaction_pkey PRIMARY KEY (id);
+ALTER TABLE order_transaction ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY;
+SELECT setval(pg_get_serial_sequence('order_transaction', 'id'), COALESCE(MAX(id), 0) + 1, false)
+  FROM order_transaction;
+ALTER TABLE order_transaction ADD CONSTRAINT order_transaction_user_id_72f198c7_fk_users_user_telegram_id
+    FOREIGN KEY (user_id) REFERENCES users_user (telegram_id) DEFERRABLE INITIALLY DEFERRED;
+CREATE INDEX order_transaction_user_id_72f198c7 ON order_transaction (user_id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0009_renewalworkitem'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='order_created_at_brin'),
+        ),
+        migrations.RunSQL(PARTITION_TRANSACTION_SQL, UNPARTITION_TRANSACTION_SQL),
+    ]
@@ -1,7 +1,9 @@
+from django.contrib.postgres.indexes import BrinIndex
 from django.db import models
 
 from core.models import TimestampedModel
 from core.utils.constants import CONSTANTS
+from .managers import OrderManager
 
 
 class Transaction(TimestampedModel):
@@ -109,9 +111,17 @@ class Order(TimestampedModel):
     status = models.CharField(max_length=20, choices=CONSTANTS.PaymentStatus.CHOICES, default=CONSTANTS.PaymentStatus.PENDING)
     payment_id = models.BigIntegerField(null=True, blank=True)
 
+    objects = OrderManager()
+
     def __str__(self):
         return f"{self.pk}"
 
+    class Meta:
+        indexes = [
+            # Orders are append-only in created_at order, a BRIN index stays tiny
+            BrinIndex(fields=['created_at'], name='order_created_at_brin'),
+        ]
+
 
 class UserCourseSubscription(TimestampedModel):
     user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='course_subscriptions')
@@ -152,3 +162,87 @@ class UserJoinChannel(TimestampedModel):
 
     class Meta:
         unique_together = ('user', 'channel')
+
+
+class RenewalWorkItem(TimestampedModel):
+    """
+    One row per user that is due for renewal on `due_date`.
+
+    The worklist is filled once per day with a single INSERT ... SELECT and then
+    consumed by the charge, retry and kick stages, which claim rows with
+    SELECT ... FOR UPDATE SKIP LOCKED so several workers can share the list.
+    """
+    class Stage(models.TextChoices):
+        CHARGE = "charge", "Charge"
+        RETRY = "retry", "Retry"
+        KICK = "kick", "Kick"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    class Outcome(models.TextChoices):
+        NONE = "", "-"
+        RENEWED = "renewed", "Renewed"
+        KICKED = "kicked", "Kicked"
+        SKIPPED = "skipped", "Skipped"
+
+    due_date = models.DateField()
+    user = models.ForeignKey('users.User', on_delete=models.CASCADE, related_name='renewal_work_items')
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='renewal_work_items')
+    stage = models.CharField(max_length=10, choices=Stage.choices, default=Stage.CHARGE)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    outcome = models.CharField(max_length=10, choices=Outcome.choices, default=Outcome.NONE, blank=True)
+    reason = models.CharField(max_length=30, blank=True, default="")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.user_id} - {self.due_date} - {self.stage}/{self.status}"
+
+    class Meta:
+        unique_together = ('due_date', 'user')
+        indexes = [
+            models.Index(fields=['due_date', 'stage', 'status'], name='renewal_stage_status_idx'),
+        ]
+
+
+class OutboxMessage(TimestampedModel):
+    """
+    Telegram side effect of a payment, written in the same transaction as the
+    subscription change and delivered afterwards by `order.outbox.OutboxDispatcher`.
+    `key` makes the write idempotent: one message per kind and order.
+    """
+    class Kind(models.TextChoices):
+        SUBSCRIPTION_PAID = "subscription_paid", "Subscription paid (invite link)"
+        SUBSCRIPTION_RENEWED = "subscription_renewed", "Subscription renewed"
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        SENT = "sent", "Sent"
+        FAILED = "failed", "Failed"
+
+    key = models.CharField(max_length=100, unique=True)
+    kind = models.CharField(max_length=30, choices=Kind.choices)
+    user_id = models.BigIntegerField()
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField()
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default="")
+
+    def __str__(self):
+        return f"{self.kind} - {self.user_id} - {self.status}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_status_available_idx'),
+        ]
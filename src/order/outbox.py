@@ -0,0 +1,195 @@
+"""
+Delivery of the transactional outbox (`OutboxMessage`).
+
+Payment paths only write an outbox row next to the subscription change and return.
+`OutboxDispatcher` runs as a supervised background job of the web process: it
+claims due rows in batches, sends them concurrently, and retries failures with
+exponential backoff. It is woken right after each commit and polls every
+OUTBOX_POLL_SECONDS for rows written by other processes.
+
+Delivery is at-least-once: a message is marked sent right after Telegram
+accepted it, and only a crash in between sends it twice. Anything a sender
+creates before the message itself (an invite link) is saved on the row, so
+retries reuse it.
+"""
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from bot.client import get_bot
+from core.jobs import supervisor
+from core.metrics import REGISTRY
+from .models import OutboxMessage, PrivateChannel
+from .services import OutboxService
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MESSAGES = REGISTRY.counter(
+    'outbox_messages_total', "Outbox delivery attempts by outcome", ('kind', 'status'),
+)
+OUTBOX_DELIVERY_LAG = REGISTRY.histogram(
+    'outbox_delivery_lag_seconds', "Time from the payment commit to the delivered message", ('kind',),
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 3600),
+)
+
+# Invite links stay valid for an hour; a retry after that creates a new one
+INVITE_LINK_SECONDS = 3600
+
+SENDERS = {}
+
+
+def sender(kind: str):
+    def decorator(func):
+        SENDERS[kind] = func
+        return func
+    return decorator
+
+
+@sender(OutboxMessage.Kind.SUBSCRIPTION_PAID)
+async def send_subscription_paid(bot: Bot, message: OutboxMessage) -> None:
+    """Congratulate the user and send a one-time invite link to the course's private channel"""
+    from bot.functions import get_main_menu_button
+
+    payload = message.payload
+    if not payload.get('invite_link') or payload.get('invite_expires_at', 0) < time.time() + 60:
+        channel = await PrivateChannel.objects.filter(course_id=payload['course_id']).afirst()
+        if not channel:
+            logger.error(f"No private channel for course {payload['course_id']}, outbox message {message.id}")
+            await bot.send_message(
+                message.user_id,
+                "✅ To'lovingiz qabul qilindi!\n\n"
+                "Kanal havolasini olish uchun @yolda_korishamiz_support ga murojaat qiling."
+            )
+            return
+
+        expire_date = int(time.time() + INVITE_LINK_SECONDS)
+        invite_link = await bot.create_chat_invite_link(
+            chat_id=channel.private_channel_id,
+            name=f"User_{message.user_id}",
+            member_limit=1,
+            creates_join_request=False,
+            expire_date=expire_date
+        )
+        payload.update(invite_link=invite_link.invite_link, invite_expires_at=expire_date)
+        await sync_to_async(OutboxService.save_payload)(message)
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(
+                text="Yopiq Kanal yoki guruhga ulanish",
+                url=payload['invite_link']
+            )
+        ],
+        [
+            InlineKeyboardButton(
+                text="Savol berish",
+                url='https://t.me/yolda_korishamiz_support'
+            )
+        ],
+        [get_main_menu_button()]
+    ])
+
+    await bot.send_message(
+        message.user_id,
+        "✅ *Tabriklaymiz!*\n\n"
+        f"Sizning {payload.get('course_name') or ''} to'lovingiz muvaffaqiyatli qabul qilindi — endi yopiq kanal yoki guruh siz uchun ochiq!\n\n"
+        "👉 Avvalo pastdagi havolani bosib kanalga yoki guruhga o'ting.\n"
+        "🔔 So'ngra kanalda yoki guruhda *\"Подписаться\"* tugmasini bosib, a'zo bo'ling.\n\n"
+        "⚡️ *Eslatma:* tugma faqat 1 soat davomida faol!\n"
+        "🔁 Agar havola ishlamasa, birozdan so'ng yana urinib ko'ring.\n\n"
+        "👇 Pastdagi *\"Yopiq kanal yoki guruhga o'tish\"* tugmasini bosing va yangi bosqichni boshlang!",
+        parse_mode="Markdown",
+        reply_markup=keyboard
+    )
+
+
+@sender(OutboxMessage.Kind.SUBSCRIPTION_RENEWED)
+async def send_subscription_renewed(bot: Bot, message: OutboxMessage) -> None:
+    await bot.send_message(message.user_id, "Kartadan pul yechib olindi. Obuna uzaytirildi.")
+
+
+class OutboxDispatcher:
+    def __init__(self):
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._stopping = False
+
+    def wake(self) -> None:
+        """Deliver now; safe to call from any thread (on_commit of a sync view)"""
+        loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    def stop(self) -> None:
+        """Finish the current batch and return from `run()`"""
+        self._stopping = True
+        self.wake()
+
+    async def run(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        try:
+            while not self._stopping:
+                self._wakeup.clear()
+                try:
+                    await self.drain()
+                except Exception as e:
+                    logger.error(f"Outbox drain failed: {e}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._loop = self._wakeup = None
+
+    async def drain(self) -> int:
+        """Deliver every due message, returns how many were attempted"""
+        bot = get_bot()
+        total = 0
+        while not self._stopping:
+            messages = await sync_to_async(OutboxService.claim)()
+            if not messages:
+                break
+            await asyncio.gather(*(self.deliver(bot, message) for message in messages))
+            total += len(messages)
+        return total
+
+    @staticmethod
+    async def deliver(bot: Bot, message: OutboxMessage) -> None:
+        try:
+            await SENDERS[message.kind](bot, message)
+        except TelegramForbiddenError as e:
+            # Blocked by the user: retrying can't help
+            status = 'blocked'
+            await sync_to_async(OutboxService.fail)(message, str(e))
+        except Exception as e:
+            status = 'error'
+            logger.warning(f"Outbox message {message.id} ({message.kind}) attempt {message.attempts} failed: {e}")
+            await sync_to_async(OutboxService.retry)(message, f"{type(e).__name__}: {e}")
+        else:
+            status = 'sent'
+            await sync_to_async(OutboxService.mark_sent)(message)
+            OUTBOX_DELIVERY_LAG.observe((timezone.now() - message.created_at).total_seconds(), kind=message.kind)
+        OUTBOX_MESSAGES.inc(kind=message.kind, status=status)
+
+
+outbox_dispatcher = OutboxDispatcher()
+
+
+@supervisor.kind('outbox', max_queued=0, on_shutdown='drain')
+async def outbox_job(job):
+    job.on_stop(outbox_dispatcher.stop)
+    await outbox_dispatcher.run()
+
+
+def start_dispatcher() -> None:
+    if settings.OUTBOX_DISPATCHER_ENABLED:
+        supervisor.submit('outbox')
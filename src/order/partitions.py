@@ -0,0 +1,150 @@
+"""
+Monthly range partitions of the Transaction table (see migration 0010).
+
+Partitions are named `<table>_pYYYY_MM` and cover one calendar month in UTC.
+Rows that arrive before their partition exists land in `<table>_default` and
+are moved when the partition is created.
+"""
+import gzip
+import logging
+import re
+from datetime import date, datetime, timezone as dt_timezone
+from pathlib import Path
+
+from django.db import connection, transaction
+
+from order.models import Transaction
+
+logger = logging.getLogger(__name__)
+
+PARENT_TABLE = Transaction._meta.db_table
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+PARTITION_NAME_RE = re.compile(rf"^{PARENT_TABLE}_p(\d{{4}})_(\d{{2}})$")
+
+
+def add_months(month: date, months: int) -> date:
+    year, month_index = divmod(month.month - 1 + months, 12)
+    return date(month.year + year, month_index + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT_TABLE}_p{month:%Y_%m}"
+
+
+def month_bounds(month: date) -> tuple[datetime, datetime]:
+    lower = datetime(month.year, month.month, 1, tzinfo=dt_timezone.utc)
+    upper_month = add_months(month, 1)
+    upper = datetime(upper_month.year, upper_month.month, 1, tzinfo=dt_timezone.utc)
+    return lower, upper
+
+
+def is_partitioned() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE relname = %s", [PARENT_TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions() -> dict[str, date]:
+    """
+    Monthly partitions currently attached to the parent table, name -> month.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+              FROM pg_inherits
+              JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+              JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+             WHERE parent.relname = %s
+            """,
+            [PARENT_TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME_RE.match(name)
+        if match:
+            partitions[name] = date(int(match.group(1)), int(match.group(2)), 1)
+    return dict(sorted(partitions.items(), key=lambda item: item[1]))
+
+
+def create_partition(month: date) -> bool:
+    """
+    Create and attach the partition for `month`, moving matching rows out of the default partition.
+    Returns False if the partition already exists.
+    """
+    month = month.replace(day=1)
+    name = partition_name(month)
+    if name in list_partitions():
+        return False
+
+    lower, upper = month_bounds(month)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE "{name}" (LIKE "{PARENT_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        )
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE created_at >= %s AND created_at < %s RETURNING *) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [lower, upper],
+        )
+        cursor.execute(
+            f'ALTER TABLE "{PARENT_TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+            [lower, upper],
+        )
+    logger.info(f"Created partition {name}")
+    return True
+
+
+def ensure_partitions(months_ahead: int, today: date = None) -> list[str]:
+    """
+    Make sure partitions exist from the current month up to `months_ahead` months ahead.
+    """
+    current = (today or date.today()).replace(day=1)
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if create_partition(month):
+            created.append(partition_name(month))
+    return created
+
+
+def detach_partition(name: str) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{PARENT_TABLE}" DETACH PARTITION "{name}"')
+    logger.info(f"Detached partition {name}")
+
+
+def archive_table(name: str, directory: Path) -> Path:
+    """
+    Dump a detached partition to `<directory>/<name>.csv.gz` and drop it.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{name}.csv.gz"
+    copy_sql = f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER true)'
+
+    with connection.cursor() as cursor, gzip.open(path, 'wb') as archive:
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(copy_sql, archive)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(copy_sql) as copy:
+                for chunk in copy:
+                    archive.write(chunk)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE "{name}"')
+    logger.info(f"Archived partition {name} to {path}")
+    return path
+
+
+def expired_partitions(retain_months: int, today: date = None) -> list[str]:
+    """
+    Partitions whose whole month is older than `retain_months` months.
+    """
+    oldest_kept = add_months((today or date.today()).replace(day=1), -retain_months)
+    return [name for name, month in list_partitions().items() if month < oldest_kept]
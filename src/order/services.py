@@ -1,44 +1,191 @@
 from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DateField, F, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Greatest, Mod
 from django.utils import timezone
+
 from core.utils.constants import CONSTANTS
-from .models import UserCourseSubscription, Transaction, Order
+from users.models import User
+from users.snapshot import SnapshotCache
+from .models import UserCourseSubscription, Transaction, Order, Course, RenewalWorkItem, OutboxMessage
 
 
-class SubscriptionService:
-    def __init__(self, transaction: Transaction):
-        self.transaction = transaction
+class SubscriptionLedger:
+    """
+    The only place that extends a user's subscription after a successful payment.
 
-    def create_subscription(self):
-        order = self.get_order()
-        order.status = CONSTANTS.PaymentStatus.SUCCESS
-        order.save()
+    The new end date is computed by the database in one UPDATE
+    (GREATEST(end_date, today) + period), so concurrent webhook and nightly
+    renewals cannot overwrite each other and unrelated User columns are never
+    rewritten. The order row is locked so a duplicated callback extends once.
+
+    `notification` (an `OutboxMessage.Kind`) is queued in the same transaction, so
+    the user is told exactly when the extension commits.
+    """
+
+    @classmethod
+    def extend(cls, order: Order, *, is_auto_subscribe: bool, payment_id: int = None,
+               notification: str = None) -> date:
+        today = timezone.localdate()
+        period = timedelta(days=order.course.period or 0)
+        today_value = Value(today, output_field=DateField())
+
+        with transaction.atomic():
+            locked_order = Order.objects.select_for_update().get(pk=order.pk)
+            already_applied = (
+                locked_order.status == CONSTANTS.PaymentStatus.SUCCESS
+                and UserCourseSubscription.objects.filter(order_id=order.pk).exists()
+            )
+            if already_applied:
+                return User.objects.values_list('subscription_end_date', flat=True).get(telegram_id=order.user_id)
+
+            order.status = CONSTANTS.PaymentStatus.SUCCESS
+            update_fields = ['status', 'updated_at']
+            if payment_id is not None:
+                order.payment_id = payment_id
+                update_fields.append('payment_id')
+            order.save(update_fields=update_fields)
+
+            User.objects.filter(telegram_id=order.user_id).update(
+                is_subscribed=True,
+                is_auto_subscribe=is_auto_subscribe,
+                subscription_start_date=Case(
+                    When(is_subscribed=False, then=today_value),
+                    default=Coalesce(F('subscription_start_date'), today_value),
+                    output_field=DateField(),
+                ),
+                subscription_end_date=Cast(
+                    Greatest(Coalesce(F('subscription_end_date'), today_value), today_value) + period,
+                    output_field=DateField(),
+                ),
+                updated_at=timezone.now(),
+            )
+            SnapshotCache.invalidate(order.user_id)
+            end_date = User.objects.values_list('subscription_end_date', flat=True).get(telegram_id=order.user_id)
+
+            UserCourseSubscription.objects.get_or_create(
+                order=order,
+                defaults={
+                    'user_id': order.user_id,
+                    'course_id': order.course_id,
+                    'start_date': end_date - period,
+                    'end_date': end_date,
+                },
+            )
+
+            if notification:
+                OutboxService.enqueue(
+                    notification, order.user_id, key=f'{notification}:{order.pk}',
+                    order_id=order.pk, course_id=order.course_id, course_name=order.course.name,
+                    end_date=end_date.isoformat(),
+                )
+
+        return end_date
+
+    @classmethod
+    async def aextend(cls, order: Order, *, is_auto_subscribe: bool, payment_id: int = None,
+                      notification: str = None) -> date:
+        return await sync_to_async(cls.extend)(
+            order, is_auto_subscribe=is_auto_subscribe, payment_id=payment_id, notification=notification
+        )
+
+
+class OutboxService:
+    """
+    Transactional outbox of Telegram side effects.
+
+    `enqueue` is called inside the transaction that makes the change; the
+    dispatcher claims due rows with FOR UPDATE SKIP LOCKED (rows left in
+    `processing` past the lease are claimed again) and reports each outcome.
+    """
+
+    @staticmethod
+    def enqueue(kind: str, user_id: int, key: str, **payload) -> None:
+        """Queue a message; a second enqueue with the same key is ignored"""
+        OutboxMessage.objects.get_or_create(
+            key=key,
+            defaults={'kind': kind, 'user_id': user_id, 'payload': payload, 'available_at': timezone.now()},
+        )
+        # Deliver right after the commit instead of at the next poll
+        from .outbox import outbox_dispatcher
+        transaction.on_commit(outbox_dispatcher.wake)
+
+    @staticmethod
+    def claim(limit: int = None) -> list[OutboxMessage]:
+        limit = limit or settings.OUTBOX_BATCH_SIZE
+        now = timezone.now()
+        stale_before = now - timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+
+        with transaction.atomic():
+            ids = list(
+                OutboxMessage.objects
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=OutboxMessage.Status.PENDING, available_at__lte=now) |
+                    Q(status=OutboxMessage.Status.PROCESSING, claimed_at__lt=stale_before)
+                )
+                .order_by('available_at')
+                .values_list('id', flat=True)[:limit]
+            )
+            if not ids:
+                return []
+
+            OutboxMessage.objects.filter(id__in=ids).update(
+                status=OutboxMessage.Status.PROCESSING,
+                claimed_at=now,
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
 
-        UserCourseSubscription.objects.create(
-            user=self.transaction.user,
-            order=order,
-            course=order.course,
-            start_date=date.today(),
-            end_date=date.today() + timedelta(days=order.course.period),
+        return list(OutboxMessage.objects.filter(id__in=ids).order_by('available_at'))
+
+    @staticmethod
+    def save_payload(message: OutboxMessage) -> None:
+        """Keep what a partial delivery produced (an invite link) for the retry"""
+        OutboxMessage.objects.filter(id=message.id).update(payload=message.payload, updated_at=timezone.now())
+
+    @staticmethod
+    def mark_sent(message: OutboxMessage) -> None:
+        now = timezone.now()
+        OutboxMessage.objects.filter(id=message.id).update(
+            status=OutboxMessage.Status.SENT, sent_at=now, last_error="", updated_at=now,
         )
-        user = self.transaction.user
 
-        if not user.is_subscribed:
-            user.subscription_start_date = timezone.now().date()
-            user.is_subscribed = True
+    @staticmethod
+    def retry(message: OutboxMessage, error: str) -> None:
+        """Back off exponentially, give up after OUTBOX_MAX_ATTEMPTS"""
+        now = timezone.now()
+        if message.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            status, available_at = OutboxMessage.Status.FAILED, message.available_at
+        else:
+            delay = min(settings.OUTBOX_RETRY_SECONDS * 2 ** (message.attempts - 1), 3600)
+            status, available_at = OutboxMessage.Status.PENDING, now + timedelta(seconds=delay)
+        OutboxMessage.objects.filter(id=message.id).update(
+            status=status, available_at=available_at, last_error=error[:2000], updated_at=now,
+        )
 
-        user.is_auto_subscribe = False
+    @staticmethod
+    def fail(message: OutboxMessage, error: str) -> None:
+        """Permanent failure (the user blocked the bot), no retry"""
+        OutboxMessage.objects.filter(id=message.id).update(
+            status=OutboxMessage.Status.FAILED, last_error=error[:2000], updated_at=timezone.now(),
+        )
 
-        today = timezone.now().date()
-        end_date = user.subscription_end_date or today
 
-        if end_date < today:
-            end_date = today
+class SubscriptionService:
+    def __init__(self, transaction: Transaction):
+        self.transaction = transaction
 
-        user.subscription_end_date = end_date + timedelta(days=order.course.period)
-        user.save()
+    def create_subscription(self):
+        SubscriptionLedger.extend(
+            self.get_order(), is_auto_subscribe=False, notification=OutboxMessage.Kind.SUBSCRIPTION_PAID
+        )
 
     def get_order(self):
-        return Order.objects.get(id=self.transaction.order_id)
+        return Order.objects.select_related('course').get(id=self.transaction.order_id)
 
     def cancel_subscription(self):
         user_subscription = UserCourseSubscription.objects.filter(order_id=self.transaction.order_id).first()
@@ -54,3 +201,127 @@ class SubscriptionService:
         self.transaction.state = Transaction.CANCELED
         self.transaction.cancel_time = timezone.now()
         self.transaction.save()
+
+
+class RenewalWorklistService:
+    """
+    Daily due-renewals worklist.
+
+    `build` snapshots "who is due" once with a set-based INSERT ... SELECT,
+    `claim` hands out batches of rows with FOR UPDATE SKIP LOCKED so any number
+    of workers can consume the same stage without double-processing.
+    """
+
+    @staticmethod
+    def build(due_date: date = None) -> int:
+        """
+        Insert a work item for every user due on `due_date`.
+        Idempotent: rows that already exist for the day are left untouched.
+        """
+        due_date = due_date or timezone.localdate()
+        now = timezone.now()
+
+        sql = f"""
+            INSERT INTO {RenewalWorkItem._meta.db_table}
+                (created_at, updated_at, due_date, user_id, course_id,
+                 stage, status, outcome, reason, attempts, last_error)
+            SELECT %(now)s, %(now)s, %(due_date)s, u.telegram_id,
+                   COALESCE(
+                       (SELECT o.course_id FROM {Order._meta.db_table} o
+                         WHERE o.user_id = u.telegram_id AND o.status = %(success)s
+                         ORDER BY o.created_at DESC LIMIT 1),
+                       (SELECT c.id FROM {Course._meta.db_table} c ORDER BY c.id LIMIT 1)
+                   ),
+                   %(stage)s, %(status)s, '', '', 0, ''
+              FROM {User._meta.db_table} u
+             WHERE u.is_subscribed
+               AND NOT u.is_foreigner
+               AND u.subscription_end_date <= %(due_date)s
+            ON CONFLICT (due_date, user_id) DO NOTHING
+        """
+        params = {
+            "now": now,
+            "due_date": due_date,
+            "success": CONSTANTS.PaymentStatus.SUCCESS,
+            "stage": RenewalWorkItem.Stage.CHARGE,
+            "status": RenewalWorkItem.Status.PENDING,
+        }
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    @staticmethod
+    def claim(stage: str, due_date: date = None, limit: int = None,
+              shard: int = 0, shards: int = 1) -> list[RenewalWorkItem]:
+        """
+        Claim up to `limit` pending items of `stage`.
+        Items left in `processing` longer than the lease are claimed again.
+        With `shards` > 1 only users with telegram_id % shards == shard are claimed,
+        so every user stays on one shard for all of its stages.
+        """
+        due_date = due_date or timezone.localdate()
+        limit = limit or settings.RENEWAL_CLAIM_BATCH_SIZE
+        now = timezone.now()
+        stale_before = now - timedelta(minutes=settings.RENEWAL_CLAIM_LEASE_MINUTES)
+
+        queryset = RenewalWorkItem.objects.filter(due_date=due_date, stage=stage)
+        if shards > 1:
+            queryset = queryset.annotate(shard=Mod('user_id', shards)).filter(shard=shard)
+
+        with transaction.atomic():
+            ids = list(
+                queryset
+                .select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=RenewalWorkItem.Status.PENDING) |
+                    Q(status=RenewalWorkItem.Status.PROCESSING, claimed_at__lt=stale_before)
+                )
+                .order_by('id')
+                .values_list('id', flat=True)[:limit]
+            )
+            if not ids:
+                return []
+
+            RenewalWorkItem.objects.filter(id__in=ids).update(
+                status=RenewalWorkItem.Status.PROCESSING,
+                claimed_at=now,
+                attempts=F('attempts') + 1,
+                updated_at=now,
+            )
+
+        return list(
+            RenewalWorkItem.objects.filter(id__in=ids).select_related('user', 'course').order_by('id')
+        )
+
+    @staticmethod
+    def advance(item: RenewalWorkItem, stage: str, reason: str = "") -> None:
+        """
+        Hand the item over to the next stage.
+        """
+        RenewalWorkItem.objects.filter(id=item.id).update(
+            stage=stage,
+            status=RenewalWorkItem.Status.PENDING,
+            reason=reason,
+            updated_at=timezone.now(),
+        )
+
+    @staticmethod
+    def complete(item: RenewalWorkItem, outcome: str, reason: str = "") -> None:
+        now = timezone.now()
+        RenewalWorkItem.objects.filter(id=item.id).update(
+            status=RenewalWorkItem.Status.DONE,
+            outcome=outcome,
+            reason=reason or item.reason,
+            processed_at=now,
+            updated_at=now,
+        )
+
+    @staticmethod
+    def fail(item: RenewalWorkItem, error: str) -> None:
+        now = timezone.now()
+        RenewalWorkItem.objects.filter(id=item.id).update(
+            status=RenewalWorkItem.Status.FAILED,
+            last_error=error[:2000],
+            processed_at=now,
+            updated_at=now,
+        )
@@ -0,0 +1,91 @@
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.utils.constants import CONSTANTS
+from order.models import Order, OutboxMessage, Transaction
+from users.models import UserCard
+
+logger = logging.getLogger(__name__)
+
+
+def batched_delete(queryset, batch_size=None) -> int:
+    """
+    Delete the rows of `queryset` in primary-key batches, so every DELETE stays short
+    and does not hold locks on a hot table for long.
+    """
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    model = queryset.model
+    total = 0
+
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        model.objects.filter(pk__in=ids).delete()
+        total += len(ids)
+
+    return total
+
+
+def get_retention_querysets(now=None) -> dict:
+    now = now or timezone.now()
+    has_transaction = Exists(Transaction.objects.filter(order_id=OuterRef('pk')))
+
+    return {
+        # Abandoned payment flows that never reached Click
+        'stale_orders': Order.objects.filter(
+            status__in=[CONSTANTS.PaymentStatus.PENDING, CONSTANTS.PaymentStatus.DRAFT],
+            created_at__lt=now - timedelta(days=settings.RETENTION_PENDING_ORDER_DAYS),
+        ).filter(~has_transaction),
+        'failed_orders': Order.objects.filter(
+            status=CONSTANTS.PaymentStatus.FAILED,
+            created_at__lt=now - timedelta(days=settings.RETENTION_FAILED_ORDER_DAYS),
+        ).filter(~has_transaction),
+        # Card tokens whose SMS confirmation never happened
+        'unconfirmed_cards': UserCard.objects.filter(
+            is_confirmed=False,
+            created_at__lt=now - timedelta(hours=settings.RETENTION_UNCONFIRMED_CARD_HOURS),
+        ),
+        # Successful and cancelled-after-payment transactions are kept for reconciliation
+        'unfinished_transactions': Transaction.objects.filter(
+            state__in=[Transaction.CREATED, Transaction.INITIATING, Transaction.CANCELED_DURING_INIT],
+            created_at__lt=now - timedelta(days=settings.RETENTION_TRANSACTION_DAYS),
+        ),
+        # Delivered outbox messages; failed ones are kept for inspection
+        'sent_outbox_messages': OutboxMessage.objects.filter(
+            status=OutboxMessage.Status.SENT,
+            created_at__lt=now - timedelta(days=settings.RETENTION_OUTBOX_DAYS),
+        ),
+    }
+
+
+@shared_task
+def sweep_stale_records():
+    """Celery task: Delete stale pending orders, unconfirmed cards, unfinished transactions and sent outbox rows"""
+    result = {}
+    for name, queryset in get_retention_querysets().items():
+        try:
+            result[name] = batched_delete(queryset)
+        except Exception as e:
+            logger.error(f"Retention sweep failed for {name}: {e}")
+            result[name] = None
+
+    logger.info(f"Retention sweep finished: {result}")
+    return result
+
+
+@shared_task
+def ensure_transaction_partitions():
+    """Celery task: Create the upcoming monthly Transaction partitions"""
+    from order import partitions
+
+    if not partitions.is_partitioned():
+        return []
+    created = partitions.ensure_partitions(settings.TRANSACTION_PARTITION_MONTHS_AHEAD)
+    logger.info(f"Transaction partitions created: {created}")
+    return created
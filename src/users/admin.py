@@ -1,11 +1,13 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
+
+from core.replica import ReplicaChangelistMixin
 from .models import User
 
 
 @admin.register(User)
-class UserAdmin(BaseUserAdmin):
+class UserAdmin(ReplicaChangelistMixin, BaseUserAdmin):
     model = User
     list_display = (
         'telegram_id', 'first_name', 'last_name', 'username',
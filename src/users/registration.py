@@ -0,0 +1,155 @@
+"""
+Write-behind registration buffer for /start bursts.
+
+`handle_user_phone` queues the new user in a Redis hash instead of inserting it;
+`RegistrationFlusher` inserts the queued users with one
+bulk_create(ignore_conflicts=True) every REGISTRATION_FLUSH_INTERVAL_MS, or as
+soon as REGISTRATION_FLUSH_SIZE users are waiting. Until then
+`RegistrationBuffer.get()` serves the queued row, so the next handlers already see
+the user. Entries are removed only after they are committed, so a crashed flush is
+retried by the next one. A batch rejected for its data is retried row by row and the
+rows that still fail are logged and dropped, so one bad row cannot block the buffer.
+"""
+import asyncio
+import json
+import logging
+
+import redis
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from core.redis import get_redis
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+# Queue the user and return the queue length in one round trip
+ADD_SCRIPT = """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return redis.call('HLEN', KEYS[1])
+"""
+
+
+class RegistrationBuffer:
+    pending_key = 'registrations:pending'
+    lock_key = 'registrations:flush-lock'
+
+    @staticmethod
+    def _build(telegram_id, fields: dict) -> User:
+        return User(telegram_id=int(telegram_id), **fields)
+
+    @classmethod
+    async def add(cls, telegram_id: int, **fields) -> User:
+        """Queue a new user; falls back to a direct insert when Redis is unavailable"""
+        try:
+            add = get_redis().register_script(ADD_SCRIPT)
+            pending = await add(keys=[cls.pending_key], args=[telegram_id, json.dumps(fields)])
+        except redis.RedisError as e:
+            logger.warning(f"Registration buffer unavailable, inserting {telegram_id} directly: {e}")
+            user, _ = await User.objects.aget_or_create(telegram_id=telegram_id, defaults=fields)
+            return user
+
+        if pending >= settings.REGISTRATION_FLUSH_SIZE:
+            registration_flusher.wake()
+        return cls._build(telegram_id, fields)
+
+    @classmethod
+    async def get(cls, telegram_id: int) -> User | None:
+        """The queued, not yet inserted user"""
+        try:
+            raw = await get_redis().hget(cls.pending_key, str(telegram_id))
+        except redis.RedisError:
+            return None
+        return cls._build(telegram_id, json.loads(raw)) if raw else None
+
+    @classmethod
+    async def flush(cls) -> int:
+        """Insert every queued user, returns the number of queued users handled"""
+        client = get_redis()
+        # One flusher at a time across processes; a stale lock just expires
+        lock_ms = max(settings.REGISTRATION_FLUSH_INTERVAL_MS * 10, 1000)
+        if not await client.set(cls.lock_key, 1, nx=True, px=lock_ms):
+            return 0
+        try:
+            pending = await client.hgetall(cls.pending_key)
+            if not pending:
+                return 0
+            users = []
+            for telegram_id, raw in pending.items():
+                try:
+                    users.append(cls._build(telegram_id.decode(), json.loads(raw)))
+                except (TypeError, ValueError) as e:
+                    logger.error(f"Dropping malformed queued registration {telegram_id!r}: {e}")
+            # Users that already exist (or registered through another path) are skipped
+            try:
+                await User.objects.abulk_create(
+                    users, batch_size=settings.REGISTRATION_FLUSH_SIZE, ignore_conflicts=True
+                )
+            except (DataError, IntegrityError) as e:
+                logger.warning(f"Registration batch of {len(users)} rejected, inserting one by one: {e}")
+                await cls._insert_each(users)
+            await client.hdel(cls.pending_key, *pending)
+            return len(pending)
+        finally:
+            await client.delete(cls.lock_key)
+
+    @staticmethod
+    async def _insert_each(users: list[User]) -> None:
+        # Connection errors still propagate: the batch stays queued for the next flush
+        for user in users:
+            try:
+                await User.objects.abulk_create([user], ignore_conflicts=True)
+            except (DataError, IntegrityError) as e:
+                logger.error(f"Dropping queued registration of {user.telegram_id}: {e}")
+
+
+class RegistrationFlusher:
+    """Background task of the bot process that drains the buffer"""
+
+    def __init__(self):
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stop the loop and flush whatever is left"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = self._wakeup = None
+        await self._flush()
+
+    async def _run(self) -> None:
+        interval = settings.REGISTRATION_FLUSH_INTERVAL_MS / 1000
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self._flush()
+
+    @staticmethod
+    async def _flush() -> None:
+        try:
+            flushed = await RegistrationBuffer.flush()
+        except Exception as e:
+            logger.error(f"Registration flush failed: {e}")
+        else:
+            if flushed:
+                logger.debug(f"Registered {flushed} users")
+
+
+registration_flusher = RegistrationFlusher()
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import User
+from .snapshot import SnapshotCache
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_subscription_snapshot(sender, instance: User, **kwargs):
+    SnapshotCache.invalidate(instance.telegram_id)
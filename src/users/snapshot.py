@@ -0,0 +1,108 @@
+"""
+Per-user subscription snapshot for /check and "check membership".
+
+The snapshot holds what the status screen needs: end date, auto-renewal flag,
+channel membership and the current invite link. It lives in Redis, so a repeated
+/check costs one GET instead of a user query, a channel query, getChatMember and
+often createChatInviteLink.
+
+It is dropped whenever its inputs change: User saves (post_save/post_delete),
+SubscriptionLedger extensions and kicks (on commit), and chat_member updates of
+the private channel. Entries also expire after SUBSCRIPTION_SNAPSHOT_TTL, and
+before the invite link they carry does.
+"""
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import date
+
+import redis
+from django.conf import settings
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY = 'subscription:snapshot:{}'
+
+
+@dataclass
+class SubscriptionSnapshot:
+    telegram_id: int
+    is_subscribed: bool
+    is_auto_subscribe: bool
+    subscription_end_date: date | None
+    # None when there is no private channel or membership could not be checked
+    is_member: bool | None = None
+    invite_link: str | None = None
+    invite_expires_at: int | None = None
+
+    @classmethod
+    def from_user(cls, user) -> 'SubscriptionSnapshot':
+        return cls(
+            telegram_id=user.telegram_id,
+            is_subscribed=user.is_subscribed,
+            is_auto_subscribe=user.is_auto_subscribe,
+            subscription_end_date=user.subscription_end_date,
+        )
+
+    def ttl(self) -> int:
+        ttl = settings.SUBSCRIPTION_SNAPSHOT_TTL
+        if self.invite_expires_at:
+            # Never serve a link that is about to expire
+            ttl = min(ttl, self.invite_expires_at - int(time.time()) - 60)
+        return ttl
+
+    def dumps(self) -> str:
+        data = asdict(self)
+        data['subscription_end_date'] = self.subscription_end_date.isoformat() if self.subscription_end_date else None
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, raw) -> 'SubscriptionSnapshot':
+        data = json.loads(raw)
+        if data['subscription_end_date']:
+            data['subscription_end_date'] = date.fromisoformat(data['subscription_end_date'])
+        return cls(**data)
+
+
+class SnapshotCache:
+    @staticmethod
+    async def get(telegram_id: int) -> SubscriptionSnapshot | None:
+        try:
+            raw = await get_redis().get(KEY.format(telegram_id))
+        except redis.RedisError as e:
+            logger.warning(f"Subscription snapshot unavailable: {e}")
+            return None
+        return SubscriptionSnapshot.loads(raw) if raw else None
+
+    @staticmethod
+    async def set(snapshot: SubscriptionSnapshot) -> None:
+        ttl = snapshot.ttl()
+        if ttl <= 0:
+            return
+        try:
+            await get_redis().set(KEY.format(snapshot.telegram_id), snapshot.dumps(), ex=ttl)
+        except redis.RedisError as e:
+            logger.warning(f"Could not store the subscription snapshot: {e}")
+
+    @staticmethod
+    async def ainvalidate(telegram_id: int) -> None:
+        try:
+            await get_redis().delete(KEY.format(telegram_id))
+        except redis.RedisError as e:
+            logger.warning(f"Could not invalidate the subscription snapshot of {telegram_id}: {e}")
+
+    @staticmethod
+    def invalidate(telegram_id: int) -> None:
+        """Sync variant; inside a transaction the snapshot is dropped once it commits"""
+        def delete():
+            try:
+                get_redis_connection('default').delete(KEY.format(telegram_id))
+            except redis.RedisError as e:
+                logger.warning(f"Could not invalidate the subscription snapshot of {telegram_id}: {e}")
+
+        transaction.on_commit(delete)